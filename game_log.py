@@ -0,0 +1,255 @@
+###############################################################################
+#  Columnar game log for season_sim. Every game is a row of (week, home id,  #
+#  away id, home score, away score) kept in typed arrays that grow as games  #
+#  are appended, rather than as one dictionary per game                       #
+###############################################################################
+
+import numpy as np
+
+COLUMNS = ('week', 'home', 'away', 'home_score', 'away_score')
+
+class GameLog:
+	'''
+	Append-only log of games. Columns are int32 arrays with spare capacity
+	that doubles when it runs out, so appending is amortized O(1).
+
+	Slicing by week is a binary search as long as games are logged in week
+	order (the normal case); slicing by team uses an index that is built on
+	first use and rebuilt only after more games have been logged.
+
+	A log can be built on top of a frozen base log (see branch()), which it
+	shares with any number of other logs. Only the games appended after it
+	are stored in the log itself
+	'''
+	def __init__(self, capacity=64, base=None):
+		self.size = 0
+		self._columns = {}
+
+		for column in COLUMNS:
+			self._columns[column] = np.zeros(max(capacity, 1), dtype=np.int32)
+
+		# True while weeks have been appended in non-decreasing order
+		self.week_ordered = True
+
+		# (order, starts) index of games by team, see team_games()
+		self._team_index = None
+
+		# Games 0 to _offset - 1 live in the base log, see branch()
+		self._base = base
+		self._offset = 0
+		self._joined = None
+
+		if base is not None:
+			self.size = self._offset = len(base)
+			self.week_ordered = base.week_ordered
+
+	@classmethod
+	def from_columns(cls, columns):
+		# Builds a log around existing column arrays (e.g. memory-mapped from a
+		# save) without copying them. They are only copied if the log has to
+		# grow
+		log = cls.__new__(cls)
+		log._columns = {column: columns[column] for column in COLUMNS}
+		log.size = len(log._columns['week'])
+		log._team_index = None
+		log._base = None
+		log._offset = 0
+		log._joined = None
+
+		weeks = log._columns['week']
+		log.week_ordered = bool(np.all(weeks[1:] >= weeks[:-1]))
+
+		return log
+
+	def __len__(self):
+		return self.size
+
+	def __getitem__(self, game):
+		if game < 0:
+			game += self.size
+
+		if not 0 <= game < self.size:
+			raise IndexError('game %d out of range' % game)
+
+		if game < self._offset:
+			return self._base[game]
+
+		return tuple(int(self._columns[column][game - self._offset])
+			for column in COLUMNS)
+
+	def __iter__(self):
+		columns = [self.column(column).tolist() for column in COLUMNS]
+
+		return zip(*columns)
+
+	def __eq__(self, other):
+		if not isinstance(other, GameLog):
+			return NotImplemented
+
+		return len(self) == len(other) and all(
+			np.array_equal(self.column(column), other.column(column))
+			for column in COLUMNS)
+
+	def column(self, name):
+		# The logged rows of a column. This is a view, not a copy- except for
+		# a branch, where it is the base's rows and the branch's own joined
+		# (and kept until more games are logged)
+		if self._base is None:
+			return self._columns[name][:self.size]
+
+		if self._joined is None or self._joined[0] != self.size:
+			self._joined = (self.size, {})
+
+		joined = self._joined[1]
+
+		if name not in joined:
+			joined[name] = np.concatenate((self._base.column(name),
+				self._columns[name][:self.size - self._offset]))
+
+		return joined[name]
+
+	def frozen(self):
+		# A read-only copy of the log, for branch() to share between logs
+		columns = {}
+
+		for column in COLUMNS:
+			columns[column] = np.array(self.column(column))
+			columns[column].setflags(write=False)
+
+		return GameLog.from_columns(columns)
+
+	def branch(self, capacity=64):
+		# A new, empty-ended log whose first games are this (frozen) log's.
+		# The base is shared, not copied
+		return GameLog(capacity, base=self)
+
+	def reserve(self, capacity):
+		# Makes sure there is room for capacity games without reallocating
+		capacity -= self._offset
+
+		if capacity <= len(self._columns['week']):
+			return
+
+		capacity = max(capacity, 1)
+
+		own = self.size - self._offset
+
+		for column, values in self._columns.items():
+			grown = np.zeros(capacity, dtype=values.dtype)
+			grown[:own] = values[:own]
+			self._columns[column] = grown
+
+	def last_week(self):
+		# Week of the last game logged, or None for an empty log
+		if self.size == 0:
+			return None
+
+		if self.size == self._offset:
+			return self._base.last_week()
+
+		return int(self._columns['week'][self.size - self._offset - 1])
+
+	def append(self, week, home, away, home_score, away_score):
+		game = self.size - self._offset
+
+		# Capacity (and its doubling) only counts the log's own games
+		if game == len(self._columns['week']):
+			self.reserve(self._offset + max(2 * game, 1))
+
+		columns = self._columns
+		previous = columns['week'][game - 1] if game else self.last_week()
+
+		if previous is not None and week < previous:
+			self.week_ordered = False
+
+		columns['week'][game] = week
+		columns['home'][game] = home
+		columns['away'][game] = away
+		columns['home_score'][game] = home_score
+		columns['away_score'][game] = away_score
+
+		self.size += 1
+		self._team_index = None
+
+	def extend(self, week, home, away, home_score, away_score):
+		# Appends many games at once. Arguments are arrays (or scalars, which
+		# are broadcast- handy for a whole week of games)
+		home = np.asarray(home)
+		count = len(home)
+
+		if count == 0:
+			return
+
+		start = self.size - self._offset
+
+		self.reserve(self._offset + max(start + count, 2 * start))
+
+		end = start + count
+		weeks = np.broadcast_to(week, (count,))
+
+		if (self.size and weeks[0] < self.last_week()) \
+			or np.any(weeks[1:] < weeks[:-1]):
+			self.week_ordered = False
+
+		self._columns['week'][start:end] = weeks
+		self._columns['home'][start:end] = home
+		self._columns['away'][start:end] = away
+		self._columns['home_score'][start:end] = home_score
+		self._columns['away_score'][start:end] = away_score
+
+		self.size = self._offset + end
+		self._team_index = None
+
+	def select(self, games):
+		# Dictionary of column -> values for the given games (a slice or an
+		# array of game numbers)
+		return {column: self.column(column)[games] for column in COLUMNS}
+
+	def week_games(self, week):
+		# The games played in a week. Returns a slice when the log is in week
+		# order, otherwise an array of game numbers
+		weeks = self.column('week')
+
+		if self.week_ordered:
+			return slice(int(np.searchsorted(weeks, week, side='left')),
+				int(np.searchsorted(weeks, week, side='right')))
+
+		return np.flatnonzero(weeks == week)
+
+	def week(self, week):
+		# Column -> values for a week's games. These are views into the log
+		# when it is in week order
+		return self.select(self.week_games(week))
+
+	def team_games(self, team_id):
+		# Game numbers, in order, of every game a team played in
+		if self._team_index is None:
+			self._team_index = self.build_team_index()
+
+		order, starts = self._team_index
+
+		if not 0 <= team_id < len(starts) - 1:
+			return np.zeros(0, dtype=np.int64)
+
+		return order[starts[team_id]:starts[team_id + 1]]
+
+	def team(self, team_id):
+		# Column -> values for every game a team played in
+		return self.select(self.team_games(team_id))
+
+	def build_team_index(self):
+		# Groups game numbers by team, CSR style- the games of team t are
+		# order[starts[t]:starts[t + 1]]
+		home = self.column('home')
+		away = self.column('away')
+
+		teams = np.concatenate((home, away))
+		games = np.concatenate((np.arange(self.size), np.arange(self.size)))
+
+		order = np.lexsort((games, teams))
+		num_teams = int(teams.max()) + 1 if len(teams) else 0
+
+		starts = np.zeros(num_teams + 1, dtype=np.int64)
+		np.cumsum(np.bincount(teams, minlength=num_teams), out=starts[1:])
+
+		return (games[order], starts)
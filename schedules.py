@@ -0,0 +1,1057 @@
+###############################################################################
+#  Schedule types for season_sim. A schedule maps week numbers (from 1) to a  #
+#  tuple of (home, away) matchups, where teams are ids and 'BYE' marks a     #
+#  team sitting the week out                                                  #
+###############################################################################
+
+from collections.abc import Mapping
+
+import numpy as np
+
+import season_sim_errors as ss_err
+
+BYE = 'BYE'
+
+# How a bye is written in opponent index arrays
+BYE_INDEX = -1
+
+# Padding for unused matchup slots in array schedules
+EMPTY_SLOT = -2
+
+# How far up or down the table a Swiss pairing looks for a swap that avoids a
+# rematch, and the pair offsets tried first for every rematch at once
+SWISS_WINDOW = 64
+SWISS_OFFSETS = (1, -1, 2, -2, 3, -3, 4, -4)
+
+class RoundRobinSchedule(Mapping):
+	'''
+	A lazy round robin schedule. Rather than storing every week, any week's
+	pairings (or any team's opponent) are worked out with circle method
+	arithmetic, so it takes O(1) memory whatever the number of teams.
+
+	The pairings are the same as rotating the two rows described at
+	https://en.wikipedia.org/wiki/Round-robin_tournament#Scheduling_algorithm
+	Team 0 stays put in the top row and everyone else moves one step around a
+	ring each week- along the top row, then back along the bottom row. With an
+	odd number of teams a dummy BYE team is put at the end of the top row
+	'''
+	def __init__(self, num_teams):
+		self.num_teams = num_teams
+
+		# Number of matchups per week, counting the bye if there is one
+		self.half = (num_teams + 1) // 2
+
+		# Number of real teams starting in the top row
+		self.top_teams = num_teams // 2
+
+		# Number of teams moving around the ring- also the number of weeks
+		self.ring = 2 * self.half - 1 if num_teams > 1 else 0
+
+	def __len__(self):
+		return self.ring
+
+	def __iter__(self):
+		return iter(range(1, self.ring + 1))
+
+	def __contains__(self, week):
+		return isinstance(week, (int, np.integer)) and 1 <= week <= self.ring
+
+	def __getitem__(self, week):
+		if week not in self:
+			raise KeyError(week)
+
+		return tuple(self.iter_week(week))
+
+	def __eq__(self, other):
+		if isinstance(other, RoundRobinSchedule):
+			return self.num_teams == other.num_teams
+
+		return super().__eq__(other)
+
+	def __repr__(self):
+		return 'RoundRobinSchedule(%d)' % self.num_teams
+
+	def team_at(self, position, week):
+		# The team at a ring position in a given week. In week 1 the ring is
+		# the top row (after team 0) followed by the bottom row, backwards
+		start = (position - (week - 1)) % self.ring
+
+		if start < self.half - 1:
+			team = start + 1
+
+			return team if team < self.top_teams else BYE
+
+		return self.top_teams + (2 * self.half - 2 - start)
+
+	def position_of(self, team, week):
+		# Inverse of team_at- the ring position of a (non-zero) team
+		if team == BYE:
+			start = self.half - 2
+		elif team < self.top_teams:
+			start = team - 1
+		else:
+			start = 2 * self.half - 2 - (team - self.top_teams)
+
+		return (start + week - 1) % self.ring
+
+	def iter_week(self, week):
+		# Yields a week's matchups one at a time. Slot 0 is team 0 against
+		# the head of the bottom row; slot i pairs ring positions i - 1 and
+		# ring - 1 - i
+		yield (0, self.team_at(self.ring - 1, week))
+
+		for slot in range(1, self.half):
+			yield (self.team_at(slot - 1, week),
+				self.team_at(self.ring - 1 - slot, week))
+
+	def opponent(self, team, week):
+		# Who a team plays in a given week, or BYE
+		if week not in self:
+			raise KeyError(week)
+
+		if team == 0:
+			return self.team_at(self.ring - 1, week)
+
+		position = self.position_of(team, week)
+
+		if position == self.ring - 1:
+			return 0
+
+		return self.team_at(self.ring - 2 - position, week)
+
+	def arrays(self, week):
+		# A week's games (byes dropped) as (home, away) arrays
+		if week not in self:
+			raise KeyError(week)
+
+		ring = self.ring
+
+		# at_position[p] is the team at ring position p this week
+		at_position = np.roll(self.ring_teams(), week - 1)
+
+		home = np.empty(self.half, dtype=np.int64)
+		away = np.empty(self.half, dtype=np.int64)
+
+		home[0] = 0
+		away[0] = at_position[ring - 1]
+		home[1:] = at_position[:self.half - 1]
+		away[1:] = at_position[ring - 2:self.half - 2 if self.half > 1 else None:-1]
+
+		keep = (home >= 0) & (away >= 0)
+
+		return (home[keep], away[keep])
+
+	def ring_teams(self):
+		# The team at each ring position in week 1, with the bye (if any) as
+		# -1. Every other week is just a rotation of this
+		if getattr(self, '_ring_teams', None) is None:
+			starts = np.arange(self.ring, dtype=np.int64)
+			teams = np.where(starts < self.half - 1, starts + 1,
+				self.top_teams + 2 * self.half - 2 - starts)
+
+			if self.num_teams % 2 == 1:
+				teams[self.half - 2] = -1
+
+			self._ring_teams = teams
+
+		return self._ring_teams
+
+class DoubleRoundRobinSchedule(Mapping):
+	'''
+	A lazy double round robin- a RoundRobinSchedule played twice. The second
+	half repeats the first week by week with home and away swapped, so every
+	pair of teams meets once at each team's home
+	'''
+	def __init__(self, num_teams):
+		self.num_teams = num_teams
+		self.single = RoundRobinSchedule(num_teams)
+
+	def __len__(self):
+		return 2 * self.single.ring
+
+	def __iter__(self):
+		return iter(range(1, len(self) + 1))
+
+	def __contains__(self, week):
+		return isinstance(week, (int, np.integer)) and 1 <= week <= len(self)
+
+	def __getitem__(self, week):
+		if week not in self:
+			raise KeyError(week)
+
+		matchups = self.single[self.leg_week(week)]
+
+		if week <= self.single.ring:
+			return matchups
+
+		return tuple((away, home) for home, away in matchups)
+
+	def __eq__(self, other):
+		if isinstance(other, DoubleRoundRobinSchedule):
+			return self.num_teams == other.num_teams
+
+		return super().__eq__(other)
+
+	def __repr__(self):
+		return 'DoubleRoundRobinSchedule(%d)' % self.num_teams
+
+	def leg_week(self, week):
+		# The week of the single round robin a week repeats
+		return (week - 1) % self.single.ring + 1
+
+	def opponent(self, team, week):
+		# Who a team plays in a given week, or BYE
+		if week not in self:
+			raise KeyError(week)
+
+		return self.single.opponent(team, self.leg_week(week))
+
+	def arrays(self, week):
+		# A week's games (byes dropped) as (home, away) arrays
+		if week not in self:
+			raise KeyError(week)
+
+		home, away = self.single.arrays(self.leg_week(week))
+
+		return (home, away) if week <= self.single.ring else (away, home)
+
+class KnockoutSchedule(Mapping):
+	'''
+	A seeded single elimination bracket, one round a week. Seeds are given
+	as team ids, best first (default: team order). The field is padded to a
+	power of two with byes, which go to the top seeds, and laid out the
+	usual way- 1 plays the last seed, and the top two seeds can only meet in
+	the final.
+
+	Who plays after the first round depends on who wins, so record() is
+	given every week's scores to move the winners on, and a week only lists
+	the games whose teams are known so far. The better seed is always at
+	home and goes through if the game is tied.
+
+	slots[r] holds the team in each bracket position still alive after r
+	rounds- BYE_INDEX for a bye, EMPTY_SLOT while it isn't decided yet
+	'''
+	def __init__(self, num_teams, seeds=None):
+		if seeds is None:
+			seeds = np.arange(num_teams, dtype=np.int64)
+
+		seeds = np.asarray(seeds, dtype=np.int64)
+
+		if len(seeds) != num_teams or not np.array_equal(np.sort(seeds),
+			np.arange(num_teams)):
+			raise ValueError('seeds must list each of the %d teams once' %
+				num_teams)
+
+		rounds = (num_teams - 1).bit_length() if num_teams > 1 else 0
+		order = bracket_order(1 << rounds)
+		first = np.full(1 << rounds, BYE_INDEX, dtype=np.int64)
+		real = order < num_teams
+		first[real] = seeds[order[real]]
+
+		slots = [first] + [np.full(1 << (rounds - r), EMPTY_SLOT,
+			dtype=np.int64) for r in range(1, rounds + 1)]
+
+		# Byes go straight through to the second round
+		if rounds:
+			pairs = first.reshape(-1, 2)
+			byes = (pairs == BYE_INDEX).any(axis=1)
+			slots[1][byes] = pairs[byes].max(axis=1)
+
+		self.index(slots)
+
+	@classmethod
+	def from_slots(cls, slots):
+		# Rebuilds a bracket (results and all) from its slots, e.g. from a save
+		schedule = cls.__new__(cls)
+		schedule.index([np.array(row, dtype=np.int64) for row in slots])
+
+		return schedule
+
+	def index(self, slots):
+		# Sets up the bracket around its slots. A team's seed follows from
+		# where it starts in the bracket
+		self.slots = slots
+		self.rounds = len(slots) - 1
+
+		first = slots[0]
+		real = np.flatnonzero(first >= 0)
+
+		self.num_teams = len(real)
+		self.seed = np.zeros(self.num_teams, dtype=np.int64)
+		self.seed[first[real]] = bracket_order(len(first))[real]
+		self.position = np.zeros(self.num_teams, dtype=np.int64)
+		self.position[first[real]] = real
+
+	def __len__(self):
+		return self.rounds
+
+	def __iter__(self):
+		return iter(range(1, self.rounds + 1))
+
+	def __contains__(self, week):
+		return isinstance(week, (int, np.integer)) and 1 <= week <= self.rounds
+
+	def __getitem__(self, week):
+		if week not in self:
+			raise KeyError(week)
+
+		pairs = self.slots[week - 1].reshape(-1, 2)
+		home, away = self.arrays(week)
+		byes = (pairs == BYE_INDEX).any(axis=1)
+		matchups = list(zip(home.tolist(), away.tolist()))
+
+		for team in pairs[byes].max(axis=1).tolist():
+			matchups.append((team, BYE))
+
+		return tuple(matchups)
+
+	def __eq__(self, other):
+		if isinstance(other, KnockoutSchedule):
+			return len(self.slots) == len(other.slots) and all(
+				np.array_equal(mine, theirs)
+				for mine, theirs in zip(self.slots, other.slots))
+
+		return super().__eq__(other)
+
+	def __repr__(self):
+		return 'KnockoutSchedule(%d)' % self.num_teams
+
+	def arrays(self, week):
+		# A round's games whose teams are both known, as (home, away) arrays
+		# with the better seed at home
+		if week not in self:
+			raise KeyError(week)
+
+		pairs = self.slots[week - 1].reshape(-1, 2)
+		pairs = pairs[(pairs >= 0).all(axis=1)]
+		first, second = pairs[:, 0], pairs[:, 1]
+		swap = self.seed[second] < self.seed[first]
+
+		return (np.where(swap, second, first), np.where(swap, first, second))
+
+	def opponent(self, team, week):
+		# Who a team plays in a given round- BYE for a bye, None if the team
+		# is out or its opponent isn't known yet
+		if week not in self:
+			raise KeyError(week)
+
+		slot = self.position[team] >> (week - 1)
+		row = self.slots[week - 1]
+
+		if row[slot] != team:
+			return None
+
+		opponent = int(row[slot ^ 1])
+
+		if opponent == BYE_INDEX:
+			return BYE
+
+		return opponent if opponent >= 0 else None
+
+	def record(self, week, games):
+		# Moves on the winners of a round's games. games holds 'home', 'away',
+		# 'home_score' and 'away_score' arrays, as GameLog.week() gives. Games
+		# between teams not in the round are ignored
+		if week not in self:
+			return
+
+		home = np.asarray(games['home'], dtype=np.int64)
+		away = np.asarray(games['away'], dtype=np.int64)
+		winners = np.where(np.asarray(games['home_score'])
+			>= np.asarray(games['away_score']), home, away)
+
+		row = self.slots[week - 1]
+		slots = self.position[home] >> (week - 1)
+		mine = (row[slots] == home) & (row[slots ^ 1] == away)
+
+		self.slots[week][slots[mine] >> 1] = winners[mine]
+
+	@property
+	def champion(self):
+		# The winner of the final, or None until it's been played
+		winner = int(self.slots[-1][0])
+
+		return winner if winner >= 0 else None
+
+	def won(self):
+		# Array[team] of the number of rounds each team has won so far. Byes
+		# count as a win
+		won = np.zeros(self.num_teams, dtype=np.int64)
+
+		for rounds in range(1, self.rounds + 1):
+			row = self.slots[rounds]
+			won[row[row >= 0]] = rounds
+
+		return won
+
+	def knocked_out(self):
+		# Array[team] of whether each team has lost a game
+		won = self.won()
+		out = np.zeros(self.num_teams, dtype=bool)
+
+		for rounds in range(self.rounds):
+			teams = np.flatnonzero(won == rounds)
+			out[teams] = self.slots[rounds + 1][self.position[teams]
+				>> (rounds + 1)] >= 0
+
+		return out
+
+	def played(self):
+		# Number of rounds whose every winner is known
+		for rounds in range(self.rounds, 0, -1):
+			if (self.slots[rounds] >= 0).all():
+				return rounds
+
+		return 0
+
+	def branch(self):
+		# A copy with its own results, for forks of a snapshot
+		return KnockoutSchedule.from_slots([row.copy() for row in self.slots])
+
+	def to_array(self):
+		# The slots as one (rounds + 1, slots, 2) array padded with EMPTY_SLOT,
+		# the layout binary saves use for schedules
+		width = max(len(self.slots[0]) // 2, 1)
+		array = np.full((len(self.slots), width * 2), EMPTY_SLOT, dtype=np.int32)
+
+		for row, slots in enumerate(self.slots):
+			array[row, :len(slots)] = slots
+
+		return array.reshape(len(self.slots), width, 2)
+
+	@classmethod
+	def from_array(cls, array):
+		# Inverse of to_array
+		flat = np.asarray(array).reshape(len(array), -1)
+		size = 1 << (len(array) - 1)
+
+		return cls.from_slots([flat[r, :size >> r] for r in range(len(array))])
+
+class SwissSchedule(Mapping):
+	'''
+	A Swiss system schedule of rounds weeks (default: enough rounds for a
+	field of num_teams to have one unbeaten team left). Nothing is paired
+	up front- each week is paired by pair() from the standings as they
+	stand when it comes up, so it takes O(n) memory a week rather than the
+	O(n^2) games of a round robin.
+
+	Pairing is Monrad style- first place plays second, third plays fourth
+	and so on down the table, so teams meet others on (or near) the same
+	points. Pairs that have already met are split up by swapping with a
+	nearby pair, and only if no swap within SWISS_WINDOW places works is a
+	rematch allowed. With an odd number of teams the lowest placed team
+	that hasn't had a bye sits the week out. The team with fewer home games
+	so far is at home, the higher placed one if they're level
+	'''
+	def __init__(self, num_teams, rounds=None):
+		if rounds is None:
+			rounds = (num_teams - 1).bit_length() if num_teams > 1 else 0
+
+		self.num_teams = num_teams
+		self.rounds = rounds
+
+		# week -> (home, away, bye) for the weeks paired so far. bye is a
+		# team id or None
+		self.weeks = {}
+
+		# Sorted keys (see pair_keys()) of every pair that has met
+		self.met = np.zeros(0, dtype=np.int64)
+		self.had_bye = np.zeros(num_teams, dtype=bool)
+		self.home_games = np.zeros(num_teams, dtype=np.int64)
+
+	def __len__(self):
+		return self.rounds
+
+	def __iter__(self):
+		return iter(range(1, self.rounds + 1))
+
+	def __contains__(self, week):
+		return isinstance(week, (int, np.integer)) and 1 <= week <= self.rounds
+
+	def __getitem__(self, week):
+		# The week's matchups, or nothing if it hasn't been paired yet
+		if week not in self:
+			raise KeyError(week)
+
+		if week not in self.weeks:
+			return ()
+
+		home, away, bye = self.weeks[week]
+		matchups = list(zip(home.tolist(), away.tolist()))
+
+		if bye is not None:
+			matchups.append((bye, BYE))
+
+		return tuple(matchups)
+
+	def __eq__(self, other):
+		if isinstance(other, SwissSchedule):
+			return (self.num_teams, self.rounds) == (other.num_teams,
+				other.rounds) and self.weeks.keys() == other.weeks.keys() \
+				and all(self[week] == other[week] for week in self.weeks)
+
+		return super().__eq__(other)
+
+	def __repr__(self):
+		return 'SwissSchedule(%d, rounds=%d)' % (self.num_teams, self.rounds)
+
+	def arrays(self, week):
+		# A week's games (byes dropped) as (home, away) arrays- empty if the
+		# week hasn't been paired yet
+		if week not in self:
+			raise KeyError(week)
+
+		if week not in self.weeks:
+			return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+
+		home, away, _ = self.weeks[week]
+
+		return (home, away)
+
+	def opponent(self, team, week):
+		# Who a team plays in a given week- BYE for a bye, None if the week
+		# hasn't been paired yet
+		if week not in self:
+			raise KeyError(week)
+
+		if week not in self.weeks:
+			return None
+
+		home, away, bye = self.weeks[week]
+
+		if team == bye:
+			return BYE
+
+		side = np.flatnonzero(home == team)
+
+		if len(side):
+			return int(away[side[0]])
+
+		return int(home[np.flatnonzero(away == team)[0]])
+
+	def pair_keys(self, first, second):
+		# One int64 per pair of teams, the same whichever way round they are
+		first = np.asarray(first, dtype=np.int64)
+		second = np.asarray(second, dtype=np.int64)
+
+		return np.minimum(first, second) * self.num_teams \
+			+ np.maximum(first, second)
+
+	def have_met(self, first, second):
+		# Whether each pair of teams (arrays, or single ids) has already met
+		keys = self.pair_keys(first, second)
+
+		if not len(self.met):
+			return np.zeros(np.shape(keys), dtype=bool)
+
+		found = np.minimum(np.searchsorted(self.met, keys), len(self.met) - 1)
+
+		return self.met[found] == keys
+
+	def pair(self, week, ranked):
+		'''
+		Pairs a week from the standings- ranked is every team id from first
+		place down, as the standings index keeps them. Weeks are paired in
+		order, and once a week is paired asking again does nothing. Pairing
+		is a few array passes plus binary searches of the pairs that have
+		met, so O(n log n) a week
+		'''
+		if week not in self or week in self.weeks:
+			return
+
+		if any(earlier not in self.weeks for earlier in range(1, week)):
+			raise ValueError('Swiss week %d paired before the weeks before it' %
+				week)
+
+		order = np.array(ranked, dtype=np.int64)
+		bye = None
+
+		if len(order) % 2 == 1:
+			# The lowest placed team without a bye yet, or last place if
+			# everyone has had one
+			fresh = np.flatnonzero(~self.had_bye[order[::-1]])
+			last = len(order) - 1 - (fresh[0] if len(fresh) else 0)
+			bye = int(order[last])
+			order = np.delete(order, last)
+
+		place = np.zeros(self.num_teams, dtype=np.int64)
+		place[order] = np.arange(len(order))
+
+		self.split_rematches(order)
+
+		first, second = order[0::2], order[1::2]
+		swap = (self.home_games[second] < self.home_games[first]) \
+			| ((self.home_games[second] == self.home_games[first])
+				& (place[second] < place[first]))
+
+		self.adopt(week, np.where(swap, second, first),
+			np.where(swap, first, second), bye)
+
+	def split_rematches(self, order):
+		'''
+		Swaps teams between nearby pairs (in place) until no adjacent pair in
+		order has met before, as far as SWISS_WINDOW allows. Most rematches
+		are split in a few array passes- each swaps a team from every
+		clashing pair with one from the pair offset places away, wherever
+		both new pairs are fresh. The few left are searched one at a time
+		'''
+		pairs = order.reshape(-1, 2)
+		clash = self.have_met(pairs[:, 0], pairs[:, 1])
+
+		for offset in SWISS_OFFSETS:
+			for member in (1, 0):
+				clashing = np.flatnonzero(clash)
+				target = clashing + offset
+				valid = (target >= 0) & (target < len(pairs))
+				clashing, target = clashing[valid], target[valid]
+
+				# Only swap with pairs that are fine as they are, so no two
+				# swaps in a pass touch the same pair
+				valid = ~clash[target]
+				clashing, target = clashing[valid], target[valid]
+
+				fresh = ~self.have_met(pairs[clashing, 0], pairs[target, member]) \
+					& ~self.have_met(pairs[target, 1 - member], pairs[clashing, 1])
+				clashing, target = clashing[fresh], target[fresh]
+
+				moved = pairs[target, member]
+				pairs[target, member] = pairs[clashing, 1]
+				pairs[clashing, 1] = moved
+				clash[clashing] = False
+
+		def fresh(first, second):
+			return not self.have_met(first, second)
+
+		for pair in np.flatnonzero(clash).tolist():
+			top = 2 * pair
+
+			# Try the nearest teams first- below the pair, then above it
+			for distance in range(1, SWISS_WINDOW + 1):
+				below = top + 1 + distance
+				above = top - distance
+
+				if below < len(order) and fresh(order[top], order[below]) \
+					and fresh(order[below ^ 1], order[top + 1]):
+					order[[top + 1, below]] = order[[below, top + 1]]
+					break
+
+				if above >= 0 and fresh(order[above], order[top + 1]) \
+					and fresh(order[above ^ 1], order[top]):
+					order[[top, above]] = order[[above, top]]
+					break
+
+	def adopt(self, week, home, away, bye=None):
+		# Takes a week's pairings as given and counts them towards rematches,
+		# byes and home games
+		self.weeks[week] = (home, away, bye)
+		keys = np.sort(self.pair_keys(home, away))
+		self.met = np.insert(self.met, np.searchsorted(self.met, keys), keys)
+		self.home_games += np.bincount(home, minlength=self.num_teams)
+
+		if bye is not None:
+			self.had_bye[bye] = True
+
+	def record(self, week, games):
+		# Weeks played but never paired here (e.g. replayed from a journal)
+		# are taken from their games. The bye is whoever didn't play
+		if week not in self or week in self.weeks:
+			return
+
+		home = np.asarray(games['home'], dtype=np.int64)
+		away = np.asarray(games['away'], dtype=np.int64)
+		idle = np.setdiff1d(np.arange(self.num_teams), np.concatenate((home,
+			away)))
+
+		self.adopt(week, home, away, int(idle[0]) if len(idle) == 1 else None)
+
+	def branch(self):
+		# A copy that pairs its own weeks, for forks of a snapshot
+		return SwissSchedule.from_weeks(self.num_teams, self.rounds,
+			self.weeks)
+
+	@classmethod
+	def from_weeks(cls, num_teams, rounds, weeks):
+		# Rebuilds a schedule from its paired weeks, week -> (home, away, bye)
+		schedule = cls(num_teams, rounds)
+
+		for week in sorted(weeks):
+			home, away, bye = weeks[week]
+			schedule.adopt(week, np.array(home, dtype=np.int64),
+				np.array(away, dtype=np.int64), bye)
+
+		return schedule
+
+	@classmethod
+	def from_array(cls, num_teams, rounds, matchups):
+		# Rebuilds a schedule from to_array()'s layout, where weeks not
+		# paired yet are left empty
+		weeks = {}
+
+		for week, games in enumerate(np.asarray(matchups), 1):
+			games = games[games[:, 0] != EMPTY_SLOT]
+			byes = games[:, 1] == BYE_INDEX
+
+			if len(games):
+				weeks[week] = (games[~byes, 0], games[~byes, 1],
+					int(games[byes, 0][0]) if byes.any() else None)
+
+		return cls.from_weeks(num_teams, rounds, weeks)
+
+class IndexedSchedule(dict):
+	'''
+	An explicit week -> matchups schedule that also keeps a dense opponent
+	index, so who a team plays in a week is a single array lookup. The index
+	is built on first use and thrown away whenever the schedule changes
+	'''
+	def __init__(self, weeks=(), num_teams=None):
+		super().__init__(weeks)
+
+		# Left as None to count the teams from the schedule each rebuild
+		self._num_teams = num_teams
+		self._opponents = None
+
+	@property
+	def opponents(self):
+		if self._opponents is None:
+			self._opponents = opponent_index(self, self._num_teams)
+
+		return self._opponents
+
+	def changed(self):
+		# Called by every method that changes the weeks
+		self._opponents = None
+
+	def __setitem__(self, week, matchups):
+		super().__setitem__(week, matchups)
+		self.changed()
+
+	def __delitem__(self, week):
+		super().__delitem__(week)
+		self.changed()
+
+	def update(self, *args, **kwargs):
+		super().update(*args, **kwargs)
+		self.changed()
+
+	def setdefault(self, week, matchups=None):
+		self.changed()
+		return super().setdefault(week, matchups)
+
+	def pop(self, week, *default):
+		self.changed()
+		return super().pop(week, *default)
+
+	def popitem(self):
+		self.changed()
+		return super().popitem()
+
+	def clear(self):
+		super().clear()
+		self.changed()
+
+	def opponent(self, team, week):
+		# Who a team plays in a given week, or BYE
+		if week not in self:
+			raise KeyError(week)
+
+		opponent = self.opponents[team, week - 1]
+
+		return BYE if opponent == BYE_INDEX else int(opponent)
+
+class ArraySchedule(Mapping):
+	'''
+	An explicit schedule backed by an int32 array of shape (weeks, slots, 2)
+	holding (home, away) for every slot of every week, as read from a binary
+	save. BYE_INDEX marks a bye and EMPTY_SLOT pads weeks with fewer games
+	'''
+	def __init__(self, matchups):
+		self.matchups = matchups
+
+	def __len__(self):
+		return len(self.matchups)
+
+	def __iter__(self):
+		return iter(range(1, len(self.matchups) + 1))
+
+	def __contains__(self, week):
+		return isinstance(week, (int, np.integer)) \
+			and 1 <= week <= len(self.matchups)
+
+	def __getitem__(self, week):
+		if week not in self:
+			raise KeyError(week)
+
+		matchups = []
+
+		for home, away in self.matchups[week - 1].tolist():
+			if home == EMPTY_SLOT:
+				continue
+
+			matchups.append((BYE if home == BYE_INDEX else home,
+				BYE if away == BYE_INDEX else away))
+
+		return tuple(matchups)
+
+	def arrays(self, week):
+		if week not in self:
+			raise KeyError(week)
+
+		games = self.matchups[week - 1]
+		keep = (games[:, 0] >= 0) & (games[:, 1] >= 0)
+
+		return (games[keep, 0].astype(np.int64), games[keep, 1].astype(np.int64))
+
+class PartialSchedule(Mapping):
+	'''
+	A schedule loaded without its early weeks. It still covers weeks 1 to
+	num_weeks- the first time a missing week is needed, load_missing() is
+	called to fetch them (from the save they came from)
+	'''
+	def __init__(self, weeks, num_weeks, load_missing):
+		self.weeks = weeks
+		self.num_weeks = num_weeks
+		self.load_missing = load_missing
+
+	def __len__(self):
+		return self.num_weeks
+
+	def __iter__(self):
+		return iter(range(1, self.num_weeks + 1))
+
+	def __contains__(self, week):
+		return isinstance(week, (int, np.integer)) \
+			and 1 <= week <= self.num_weeks
+
+	def __getitem__(self, week):
+		if week not in self:
+			raise KeyError(week)
+
+		if week not in self.weeks:
+			self.weeks.update(self.load_missing())
+
+		return self.weeks[week]
+
+	def is_complete(self):
+		return len(self.weeks) == self.num_weeks
+
+def bracket_order(size):
+	# The (0-based) seed in each starting position of a bracket of size
+	# teams, a power of two. Each round doubles the last one's order, pairing
+	# every seed with its mirror image- 0 1 -> 0 3 1 2 -> 0 7 3 4 1 6 2 5
+	order = np.zeros(1, dtype=np.int64)
+
+	while len(order) < size:
+		order = np.stack((order, 2 * len(order) - 1 - order), axis=1).ravel()
+
+	return order
+
+def to_array(schedule):
+	# Packs a schedule with weeks numbered 1 to len(schedule) into the
+	# (weeks, slots, 2) layout used by ArraySchedule
+	if isinstance(schedule, ArraySchedule):
+		return schedule.matchups
+
+	slots = max((len(schedule[week]) for week in schedule), default=0)
+	matchups = np.full((len(schedule), slots, 2), EMPTY_SLOT, dtype=np.int32)
+
+	for week in schedule:
+		if not 1 <= week <= len(schedule):
+			raise ValueError('schedule weeks must be numbered 1 to %d' %
+				len(schedule))
+
+		for slot, matchup in enumerate(schedule[week]):
+			matchups[week - 1, slot] = [BYE_INDEX if team == BYE else team
+				for team in matchup]
+
+	return matchups
+
+def week_arrays(schedule, week):
+	# A week's games (byes dropped) as (home, away) arrays, for any schedule
+	if hasattr(schedule, 'arrays'):
+		return schedule.arrays(week)
+
+	games = [matchup for matchup in schedule[week] if BYE not in matchup]
+
+	if not games:
+		return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+
+	home, away = np.array(games, dtype=np.int64).T
+
+	return (home, away)
+
+def count_teams(schedule):
+	# Number of teams in a schedule, taken as one past the highest team id
+	if hasattr(schedule, 'num_teams'):
+		return schedule.num_teams
+
+	highest = -1
+
+	for week in schedule:
+		for matchup in schedule[week]:
+			for team in matchup:
+				if team != BYE:
+					highest = max(highest, team)
+
+	return highest + 1
+
+def week_opponents(schedule, week, num_teams, games=None):
+	# Array of every team's opponent in a week. Teams that don't play get
+	# BYE_INDEX. games can pass in week_arrays() if it's already been built
+	opponents = np.full(num_teams, BYE_INDEX, dtype=np.int32)
+	home, away = week_arrays(schedule, week) if games is None else games
+
+	opponents[home] = away
+	opponents[away] = home
+
+	return opponents
+
+def opponent_index(schedule, num_teams=None):
+	'''
+	Builds the dense opponent index for a schedule: an int32 array of shape
+	(num_teams, weeks) where [team, week - 1] is that week's opponent, or
+	BYE_INDEX. Weeks must be numbered 1 to len(schedule)
+	'''
+	if num_teams is None:
+		num_teams = count_teams(schedule)
+
+	index = np.full((num_teams, len(schedule)), BYE_INDEX, dtype=np.int32)
+
+	for week in schedule:
+		home, away = week_arrays(schedule, week)
+
+		index[home, week - 1] = away
+		index[away, week - 1] = home
+
+	return index
+
+def validate_round_robin(schedule, num_teams=None):
+	'''
+	Checks that a schedule is a correct single round robin- every team plays
+	every other team exactly once, plays at most once a week, and (with an
+	odd number of teams) has exactly one bye.
+
+	Raises ValidationError listing every problem found. Weeks are checked one
+	at a time with array operations, and the only state kept across weeks is
+	a bit per pair of teams, so this scales to very large leagues
+	'''
+	if num_teams is None:
+		num_teams = count_teams(schedule)
+
+	errors = []
+	if num_teams < 2:
+		expected_weeks = 0
+	else:
+		expected_weeks = num_teams if num_teams % 2 == 1 else num_teams - 1
+
+	if len(schedule) != expected_weeks:
+		errors.append('expected %d weeks, got %d' % (expected_weeks,
+			len(schedule)))
+
+	teams = np.arange(num_teams)
+
+	# A bitset per team of the opponents it has already faced, flattened so
+	# that bit (team, opponent) is in byte team * width + opponent // 8
+	width = (num_teams + 7) // 8
+	played = np.zeros(num_teams * width, dtype=np.uint8)
+	games = np.zeros(num_teams, dtype=np.int64)
+	byes = np.zeros(num_teams, dtype=np.int64)
+
+	for week in sorted(schedule):
+		home, away = week_arrays(schedule, week)
+		sides = np.concatenate((home, away))
+
+		if len(sides) and (sides.min() < 0 or sides.max() >= num_teams):
+			errors.append('week %s: team id out of range' % week)
+			continue
+
+		appearances = np.bincount(sides, minlength=num_teams)
+
+		for team in np.flatnonzero(appearances > 1):
+			errors.append('week %s: team %d plays more than once' % (week, team))
+
+		for team in home[home == away]:
+			errors.append('week %s: team %d plays itself' % (week, team))
+
+		# Look up and then mark the pairs in both directions. Each team shows
+		# up at most once a week (checked above) so the fancy-indexed writes
+		# below can't collide
+		if np.any(appearances > 1):
+			continue
+
+		opponents = week_opponents(schedule, week, num_teams, (home, away))
+		playing = opponents != BYE_INDEX
+		rows = teams[playing]
+		cols = opponents[playing]
+
+		cells = rows * width + (cols >> 3)
+		bits = np.left_shift(1, cols & 7).astype(np.uint8)
+		marked = played[cells]
+		repeats = (marked & bits) != 0
+
+		for team, opponent in zip(rows[repeats], cols[repeats]):
+			if team < opponent:
+				errors.append('week %s: %d and %d have already played' % (week,
+					team, opponent))
+
+		played[cells] = marked | bits
+		games += playing
+		byes += ~playing
+
+	for team in np.flatnonzero(games != num_teams - 1):
+		errors.append('team %d plays %d games, expected %d' % (team,
+			games[team], num_teams - 1))
+
+	for team in np.flatnonzero(byes != expected_weeks - (num_teams - 1)):
+		errors.append('team %d has %d byes' % (team, byes[team]))
+
+	if errors:
+		raise ss_err.ValidationError('Schedule is not a valid round robin',
+			errors)
+
+def serialize(schedule):
+	# Converts a schedule into something json can write. Lazy schedules are
+	# stored by their parameters rather than week by week
+	if isinstance(schedule, RoundRobinSchedule):
+		return {'type': 'round_robin', 'num_teams': schedule.num_teams}
+
+	if isinstance(schedule, DoubleRoundRobinSchedule):
+		return {'type': 'double_round_robin', 'num_teams': schedule.num_teams}
+
+	if isinstance(schedule, KnockoutSchedule):
+		return {'type': 'single_elimination',
+			'slots': [row.tolist() for row in schedule.slots]}
+
+	if isinstance(schedule, SwissSchedule):
+		return {'type': 'swiss', 'num_teams': schedule.num_teams,
+			'rounds': schedule.rounds, 'weeks': {week: [home.tolist(),
+			away.tolist(), bye] for week, (home, away, bye) in
+			schedule.weeks.items()}}
+
+	if not isinstance(schedule, dict):
+		return {week: schedule[week] for week in schedule}
+
+	return schedule
+
+def deserialize(serialized):
+	# Inverse of serialize. Explicit schedules come back from json with string
+	# week numbers and lists instead of tuples, so those are converted back
+	if serialized.get('type') == 'round_robin':
+		return RoundRobinSchedule(serialized['num_teams'])
+
+	if serialized.get('type') == 'double_round_robin':
+		return DoubleRoundRobinSchedule(serialized['num_teams'])
+
+	if serialized.get('type') == 'single_elimination':
+		return KnockoutSchedule.from_slots(serialized['slots'])
+
+	if serialized.get('type') == 'swiss':
+		return SwissSchedule.from_weeks(serialized['num_teams'],
+			serialized['rounds'], {int(week): paired for week, paired in
+			serialized['weeks'].items()})
+
+	schedule = {}
+
+	for week, matchups in serialized.items():
+		schedule[int(week)] = tuple(tuple(matchup) for matchup in matchups)
+
+	return IndexedSchedule(schedule)
@@ -1,286 +1,917 @@
 from enum import Enum
+import bisect
+import os
 
 import team
+import schedules
+import game_log
 import random
+import numpy as np
 import season_sim_io as ss_io
 import season_sim_errors as ss_err
+import season_sim_batch as ss_batch
+import season_sim_standings as ss_standings
+import season_sim_rng as ss_rng
+import season_sim_profile as ss_prof
+import season_sim_import as ss_import
+import season_sim_odds as ss_odds
+import season_sim_simulators as ss_sim
+import season_sim_snapshot as ss_snap
+import season_sim_clinch as ss_clinch
 
 # TODO parse args
 
-# Contains the state of the current simulation- teams, week, right now
-state = {}
-
-state['active'] = False
-state['teams'] = []
-state['schedule'] = {}
-state['current_week'] = 0
-# A list of games- should have home team, away team, home score, and
-# away score. Not implemented
-state['game_log'] = []
-
-state['config'] = {}
-
-state['config']['POINTS_ON_WIN'] = 3
-state['config']['POINTS_ON_LOSS'] = 0
-state['config']['POINTS_ON_TIE'] = 1
-
 class ScheduleType(Enum):
 	ROUND_ROBIN = 1
 	DOUBLE_ROUND_ROBIN = 2
 	SINGLE_ELIMINATION = 3
+	SWISS = 4
 
 class MatchupResult(Enum):
 	HOME_WIN = 1
 	AWAY_WIN = 2
 	TIE = 3
 
-# This should run whenever intepreter is fired up
-def startup():
-	state['active'] = False
-	state['teams'] = []
-	state['schedule'] = {}
-	state['current_week'] = 0
-	# A list of games- should have home team, away team, home score, and
-	# away score. Not implemented
-	state['game_log'] = []
+# Whether a team has clinched first place or been eliminated, see
+# League.clinch_status()
+ClinchStatus = ss_clinch.ClinchStatus
 
 ###############################################################################
 # Scheduling functions                                                        #
 ###############################################################################
 
-def schedule(num_teams=0, type=ScheduleType.ROUND_ROBIN):
-	# TODO schedule types, validate num_teams (do we do that in this function, 
-	# or a higher one?)
+# Builds the round robin without touching the state, so that it can be used
+# by engines (like Monte Carlo) that must leave the current league alone
+@ss_prof.timed('schedule')
+def build_round_robin(num_teams):
+	return schedules.RoundRobinSchedule(num_teams)
 
-	# Should we shuffle teams?
+@ss_prof.timed('schedule')
+def build_double_round_robin(num_teams):
+	return schedules.DoubleRoundRobinSchedule(num_teams)
 
-	'''
-		This produces a schedule of the form map<int, list<tuple>>
+# seeds lists team ids best first- by default teams are seeded in the order
+# they were added
+@ss_prof.timed('schedule')
+def build_knockout(num_teams, seeds=None):
+	return schedules.KnockoutSchedule(num_teams, seeds)
 
-		It maps week numbers to the weekly schedule for that week
+# rounds defaults to enough for one team to be left unbeaten
+@ss_prof.timed('schedule')
+def build_swiss(num_teams, rounds=None):
+	return schedules.SwissSchedule(num_teams, rounds)
 
-		Weekly schedules are just lists of tuples containing the two teams 
-		that are playing
-	'''
+###############################################################################
+# Various simulators                                                          #
+###############################################################################
+
+# Simulators draw from rng, which is anything with a randint()- the random
+# module itself, or a season_sim_rng.RNG for reproducible runs
 
-	# If number of teams is default argument, check the state to see how many
-	# teams we should schedule for
-	if num_teams == 0:
-		num_teams = len(state['teams'])
+# A basic matchup simulator
+def flip_coin(home, away, rng=random):
+	flip = rng.randint(0, 1)
 
-	return round_robin_schedule(num_teams)
+	return (1, 0) if flip == 0 else (0, 1)
 
-# This is based on the first algorithm found at 
-# https://en.wikipedia.org/wiki/Round-robin_tournament#Scheduling_algorithm
-# We have two rows that correspond to matchups, and rotate the rows clockwise
-# every week until we get every possible matchup
-def round_robin_schedule(num_teams):
-	schedule = {}
+def biased_proportional(home, away, bias=10, rng=random):
+	# Ratings are stored as integers, so they are read once up front rather
+	# than converted on every attempt
+	home_offense = home.offense + bias
+	away_offense = away.offense + bias
+	home_range = home_offense + away.defense + bias
+	away_range = away_offense + home.defense + bias
 
-	top_row = list(range(0, num_teams // 2))
-	bot_row = list(range(num_teams // 2, num_teams))
+	home_score = 0
+	away_score = 0
 
-	# If we have an odd number of teams, need to insert a dummy team. We do it
-	# in the top as that is the one that will have less elements in the odd
-	# case
-	if num_teams % 2 == 1:
-		top_row.append("BYE")
+	for inning in range(5):
+		home_attempt = rng.randint(1, home_range)
 
-	# Weird range- want to have a week 1 and not a week 0. In addition number
-	# of weeks is dependent on the number on both the number of teams but also
-	# the parity as odd teams will take one more. Adding the dummy guarentees 
-	# that the combined length of the lists is correct
-	for week in range(1, len(top_row) + len(bot_row)):
-		# Get the weeks pairings- this is as easy as looping through every row
-		weeks_pairings = []
+		if (home_attempt <= home_offense):
+			home_score += 1
 
-		for matchup_number in range(len(top_row)):
-			weeks_pairings.append((top_row[matchup_number], bot_row[matchup_number]))
+		away_attempt = rng.randint(1, away_range)
 
-		weeks_pairings = tuple(weeks_pairings)
+		if (away_attempt <= away_offense):
+			away_score += 1
+
+	return (home_score, away_score)
 
-		schedule[week] = weeks_pairings
+# biased_proportional with a single draw per game- the game's whole score
+# distribution is looked up (cached per pairing) and one random number picks
+# the final score. Scores come out with exactly the same odds
+def biased_proportional_table(home, away, bias=10, rng=random):
+	cdf = ss_odds.score_cdf(home.offense, home.defense, away.offense,
+		away.defense, bias)
+	outcome = bisect.bisect_right(cdf, rng.randint(0, cdf[-1] - 1))
 
-		# Now we have to rotate the rows. We keep the first element in the top
-		# row constant, but rotate the rest clockwise (to the right), whereas 
-		# on the bottom, clockwise is to the left
-		top_row = [top_row[0]] + rotate(top_row[1:], 1)
-		bot_row = rotate(bot_row, -1)
+	return divmod(outcome, ss_odds.SCORES)
 
-		tmp = top_row[1]
-		top_row[1] = bot_row[-1]
-		bot_row[-1] = tmp
+def home_win(home, away, rng=None):
+	# Basic schedule to always have the home team win for debugging
+	return (1, 0)
 
-	state['schedule'] = schedule
-	return schedule
+# Every simulator above is registered along with its batched version, so a
+# league can pick one by name (config['SIMULATOR']) and batch and Monte Carlo
+# runs get the vectorized code
+ss_sim.register('biased_proportional', biased_proportional,
+	ss_batch.biased_proportional_games,
+	'Five attempts each, scoring in proportion to offense vs defense',
+	ss_odds.game_outcomes)
+ss_sim.register('biased_proportional_table', biased_proportional_table,
+	ss_odds.table_games,
+	'biased_proportional with one draw per game from its score distribution',
+	ss_odds.game_outcomes)
+ss_sim.register('flip_coin', flip_coin, ss_batch.flip_coin_batch,
+	'A coin flip decides every game 1-0', ss_batch.flip_coin_outcomes)
+ss_sim.register('home_win', home_win, ss_batch.home_win_batch,
+	'The home team always wins 1-0', ss_batch.home_win_outcomes)
 
 ###############################################################################
-# Various simulators                                                          #
+# Utilities                                                                   #
 ###############################################################################
 
-# A basic matchup simulator
-def flip_coin(home, away):
-	flip = random.randint(0, 1)
+# https://stackoverflow.com/questions/9457832/python-list-rotation gives this
+# function- it rotates a list n positions to the right
+def rotate(list, n):
+    return list[-n:] + list[:-n]
 
-	return (1, 0) if flip == 0 else (0, 1)
+# Utility function- given a team and schedule, it tells you who they play on
+# that specific week
+def check_opponent(team, schedule, week=1):
+	# Lazy and indexed schedules can answer this directly
+	if hasattr(schedule, 'opponent'):
+		return schedule.opponent(team, week)
 
-def biased_proportional(home, away, bias=10):
-	home_score = 0
-	away_score = 0
+	weekly_schedule = schedule[week]
 
-	for inning in range(5):
-		home_attempt = random.randint(1, (int(home.offense) + int(away.defense) + 2 * bias))
+	for match in weekly_schedule:
+		if team in match:
+			if team == match[0]:
+				return match[1]
+			else:
+				return match[0]
 
-		if (home_attempt <= int(home.offense) + bias):
-			home_score += 1
+	# TODO add error handling here
 
-		away_attempt = random.randint(1, (int(away.offense) + int(home.defense) + 2 * bias))
+# Save names may carry their format as an extension- .ssf for json or .ssb
+# for binary. Without one, saves default to .ssf
+SAVE_EXTENSIONS = ('.ssf', '.ssb')
 
-		if (away_attempt <= int(away.offense) + bias):
-			away_score += 1
+def save_path(save_name):
+	if os.path.splitext(save_name)[1] in SAVE_EXTENSIONS:
+		return save_name
 
-	return (home_score, away_score)
+	return "%s.ssf" % save_name
 
-def home_win(home, away):
-	# Basic schedule to always have the home team win for debugging
-	return (1, 0)
+def find_save(save_name):
+	# The file to load for a save name, or None if there isn't one. Without an
+	# extension a .ssf file is preferred over a .ssb one
+	candidates = [save_name]
+
+	if os.path.splitext(save_name)[1] not in SAVE_EXTENSIONS:
+		candidates = ["%s%s" % (save_name, ext) for ext in SAVE_EXTENSIONS]
+
+	for candidate in candidates:
+		if os.path.isfile(candidate):
+			return candidate
+
+	return None
+
+# Number of journal records after which the journal is folded back into the
+# save
+JOURNAL_COMPACT_EVERY = 50
 
 ###############################################################################
-# Levels of simulation- matchup, week, seaons                                 #
+# Leagues                                                                     #
 ###############################################################################
 
-def simulate_matchup(home, away, simulator=biased_proportional):
+class League:
 	'''
-	Simulates a matchup using the simulator function and updates home and away
-	team results
+	One league- its teams, schedule, config, current week and game log, plus
+	the standings, journal and random stream that go with them. Leagues share
+	nothing, so any number of them can live in one process (or be pickled off
+	to worker processes).
 
-	Simulator takes in home, away team objects and returns a tuple of the form
-	(home_score, away_score)
+	Everything lives in the state dictionary, which is what season_sim_io
+	saves and loads. The module level functions work on default_league
 	'''
-	home_score, away_score = simulator(home, away)
+	def __init__(self, config=None):
+		self.state = {}
+		self.startup()
+
+		self.state['config'] = {}
+
+		self.state['config']['POINTS_ON_WIN'] = 3
+		self.state['config']['POINTS_ON_LOSS'] = 0
+		self.state['config']['POINTS_ON_TIE'] = 1
+
+		if config is not None:
+			self.state['config'].update(config)
+
+	@property
+	def active(self):
+		return self.state['active']
+
+	@property
+	def teams(self):
+		return self.state['teams']
+
+	@property
+	def current_week(self):
+		return self.state['current_week']
+
+	@property
+	def game_log(self):
+		return self.state['game_log']
+
+	@property
+	def config(self):
+		return self.state['config']
+
+	# This should run whenever intepreter is fired up
+	def startup(self):
+		state = self.state
+
+		state['active'] = False
+		state['teams'] = team.TeamStore()
+		state['schedule'] = {}
+		state['current_week'] = 0
+		# Every game played- week, home team, away team, home score and away
+		# score, stored column by column
+		state['game_log'] = game_log.GameLog()
+		# Ranked standings, kept up to date as results come in. Built on first
+		# use
+		state['standings'] = None
+		# Set while saves are journaled rather than rewritten, see
+		# start_journal()
+		state['journal'] = None
+		# The league's random stream, see seed(). None uses the global random
+		# module
+		state['rng'] = None
+		# Clinch and elimination status, see clinch_status(). Built on first
+		# use and kept up to date every week after that
+		state['clinch'] = None
+
+	###########################################################################
+	# Scheduling                                                              #
+	###########################################################################
+
+	def schedule(self, num_teams=0, type=ScheduleType.ROUND_ROBIN):
+		# TODO validate num_teams (do we do that in this function, or a higher
+		# one?)
+
+		# Should we shuffle teams?
+
+		'''
+			This produces a schedule of the form map<int, list<tuple>>
+
+			It maps week numbers to the weekly schedule for that week
+
+			Weekly schedules are just lists of tuples containing the two teams
+			that are playing. Round robins come back as a lazy mapping, so
+			weeks are only built when they are looked up. Single elimination
+			gives a bracket, one round a week, that fills in later rounds as
+			results come in, and Swiss pairs each week from the standings
+			when it comes up
+		'''
+
+		# If number of teams is default argument, check the state to see how
+		# many teams we should schedule for
+		if num_teams == 0:
+			num_teams = len(self.state['teams'])
+
+		if type == ScheduleType.DOUBLE_ROUND_ROBIN:
+			return self.double_round_robin_schedule(num_teams)
+
+		if type == ScheduleType.SINGLE_ELIMINATION:
+			return self.knockout_schedule(num_teams)
+
+		if type == ScheduleType.SWISS:
+			return self.swiss_schedule(num_teams)
+
+		return self.round_robin_schedule(num_teams)
+
+	# This is based on the first algorithm found at
+	# https://en.wikipedia.org/wiki/Round-robin_tournament#Scheduling_algorithm
+	# We have two rows that correspond to matchups, and rotate the rows
+	# clockwise every week until we get every possible matchup. Rather than
+	# rotating lists, schedules.RoundRobinSchedule works out each week (or each
+	# team's opponent) from its position in the rotation, and only when asked
+	def round_robin_schedule(self, num_teams):
+		schedule = build_round_robin(num_teams)
+
+		self.state['schedule'] = schedule
+		return schedule
+
+	# Everyone plays everyone twice, the second time with home and away
+	# swapped
+	def double_round_robin_schedule(self, num_teams):
+		schedule = build_double_round_robin(num_teams)
+
+		self.state['schedule'] = schedule
+		return schedule
+
+	# A seeded single elimination bracket, see schedules.KnockoutSchedule.
+	# seeds lists team ids best first (default: team order). Exact odds of
+	# each team going through each round come from season_sim_bracket
+	def knockout_schedule(self, num_teams, seeds=None):
+		schedule = build_knockout(num_teams, seeds)
+
+		self.state['schedule'] = schedule
+		return schedule
+
+	# A Swiss system, see schedules.SwissSchedule. Only the number of rounds
+	# is fixed up front- simulate_week() pairs each week from the standings,
+	# so this scales to fields far too big for a round robin
+	def swiss_schedule(self, num_teams, rounds=None):
+		schedule = build_swiss(num_teams, rounds)
+
+		self.state['schedule'] = schedule
+		return schedule
+
+	def confirm_schedule(self, schedule):
+		# Plain week -> matchups dictionaries get an opponent index built with
+		# them
+		if type(schedule) is dict:
+			schedule = schedules.IndexedSchedule(schedule)
+
+		self.state['schedule'] = schedule
+
+	def get_weekly_schedule(self, week=0):
+		if (week == 0):
+			week = self.state['current_week']
+
+		return self.state['schedule'][week]
+
+	###########################################################################
+	# Levels of simulation- matchup, week, seaons                             #
+	###########################################################################
+
+	@ss_prof.timed('matchup')
+	def simulate_matchup(self, home, away, simulator=biased_proportional,
+		week=None, rng=None):
+		'''
+		Simulates a matchup using the simulator function and updates home and
+		away team results. The game goes in the game log under week (default:
+		the current week)
+
+		Simulator takes in home, away team objects and returns a tuple of the
+		form (home_score, away_score). If rng is given it is passed on to the
+		simulator as rng=
+		'''
+		if rng is None:
+			home_score, away_score = simulator(home, away)
+		else:
+			home_score, away_score = simulator(home, away, rng=rng)
+
+		return self.record_result(home, away, home_score, away_score, week)
+
+	@ss_prof.timed('bookkeeping')
+	def record_result(self, home, away, home_score, away_score, week=None):
+		# Updates the home and away team results for a finished game and logs
+		# it. This is shared by the scalar and batch simulation paths
+		state = self.state
+
+		if home_score > away_score:
+			home.record('wins')
+			away.record('losses')
+		elif home_score < away_score:
+			home.record('losses')
+			away.record('wins')
+		elif home_score == away_score:
+			home.record('ties')
+			away.record('ties')
+
+		# Keep the standings index in step, as long as these are league teams.
+		# Teams added since it was built mean it has to be built again, which
+		# standings() does when next asked
+		standings = state['standings']
+
+		if standings is not None and home.store is standings.teams:
+			if standings.size == len(standings.teams):
+				standings.update(home.id)
+				standings.update(away.id)
+			else:
+				state['standings'] = None
+
+		if week is None:
+			week = state['current_week']
+
+		# Teams are logged by their id in the team store, so only games between
+		# league teams go in the log. Standalone teams all have id 0
+		if home.store is state['teams'] and away.store is state['teams']:
+			state['game_log'].append(week, home.id, away.id, home_score,
+				away_score)
+
+		return (home.name, home_score, away.name, away_score)
+
+	def simulate_week(self, schedule=None, week=None, advance=True, batch=False,
+		rng=None, fixed=None):
+		# Default variables will lead to the simulator drawing it from the
+		# current state. Returns tuple of (home, home score, away, away score)
+		# to give the various GUIs the ability to display the results of the
+		# week. If batch is set, the whole week is scored at once by
+		# season_sim_batch.
+		#
+		# rng (default: the league's, see seed()) is an ss_rng.RNG. Each week
+		# draws from its own child stream, so a week's results only depend on
+		# the seed and the week- not on what was simulated before it or where
+		#
+		# fixed maps (home id, away id) to a (home score, away score) that is
+		# recorded for that game instead of simulating it- for playing out
+		# "what if" branches of a snapshot
+		state = self.state
+
+		if rng is None:
+			rng = state['rng']
+
+		if (schedule == None):
+			schedule = state['schedule']
+
+		if (week == None):
+			week = state['current_week']
+
+		if (week > len(schedule)):
+			raise ss_err.EndOfSeasonError('Trying to simulate past end of season', None)
+			return
+
+		games = []
+		week_rng = rng.week(week) if rng is not None else None
+
+		# Swiss weeks are paired from the standings as they are now
+		if hasattr(schedule, 'pair'):
+			schedule.pair(week, self.standings().table())
+
+		if batch:
+			games = self.simulate_week_batch(schedule, week, rng=week_rng,
+				fixed=fixed)
+		else:
+			# The league's simulator, see season_sim_simulators
+			simulator = ss_sim.for_config(state['config']).scalar
+			teams = state['teams']
+
+			for home, away in schedule[week]:
+				# If the matchup does not involve a bye, we need to simulate it
+				if ('BYE' in (home, away)):
+					continue
+
+				if fixed and (home, away) in fixed:
+					games.append(self.record_result(teams[home], teams[away],
+						*fixed[(home, away)], week))
+				else:
+					games.append(self.simulate_matchup(teams[home], teams[away],
+						simulator, week=week, rng=week_rng))
+
+		# Schedules that depend on results are told the week's games- knockout
+		# brackets move the winners on to the next round
+		if hasattr(schedule, 'record'):
+			schedule.record(week, state['game_log'].week(week))
+
+		if advance:
+				state['current_week'] += 1
+
+		# The clinch index is kept up to date while the rest of the schedule is
+		# known- a Swiss schedule with weeks still to pair drops it until asked
+		# again
+		if state['clinch'] is not None:
+			if ss_clinch.schedule_known(state['schedule'], state['current_week']):
+				self.clinch_status()
+			else:
+				state['clinch'] = None
+
+		# In journal mode every week is appended to the save as it is played
+		if state['journal'] is not None:
+			self.sync_journal()
 
-	if home_score > away_score:
-		home.results['win'] += 1
-		away.results['loss'] += 1
-	elif home_score < away_score:
-		home.results['loss'] += 1
-		away.results['win'] += 1
-	elif home_score == away_score:
-		home.results['tie'] += 1
-		away.results['tie'] += 1
+		return games
 
-	game = {
-		'home_team': home.name,
-		'away_team': away.name,
-		'home_score': home_score,
-		'away_score': away_score,
-	}
+	@ss_prof.timed('batch')
+	def simulate_week_batch(self, schedule, week, bias=None, rng=None,
+		fixed=None):
+		# Scores every game of the week in one go with the league simulator's
+		# batch entry point (or per game if it has none) and then records the
+		# results. bias, if given, is passed on to the simulator. Games in
+		# fixed get the given scores instead, see simulate_week()
+		teams = self.state['teams']
+		simulator = ss_sim.for_config(self.state['config'])
+		options = {} if bias is None else {'bias': bias}
 
-	return (home.name, home_score, away.name, away_score)
+		_, home_ids, away_ids = ss_batch.schedule_to_arrays(schedule, [week])
+		home_scores, away_scores = simulator.simulate_games(teams, home_ids,
+			away_ids, rng, **options)
 
-	#state['game_log'].append()
+		games = []
 
-def simulate_week(schedule=None, week=None, advance=True):
-	# Default variables will lead to the simulator drawing it from the current
-	# state. Returns tuple of (home, home score, away, away score) to give the 
-	# various GUIs the ability to display the results of the week
+		for home, away, home_score, away_score in zip(home_ids.tolist(),
+			away_ids.tolist(), home_scores.tolist(), away_scores.tolist()):
+			if fixed and (home, away) in fixed:
+				home_score, away_score = fixed[(home, away)]
 
-	if (schedule == None):
-		schedule = state['schedule']
+			games.append(self.record_result(teams[home], teams[away], home_score,
+				away_score, week))
 
-	if (week == None):
-		week = state['current_week']
+		return games
 
-	if (week > len(schedule)):
-		raise ss_err.EndOfSeasonError('Trying to simulate past end of season', None)
-		return
+	def simulate_season(self, schedule=None, batch=False, rng=None):
+		# Go through each week in the schedule. Week 0 is the preseason, so we
+		# always start from at least week 1
+		if (schedule == None):
+			schedule = self.state['schedule']
 
-	games = []
+		games = []
 
-	for home, away in schedule[week]:
-		# If the matchup does not involve a bye, we need to simulate it
-		if ('BYE' not in (home, away)):
-			games.append(simulate_matchup(state['teams'][home], state['teams'][away]))
+		for week in range(max(self.state['current_week'], 1), len(schedule) + 1):
+			games.append(self.simulate_week(schedule, week, batch=batch, rng=rng))
 
-	if advance:
-			state['current_week'] += 1
+		return games
 
-	return games
+	###########################################################################
+	# Teams and standings                                                     #
+	###########################################################################
 
-def simulate_season(schedule=None):
-	# Go through each week in the schedule
-	if (schedule == None):
-		schedule = state['schedule']
+	def add_team_to_state(self, team_name, team_off, team_def):
+		self.state['teams'].add(team_name, offense=team_off, defense=team_def)
 
-	games = []
+	def add_teams_to_state(self, names, offense, defense):
+		# Adds many teams at once- ratings are arrays in the same order as names
+		teams = self.state['teams']
 
-	for week in range(state['current_week'], len(schedule) + 1):
-		games.append(simulate_week(schedule, week))
+		if isinstance(teams, team.TeamStore):
+			teams.extend(names, offense, defense)
+		else:
+			for name, off, def_ in zip(names, offense, defense):
+				teams.append(team.Team(name, off, def_))
+
+	def import_teams(self, path, format=None):
+		# Reads a whole csv/json/txt team file and adds its teams to the
+		# league. Nothing is added unless every row is valid- otherwise a
+		# ValidationError lists every problem in the file
+		teams = self.state['teams']
+		existing = teams.names if isinstance(teams, team.TeamStore) \
+			else [t.name for t in teams]
+
+		names, offense, defense = ss_import.read_teams(path, format, existing)
+
+		self.add_teams_to_state(names, offense, defense)
+
+		return len(names)
+
+	def set_simulator(self, name):
+		# Picks the league's simulator from the registry. It is kept in the
+		# config, so saves remember it
+		ss_sim.get(name)
+		self.state['config'][ss_sim.CONFIG_KEY] = name
+
+	def seed(self, seed=None):
+		# Gives the league a reproducible random stream- two leagues seeded the
+		# same play out identically. seed(None) picks a random seed, which can
+		# be read back from state['rng'].seed
+		self.state['rng'] = ss_rng.RNG(seed)
+
+	def init_league(self):
+		state = self.state
+
+		state['active'] = True
+		state['current_week'] = 1
+		state['standings'] = ss_standings.StandingsIndex(state['teams'],
+			state['config'])
+
+	def calc_team_points(self, team):
+		config = self.state['config']
+
+		return team.wins * config['POINTS_ON_WIN'] \
+			+ team.ties * config['POINTS_ON_TIE'] \
+			+ team.losses * config['POINTS_ON_LOSS']
+
+	@ss_prof.timed('standings')
+	def standings(self):
+		# Returns the league's standings index, (re)building it if teams were
+		# added or replaced or the points config changed since it was last used
+		state = self.state
+		index = state['standings']
+
+		if index is None or not index.is_current(state['teams'], state['config']):
+			teams = state['teams']
+
+			if not isinstance(teams, team.TeamStore):
+				store = team.TeamStore(len(teams))
+
+				for t in teams:
+					store.append(t)
+
+				teams = store
+
+			index = ss_standings.StandingsIndex(teams, state['config'])
+			state['standings'] = index
+
+		return index
+
+	@ss_prof.timed('standings')
+	def calc_all_points(self, teams=None):
+		# Points for every team as an array, in team order. Teams held in a
+		# TeamStore are done in one vectorized expression
+		if teams is None:
+			teams = self.state['teams']
+
+		config = self.state['config']
+
+		if isinstance(teams, team.TeamStore):
+			return teams.points(config['POINTS_ON_WIN'], config['POINTS_ON_TIE'],
+				config['POINTS_ON_LOSS'])
+
+		return np.array([self.calc_team_points(t) for t in teams],
+			dtype=np.int64)
+
+	@ss_prof.timed('standings')
+	def clinch_status(self):
+		# ClinchStatus of every team, by team id- whether it is sure to finish
+		# first, can no longer finish first or neither, given the games left
+		# in the schedule. See season_sim_clinch. Once asked for it is kept up
+		# to date after every week, and only teams still ALIVE are rechecked.
+		# Raises ValidationError while a Swiss schedule has weeks to pair
+		state = self.state
+		index = state['clinch']
+
+		if index is None or not index.is_current(state['teams'], state['config']):
+			index = ss_clinch.ClinchIndex(state['teams'], state['schedule'],
+				state['current_week'], state['config'])
+			state['clinch'] = index
+		else:
+			index.update(state['schedule'], state['current_week'])
+
+		return list(index.statuses)
+
+	###########################################################################
+	# I/O                                                                     #
+	###########################################################################
+
+	def save(self, save_name):
+		path = save_path(save_name)
+		journal = self.state['journal']
+
+		# Saving to the journaled save only has to append what changed
+		if journal is not None and journal['path'] == path:
+			self.sync_journal()
+		else:
+			ss_io.save_state(self.state, path)
+
+	def start_journal(self, save_name, compact_every=JOURNAL_COMPACT_EVERY):
+		'''
+		Switches to journaled saves. The league is saved in full once, and
+		after that every simulated week (and every save() to the same name)
+		just appends the new games to a journal next to the save. Every
+		compact_every records the journal is compacted into the save, and so
+		is any change to the config or the teams' names and ratings
+		'''
+		state = self.state
+		path = save_path(save_name)
+
+		ss_io.save_state(state, path)
+
+		state['journal'] = {
+			'path': path,
+			'games': len(state['game_log']),
+			'teams': len(state['teams']),
+			'details': self.journal_details(),
+			'current_week': state['current_week'],
+			'records': 0,
+			'compact_every': compact_every,
+		}
+
+	def stop_journal(self):
+		# Compacts the journal and goes back to saving in full
+		if self.state['journal'] is not None:
+			self.compact()
+
+		self.state['journal'] = None
+
+	def sync_journal(self):
+		# Appends everything since the last record to the journal. Changes a
+		# journal can't express (teams added or renamed, the config changed,
+		# the log rewritten) fall back to a full save
+		state = self.state
+		journal = state['journal']
+
+		if len(state['teams']) != journal['teams'] \
+			or len(state['game_log']) < journal['games'] \
+			or not self.same_details(journal['details']):
+			self.compact()
+			return
+
+		if len(state['game_log']) == journal['games'] \
+			and state['current_week'] == journal['current_week']:
+			return
+
+		ss_io.append_journal(state, journal['path'], journal['games'])
+
+		journal['games'] = len(state['game_log'])
+		journal['current_week'] = state['current_week']
+		journal['records'] += 1
+
+		if journal['records'] >= journal['compact_every']:
+			self.compact()
+
+	def compact(self):
+		# Folds the journal into the save by writing the save in full
+		state = self.state
+		journal = state['journal']
+
+		ss_io.save_state(state, journal['path'])
+
+		journal['games'] = len(state['game_log'])
+		journal['teams'] = len(state['teams'])
+		journal['details'] = self.journal_details()
+		journal['current_week'] = state['current_week']
+		journal['records'] = 0
+
+	def journal_details(self):
+		# What journal records don't carry- the config and every team's name
+		# and ratings, as of the last full save
+		teams = self.state['teams']
+
+		if isinstance(teams, team.TeamStore):
+			names = list(teams.names)
+			ratings = np.stack((teams.column('offense'),
+				teams.column('defense')))
+		else:
+			names = [t.name for t in teams]
+			ratings = np.array([[t.offense for t in teams],
+				[t.defense for t in teams]])
+
+		return {
+			'config': dict(self.state['config']),
+			'names': names,
+			'ratings': ratings,
+		}
+
+	def same_details(self, details):
+		# Whether the config, names and ratings are as they were in details
+		current = self.journal_details()
+
+		return current['config'] == details['config'] \
+			and current['names'] == details['names'] \
+			and np.array_equal(current['ratings'], details['ratings'])
+
+	def load(self, ssf_file_name, lazy=False):
+		# The loaded state replaces this league's state in place, so anything
+		# holding on to the state dictionary sees the new league. lazy leaves
+		# already played weeks of the schedule on disk until they are needed
+		state = self.state
+		loaded = ss_io.load_state(find_save(ssf_file_name)
+			or save_path(ssf_file_name), lazy)
+
+		state.clear()
+		state.update(loaded)
+
+		state['active'] = True
+		state['standings'] = None
+		state['journal'] = None
+		state['rng'] = None
+		state['clinch'] = None
+
+		if "game_log" not in state.keys():
+			# Older saves don't carry a game log
+			state['game_log'] = game_log.GameLog()
+
+		if "config" not in state.keys():
+			# Maintain backwards compatability with saves with no config
+			state['config'] = {}
+
+			state['config']['POINTS_ON_WIN'] = 3
+			state['config']['POINTS_ON_LOSS'] = 0
+			state['config']['POINTS_ON_TIE'] = 1
+
+	###########################################################################
+	# Snapshots                                                               #
+	###########################################################################
+
+	def snapshot(self):
+		# Freezes the league as it stands, see season_sim_snapshot. The league
+		# itself carries on as normal
+		return ss_snap.Snapshot(self.state)
+
+	def restore(self, snapshot, branch=None):
+		# Winds the league back (or forward) to a snapshot. The state is
+		# replaced in place, as load() does. branch picks the random stream,
+		# see Snapshot.state()
+		self.state.clear()
+		self.state.update(snapshot.state(branch))
+
+	@classmethod
+	def from_snapshot(cls, snapshot, branch=None):
+		# A new league forked from a snapshot
+		league = cls()
+		league.restore(snapshot, branch)
+
+		return league
 
 ###############################################################################
-# Utilities                                                                   #
+# Default league                                                              #
 ###############################################################################
 
-# https://stackoverflow.com/questions/9457832/python-list-rotation gives this
-# function- it rotates a list n positions to the right
-def rotate(list, n):
-    return list[-n:] + list[:-n]
+# The functions below work on this league, which is what the CLI and older
+# code use. state is its state dictionary and always stays the same object-
+# loading a save replaces its contents rather than rebinding it
+default_league = League()
 
-# Utility function- given a team and schedule, it tells you who they play on
-# that specific week
-def check_opponent(team, schedule, week=1):
-	weekly_schedule = schedule[week]
+# Contains the state of the current simulation- teams, week, right now
+state = default_league.state
 
-	for match in weekly_schedule:
-		if team in match:
-			if team == match[0]:
-				return match[1]
-			else:
-				return match[0]
+def startup():
+	default_league.startup()
 
-	# TODO add error handling here
+def schedule(num_teams=0, type=ScheduleType.ROUND_ROBIN):
+	return default_league.schedule(num_teams, type)
+
+def round_robin_schedule(num_teams):
+	return default_league.round_robin_schedule(num_teams)
+
+def double_round_robin_schedule(num_teams):
+	return default_league.double_round_robin_schedule(num_teams)
+
+def knockout_schedule(num_teams, seeds=None):
+	return default_league.knockout_schedule(num_teams, seeds)
+
+def swiss_schedule(num_teams, rounds=None):
+	return default_league.swiss_schedule(num_teams, rounds)
+
+def confirm_schedule(schedule):
+	default_league.confirm_schedule(schedule)
 
 def get_weekly_schedule(week=0):
-	if (week == 0):
-		week = state['current_week']
+	return default_league.get_weekly_schedule(week)
+
+def simulate_matchup(home, away, simulator=biased_proportional, week=None,
+	rng=None):
+	return default_league.simulate_matchup(home, away, simulator, week, rng)
+
+def record_result(home, away, home_score, away_score, week=None):
+	return default_league.record_result(home, away, home_score, away_score,
+		week)
 
-	return state['schedule'][week]
+def simulate_week(schedule=None, week=None, advance=True, batch=False,
+	rng=None, fixed=None):
+	return default_league.simulate_week(schedule, week, advance, batch, rng,
+		fixed)
+
+def simulate_week_batch(schedule, week, bias=None, rng=None, fixed=None):
+	return default_league.simulate_week_batch(schedule, week, bias, rng, fixed)
+
+def simulate_season(schedule=None, batch=False, rng=None):
+	return default_league.simulate_season(schedule, batch, rng)
 
 def add_team_to_state(team_name, team_off, team_def):
-	state['teams'].append(team.Team(team_name, offense=team_off, defense=team_def))
+	default_league.add_team_to_state(team_name, team_off, team_def)
 
-def confirm_schedule(schedule):
-	state['schedule'] = schedule
+def add_teams_to_state(names, offense, defense):
+	default_league.add_teams_to_state(names, offense, defense)
+
+def import_teams(path, format=None):
+	return default_league.import_teams(path, format)
+
+def set_simulator(name):
+	default_league.set_simulator(name)
+
+def seed(seed=None):
+	default_league.seed(seed)
 
 def init_league():
-	state['active'] = True
-	state['current_week'] = 1
+	default_league.init_league()
 
 def calc_team_points(team):
-	return team.results['win'] * state['config']['POINTS_ON_WIN'] \
-		+ team.results['tie'] * state['config']['POINTS_ON_TIE'] \
-		+ team.results['loss'] * state['config']['POINTS_ON_LOSS']
+	return default_league.calc_team_points(team)
 
-###############################################################################
-# I/O Wrappers                                                                #
-###############################################################################
+def standings():
+	return default_league.standings()
+
+def calc_all_points(teams=None):
+	return default_league.calc_all_points(teams)
+
+def clinch_status():
+	return default_league.clinch_status()
 
 def save(save_name):
-	ss_io.save_state(state, "%s.ssf" % save_name)
+	default_league.save(save_name)
+
+def start_journal(save_name, compact_every=JOURNAL_COMPACT_EVERY):
+	default_league.start_journal(save_name, compact_every)
+
+def stop_journal():
+	default_league.stop_journal()
 
-def load(ssf_file_name):
-	# Needs to declare state as global or it will just create a local copy
-	# of state that is destroyed at the end of the function
-	global state
+def sync_journal():
+	default_league.sync_journal()
 
-	state = ss_io.load_state("%s.ssf" % ssf_file_name)
+def compact():
+	default_league.compact()
 
-	state['active'] = True
+def load(ssf_file_name, lazy=False):
+	default_league.load(ssf_file_name, lazy)
 
-	if "config" not in state.keys():
-		# Maintain backwards compatability with saves with no config
-		state['config'] = {}
+def snapshot():
+	return default_league.snapshot()
 
-		state['config']['POINTS_ON_WIN'] = 3
-		state['config']['POINTS_ON_LOSS'] = 0
-		state['config']['POINTS_ON_TIE'] = 1
\ No newline at end of file
+def restore(snapshot, branch=None):
+	default_league.restore(snapshot, branch)
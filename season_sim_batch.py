@@ -0,0 +1,135 @@
+###############################################################################
+#  Batch simulation for season_sim. Rather than simulating one matchup at a   #
+#  time, these functions take a whole week (or a whole schedule) as arrays    #
+#  and produce every score in a few NumPy calls                               #
+###############################################################################
+
+import numpy as np
+
+import team
+import season_sim_rng as ss_rng
+
+# Number of scoring attempts each team gets in biased_proportional
+INNINGS = 5
+
+# The scalar biased_proportional gives each team 5 attempts, and an attempt
+# scores when randint(1, off + def + 2 * bias) <= off + bias. Each attempt is
+# then a Bernoulli trial with the probability below, so a team's score is
+# Binomial(5, p) and a whole week can be drawn in one call per side
+def scoring_probability(offense, defense, bias=10):
+	offense = np.asarray(offense, dtype=np.float64)
+	defense = np.asarray(defense, dtype=np.float64)
+
+	return np.clip((offense + bias) / (offense + defense + 2 * bias), 0.0, 1.0)
+
+def biased_proportional_batch(home_off, home_def, away_off, away_def, bias=10,
+	rng=None):
+	'''
+	Vectorized biased_proportional. Takes arrays of home/away offense and
+	defense ratings (one entry per game) and returns a tuple of arrays of the
+	form (home_scores, away_scores). rng may be a season_sim_rng.RNG or a
+	NumPy Generator
+	'''
+	rng = ss_rng.generator(rng)
+
+	home_p = scoring_probability(home_off, away_def, bias)
+	away_p = scoring_probability(away_off, home_def, bias)
+
+	return (rng.binomial(INNINGS, home_p), rng.binomial(INNINGS, away_p))
+
+def schedule_to_arrays(schedule, weeks=None):
+	'''
+	Flattens a schedule into parallel arrays of (week, home, away), one entry
+	per game. Byes are dropped. If weeks is None every week is included
+	'''
+	if weeks is None:
+		weeks = schedule.keys()
+
+	# Lazy round robins can produce each week as arrays directly
+	if hasattr(schedule, 'arrays'):
+		return arrays_by_week(schedule, weeks)
+
+	week_ids = []
+	home_ids = []
+	away_ids = []
+
+	for week in weeks:
+		for home, away in schedule[week]:
+			if 'BYE' not in (home, away):
+				week_ids.append(week)
+				home_ids.append(home)
+				away_ids.append(away)
+
+	return (np.array(week_ids, dtype=np.int64),
+		np.array(home_ids, dtype=np.int64),
+		np.array(away_ids, dtype=np.int64))
+
+def arrays_by_week(schedule, weeks):
+	# Concatenates schedule.arrays(week) for every week
+	week_ids = []
+	home_ids = []
+	away_ids = []
+
+	for week in weeks:
+		home, away = schedule.arrays(week)
+
+		week_ids.append(np.full(len(home), week, dtype=np.int64))
+		home_ids.append(home)
+		away_ids.append(away)
+
+	if not week_ids:
+		empty = np.zeros(0, dtype=np.int64)
+		return (empty, empty, empty)
+
+	return (np.concatenate(week_ids), np.concatenate(home_ids),
+		np.concatenate(away_ids))
+
+def team_ratings(teams):
+	# Pulls the offense and defense ratings out of a list of teams. A TeamStore
+	# already keeps them as arrays
+	if isinstance(teams, team.TeamStore):
+		return (teams.offense, teams.defense)
+
+	offense = np.fromiter((int(team.offense) for team in teams), dtype=np.int64,
+		count=len(teams))
+	defense = np.fromiter((int(team.defense) for team in teams), dtype=np.int64,
+		count=len(teams))
+
+	return (offense, defense)
+
+def simulate_games(teams, home_ids, away_ids, bias=10, rng=None):
+	'''
+	Simulates every game given by the home_ids/away_ids arrays (indexes into
+	teams) and returns the (home_scores, away_scores) arrays. Team results are
+	not touched- that is left to the caller
+	'''
+	offense, defense = team_ratings(teams)
+
+	return biased_proportional_batch(offense[home_ids], defense[home_ids],
+		offense[away_ids], defense[away_ids], bias, rng)
+
+def biased_proportional_games(teams, home_ids, away_ids, rng=None, bias=10):
+	# simulate_games in the simulator registry's batch form
+	return simulate_games(teams, home_ids, away_ids, bias, rng)
+
+def flip_coin_batch(teams, home_ids, away_ids, rng=None):
+	# Vectorized flip_coin- heads (0) is a home win
+	flips = ss_rng.generator(rng).integers(0, 2, size=len(home_ids))
+
+	return (1 - flips, flips)
+
+def home_win_batch(teams, home_ids, away_ids, rng=None):
+	# Vectorized home_win
+	return (np.ones(len(home_ids), dtype=np.int64),
+		np.zeros(len(home_ids), dtype=np.int64))
+
+def flip_coin_outcomes(teams, home_ids, away_ids):
+	# Exact flip_coin odds- an even chance either way, never a tie
+	half = np.full(len(home_ids), 0.5)
+
+	return (half, np.zeros(len(home_ids)), half)
+
+def home_win_outcomes(teams, home_ids, away_ids):
+	# Exact home_win odds
+	return (np.ones(len(home_ids)), np.zeros(len(home_ids)),
+		np.zeros(len(home_ids)))
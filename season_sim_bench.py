@@ -0,0 +1,281 @@
+###############################################################################
+#  Benchmark suite for season_sim. Times the hot paths at several league      #
+#  sizes, records ops/sec and peak memory, and compares them to a saved       #
+#  baseline. Run it like a normal python program:                             #
+#                                                                             #
+#      python season_sim_bench.py --update    record a new baseline           #
+#      python season_sim_bench.py             compare against the baseline    #
+#                                                                             #
+#  It exits with status 1 if anything regressed past the threshold            #
+###############################################################################
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import season_sim as ss
+import season_sim_cli as ss_cli
+
+DEFAULT_SIZES = (10, 100, 1000, 10000)
+DEFAULT_BASELINE = 'season_sim_bench_baseline.json'
+
+# A result regresses if it gets this much slower (or uses this much more
+# memory) than the baseline
+DEFAULT_THRESHOLD = 0.25
+
+# Each benchmark is repeated until it has run for at least this long, and the
+# fastest repeat is kept
+MIN_TIME = 0.2
+MAX_REPEATS = 50
+
+# Big leagues have too many weeks to play them all- seasons are cut off at
+# this many weeks, and ops/sec is per game so the numbers stay comparable
+SEASON_WEEKS = 20
+
+# Number of weeks of pairings generated in the scheduling benchmark
+SCHEDULE_WEEKS = 10
+
+# Directory the save/load benchmarks write to, see run_benchmarks()
+work_dir = None
+
+def make_league(num_teams, seed=1):
+	ss.startup()
+
+	for i in range(num_teams):
+		ss.add_team_to_state("Team %d" % i, i % 50, (7 * i) % 50)
+
+	ss.round_robin_schedule(num_teams)
+	ss.init_league()
+	ss.seed(seed)
+
+def games_per_week(num_teams):
+	return num_teams // 2
+
+###############################################################################
+# Benchmarks                                                                  #
+###############################################################################
+
+# Every benchmark is a function taking the number of teams and returning
+# (setup, run, work). setup() is called before every repeat and is not timed;
+# run() is timed, and did work units of work (games, matchups, rows...)
+
+def bench_round_robin_schedule(num_teams):
+	# Builds the schedule and generates the pairings of its first weeks
+	def run():
+		sched = ss.round_robin_schedule(num_teams)
+
+		for week in range(1, min(SCHEDULE_WEEKS, len(sched)) + 1):
+			sched[week]
+
+	weeks = min(SCHEDULE_WEEKS, num_teams - 1 + num_teams % 2)
+
+	return (lambda: None, run, weeks * ((num_teams + 1) // 2))
+
+def bench_simulate_week(num_teams):
+	return (lambda: make_league(num_teams), lambda: ss.simulate_week(),
+		games_per_week(num_teams))
+
+def bench_simulate_week_batch(num_teams):
+	return (lambda: make_league(num_teams),
+		lambda: ss.simulate_week(batch=True), games_per_week(num_teams))
+
+def bench_simulate_season(num_teams):
+	weeks = min(SEASON_WEEKS, len(ss.build_round_robin(num_teams)))
+
+	def run():
+		for week in range(1, weeks + 1):
+			ss.simulate_week()
+
+	return (lambda: make_league(num_teams), run,
+		weeks * games_per_week(num_teams))
+
+def bench_print_table(num_teams):
+	def setup():
+		make_league(num_teams)
+		ss.simulate_week(batch=True)
+
+	def run():
+		with contextlib.redirect_stdout(io.StringIO()):
+			ss_cli.print_table()
+
+	return (setup, run, num_teams)
+
+def bench_save(extension):
+	def bench(num_teams):
+		path = os.path.join(work_dir, 'bench%d%s' % (num_teams, extension))
+
+		def setup():
+			make_league(num_teams)
+			ss.simulate_week(batch=True)
+
+		return (setup, lambda: ss.save(path), num_teams)
+
+	return bench
+
+def bench_load(extension):
+	def bench(num_teams):
+		path = os.path.join(work_dir, 'bench%d%s' % (num_teams, extension))
+
+		make_league(num_teams)
+		ss.simulate_week(batch=True)
+		ss.save(path)
+
+		return (lambda: None, lambda: ss.load(path), num_teams)
+
+	return bench
+
+BENCHMARKS = {
+	'round_robin_schedule': bench_round_robin_schedule,
+	'simulate_week': bench_simulate_week,
+	'simulate_week_batch': bench_simulate_week_batch,
+	'simulate_season': bench_simulate_season,
+	'print_table': bench_print_table,
+	'save_ssf': bench_save('.ssf'),
+	'load_ssf': bench_load('.ssf'),
+	'save_ssb': bench_save('.ssb'),
+	'load_ssb': bench_load('.ssb'),
+}
+
+###############################################################################
+# Running and comparing                                                       #
+###############################################################################
+
+def measure(benchmark, num_teams):
+	# Returns {'ops_per_sec', 'peak_bytes'} for one benchmark at one size
+	setup, run, work = benchmark(num_teams)
+
+	best = float('inf')
+	elapsed = 0.0
+	repeats = 0
+
+	while repeats < MAX_REPEATS and (elapsed < MIN_TIME or repeats < 3):
+		setup()
+
+		start = time.perf_counter()
+		run()
+		taken = time.perf_counter() - start
+
+		best = min(best, taken)
+		elapsed += taken
+		repeats += 1
+
+	# Peak memory is measured on a separate run, as tracing slows everything
+	# down and would skew the timings
+	setup()
+	tracemalloc.start()
+	run()
+	_, peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+
+	return {
+		'ops_per_sec': work / best if best > 0 else float('inf'),
+		'peak_bytes': peak,
+	}
+
+def run_benchmarks(sizes, names, output=sys.stdout):
+	global work_dir
+
+	results = {}
+	work_dir = tempfile.mkdtemp(prefix='season_sim_bench')
+
+	try:
+		for name in names:
+			for num_teams in sizes:
+				key = '%s[%d]' % (name, num_teams)
+				results[key] = measure(BENCHMARKS[name], num_teams)
+
+				output.write('%-32s %14.1f ops/sec %10.1f KiB peak\n' % (key,
+					results[key]['ops_per_sec'],
+					results[key]['peak_bytes'] / 1024))
+				output.flush()
+	finally:
+		shutil.rmtree(work_dir, ignore_errors=True)
+		work_dir = None
+
+	return results
+
+def compare(results, baseline, threshold):
+	# Returns a list of regression messages, empty if nothing regressed
+	regressions = []
+
+	for key, result in results.items():
+		if key not in baseline:
+			continue
+
+		old = baseline[key]
+
+		if result['ops_per_sec'] < old['ops_per_sec'] * (1 - threshold):
+			regressions.append('%s: %.1f ops/sec, baseline %.1f' % (key,
+				result['ops_per_sec'], old['ops_per_sec']))
+
+		# Tiny allocations are noisy, so memory is only compared past 64KiB
+		if result['peak_bytes'] > max(old['peak_bytes'] * (1 + threshold),
+			64 * 1024):
+			regressions.append('%s: %d bytes peak, baseline %d' % (key,
+				result['peak_bytes'], old['peak_bytes']))
+
+	return regressions
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='season_sim benchmarks')
+	parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+		help='comma separated league sizes (default: %(default)s)')
+	parser.add_argument('--only', default=','.join(BENCHMARKS),
+		help='comma separated benchmarks to run (default: all)')
+	parser.add_argument('--baseline', default=DEFAULT_BASELINE,
+		help='baseline file (default: %(default)s)')
+	parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+		help='allowed slowdown before failing (default: %(default)s)')
+	parser.add_argument('--update', action='store_true',
+		help='record the results as the new baseline')
+	args = parser.parse_args(argv)
+
+	sizes = [int(size) for size in args.sizes.split(',')]
+	names = args.only.split(',')
+
+	for name in names:
+		if name not in BENCHMARKS:
+			parser.error('unknown benchmark %s' % name)
+
+	results = run_benchmarks(sizes, names)
+
+	if args.update:
+		baseline = {}
+
+		# Keep entries for benchmarks/sizes that weren't rerun
+		if os.path.isfile(args.baseline):
+			with open(args.baseline) as baseline_file:
+				baseline = json.load(baseline_file)
+
+		baseline.update(results)
+
+		with open(args.baseline, 'w') as baseline_file:
+			json.dump(baseline, baseline_file, indent=1, sort_keys=True)
+
+		print('Baseline written to %s' % args.baseline)
+		return 0
+
+	if not os.path.isfile(args.baseline):
+		print('No baseline at %s- run with --update to record one' %
+			args.baseline)
+		return 0
+
+	with open(args.baseline) as baseline_file:
+		baseline = json.load(baseline_file)
+
+	regressions = compare(results, baseline, args.threshold)
+
+	for regression in regressions:
+		print('REGRESSION %s' % regression)
+
+	return 1 if regressions else 0
+
+if __name__ == '__main__':
+	sys.exit(main())
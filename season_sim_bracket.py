@@ -0,0 +1,210 @@
+###############################################################################
+#  Knockout odds for season_sim. Every team's exact chance of getting through #
+#  each round of a single elimination bracket comes from the pairwise odds   #
+#  of its possible opponents, one round at a time. Simulators that can't    #
+#  give exact odds fall back to playing the bracket out many times          #
+###############################################################################
+
+import numpy as np
+
+import schedules
+import season_sim as ss
+import season_sim_mc as ss_mc
+import season_sim_rng as ss_rng
+import season_sim_simulators as ss_sim
+
+# Pairings worked out per block when building the matrix of win odds
+BLOCK_PAIRS = 1 << 18
+
+# Brackets played out by the Monte Carlo fallback unless told otherwise
+TOURNAMENTS = 1000
+
+def bracket_odds(teams=None, schedule=None, config=None, bias=None,
+	tournaments=TOURNAMENTS, seed=None, rng=None):
+	'''
+	Each team's chance of getting through every round of a knockout
+	bracket (default: the current league's), given the results so far.
+	Games are played with the config's simulator (default: the league's),
+	and bias, if given, is passed on to it.
+
+	When the simulator has exact odds (see season_sim_simulators) the
+	answer is exact: in round r a team goes through with its chance of
+	having got this far times the chance it beats whoever comes out of the
+	other half of its block, and those two are independent. That is one
+	pass over each pair of teams that could meet, O(n^2) in all. Otherwise
+	tournaments brackets are played out with rng (or a new RNG(seed)).
+
+	Returns a dictionary with
+		'names'    - team names, in team order
+		'reach'    - array[team, rounds] where column r is the chance of
+		             getting through r rounds (a bye counts)- so of playing
+		             in round r + 1, or for the last column, winning it all
+		'champion' - array[team] of title odds, the last column of 'reach'
+		'exact'    - whether the odds are exact or from Monte Carlo
+	'''
+	if teams is None:
+		teams = ss.state['teams']
+
+	if schedule is None:
+		schedule = ss.state['schedule']
+
+	if config is None:
+		config = ss.state['config']
+
+	if not isinstance(schedule, schedules.KnockoutSchedule):
+		raise TypeError('bracket odds need a knockout schedule, not %r' %
+			(schedule,))
+
+	simulator = ss_sim.for_config(config)
+	options = {} if bias is None else {'bias': bias}
+
+	if simulator.outcomes is not None:
+		alive = exact_rounds(teams, schedule, simulator, options)
+	else:
+		if rng is None:
+			rng = ss_rng.RNG(seed)
+
+		alive = simulate_rounds(teams, schedule, simulator, options,
+			tournaments, ss_rng.generator(rng))
+
+	# alive[r] is by starting bracket position- put it back in team order
+	first = schedule.slots[0]
+	real = first >= 0
+	reach = np.zeros((schedule.num_teams, schedule.rounds + 1))
+	reach[first[real]] = alive[:, real].T
+
+	return {
+		'names': [t.name for t in teams],
+		'reach': reach,
+		'champion': reach[:, -1],
+		'exact': simulator.outcomes is not None,
+	}
+
+def win_matrix(teams, schedule, simulator, options):
+	'''
+	Array[position, position] of the chance that the team starting in one
+	bracket position beats the team starting in another, should they meet.
+	The better seed is at home and goes through on a tie, so each pair only
+	needs working out once, better seed first. Byes' rows and columns are
+	left at 0
+	'''
+	first = schedule.slots[0]
+	size = len(first)
+
+	# by_seed[s] is the team seeded s. In seed order the better seed of a
+	# pair is the row of the upper triangle
+	by_seed = np.zeros(schedule.num_teams, dtype=np.int64)
+	by_seed[schedule.seed] = np.arange(schedule.num_teams)
+
+	wins = np.zeros((size, size))
+	better, worse = np.triu_indices(schedule.num_teams, 1)
+
+	for start in range(0, len(better), BLOCK_PAIRS):
+		rows = better[start:start + BLOCK_PAIRS]
+		cols = worse[start:start + BLOCK_PAIRS]
+		home_win, tie, _ = simulator.outcomes(teams, by_seed[rows],
+			by_seed[cols], **options)
+
+		wins[rows, cols] = home_win + tie
+		wins[cols, rows] = 1 - wins[rows, cols]
+
+	# Seed s starts in the position where bracket_order() has s
+	order = schedules.bracket_order(size)
+	order = np.where(order < schedule.num_teams, order, 0)
+	wins = wins[np.ix_(order, order)]
+	wins[first < 0] = 0
+	wins[:, first < 0] = 0
+
+	return wins
+
+def exact_rounds(teams, schedule, simulator, options):
+	# Array[rounds, position] of the exact chance the team starting in each
+	# bracket position gets through each number of rounds
+	wins = win_matrix(teams, schedule, simulator, options)
+	size = len(schedule.slots[0])
+	alive = np.zeros((schedule.rounds + 1, size))
+	alive[0] = schedule.slots[0] >= 0
+
+	for rounds in range(1, schedule.rounds + 1):
+		half = 1 << (rounds - 1)
+		blocks = size // (2 * half)
+		block = np.arange(blocks)
+
+		# Each block of 2 * half positions produces one winner, out of the
+		# winners of its two halves. Only the block's own corner of the
+		# matrix is needed- top half against bottom half
+		corner = wins.reshape(blocks, 2 * half, blocks, 2 * half)[block, :,
+			block, :]
+		previous = alive[rounds - 1].reshape(blocks, 2, half)
+
+		top = previous[:, 0] * np.einsum('kij,kj->ki', corner[:, :half, half:],
+			previous[:, 1])
+		bottom = previous[:, 1] * np.einsum('kij,kj->ki',
+			corner[:, half:, :half], previous[:, 0])
+
+		alive[rounds] = np.stack((top, bottom), axis=1).ravel()
+		settle(alive[rounds], schedule, rounds)
+
+	return alive
+
+def settle(alive, schedule, rounds):
+	# Overwrites the odds of positions whose game in a round has already been
+	# decided (or was a bye) with what actually happened
+	first = schedule.slots[0]
+	winners = schedule.slots[rounds][np.arange(len(first)) >> rounds]
+	known = winners >= 0
+
+	alive[known] = first[known] == winners[known]
+
+def simulate_rounds(teams, schedule, simulator, options, tournaments, rng):
+	'''
+	Monte Carlo version of exact_rounds() for simulators without exact odds-
+	plays the rest of the bracket tournaments times and counts how often the
+	team starting in each position gets through each number of rounds
+	'''
+	first = schedule.slots[0]
+	size = len(first)
+	alive = np.zeros((schedule.rounds + 1, size))
+	alive[0] = first >= 0
+
+	if schedule.rounds == 0:
+		return alive
+
+	seed = schedule.seed
+	block = max(1, ss_mc.BLOCK_GAMES // size)
+
+	for start in range(0, tournaments, block):
+		count = min(block, tournaments - start)
+
+		# Starting positions of the teams still in, for each tournament
+		positions = np.tile(np.arange(size), (count, 1))
+
+		for rounds in range(1, schedule.rounds + 1):
+			pairs = positions.reshape(count, -1, 2)
+			decided = schedule.slots[rounds]
+			known = decided >= 0
+			winners = np.where(first[pairs[..., 0]] == decided,
+				pairs[..., 0], pairs[..., 1])
+
+			# Play the games that haven't happened yet, better seed at home
+			teams_a = first[pairs[:, ~known, 0]]
+			teams_b = first[pairs[:, ~known, 1]]
+			swap = seed[teams_b] < seed[teams_a]
+			home = np.where(swap, teams_b, teams_a).ravel()
+			away = np.where(swap, teams_a, teams_b).ravel()
+
+			if len(home):
+				home_scores, away_scores = simulator.simulate_games(teams, home,
+					away, rng, **options)
+				home_through = (np.asarray(home_scores)
+					>= np.asarray(away_scores)).reshape(count, -1)
+				a_through = home_through != swap
+				winners[:, ~known] = np.where(a_through, pairs[:, ~known, 0],
+					pairs[:, ~known, 1])
+
+			alive[rounds] += np.bincount(winners.ravel(), minlength=size)
+			positions = winners
+
+	alive[1:] /= tournaments
+
+	return alive
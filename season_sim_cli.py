@@ -5,9 +5,16 @@
 
 
 import season_sim as ss
+import season_sim_mc as ss_mc
+import season_sim_profile as ss_prof
+import season_sim_import as ss_import
+import season_sim_simulators as ss_sim
 import team as team
 import season_sim_errors as ss_err
-import os.path
+import argparse
+import contextlib
+import io
+import sys
 
 def startup():
 	print("Welcome to season sim!")
@@ -68,6 +75,24 @@ def idle():
 			else:
 				print("No active league to simulate")
 
+		if cmd == "j" or cmd == "journal":
+			if is_active_league():
+				journal_league()
+			else:
+				print("No active league to journal")
+
+		if cmd == "m" or cmd == "monte carlo":
+			if is_active_league():
+				sim_many_seasons()
+			else:
+				print("No active league to simulate")
+
+		if cmd == "p" or cmd == "profile":
+			profile()
+
+		if cmd == "sim" or cmd == "simulator":
+			choose_simulator()
+
 # Simulates games and then prints the output
 def sim_week():
 	try:
@@ -76,40 +101,69 @@ def sim_week():
 		print('Error: Cannot sim more as you have reached the end of the season')
 		return
 
-	for matchup in games:
-		print("%s %d-%d %s" % (matchup[0], matchup[1], matchup[3], matchup[2]))
+	print(format_games(games))
 
 def sim_rest_of_season():
-	games = ss.simulate_season()
+	weeks = ss.simulate_season()
+
+	print('\n'.join(format_games(games) for games in weeks if games))
+
+# Results of a week as one string, a line per game. Built in one go rather
+# than printed game by game, as printing dominates for big leagues
+def format_games(games):
+	return '\n'.join("%s %d-%d %s" % (matchup[0], matchup[1], matchup[3],
+		matchup[2]) for matchup in games)
 
-	#for matchup in games:
-		#print("%s %d-%d %s" % (matchup[0], matchup[1], matchup[3], matchup[2]))
+# Replays the league's season many times and prints every team's title odds
+# and average points, best odds first
+def sim_many_seasons():
+	seasons = input("How many seasons would you like to simulate -> ")
+
+	if not seasons.isdigit() or int(seasons) == 0:
+		print("Number of seasons must be a positive whole number")
+		return
+
+	result = ss_mc.simulate_many_seasons(int(seasons))
+
+	longest_name = length_of_longest_name()
+	offset = result['points_offset']
+	points = range(offset, offset + result['points'].shape[1])
+
+	print("Name".ljust(longest_name) + "| Title % | Avg Pts")
+	print("-" * longest_name + "+---------+--------")
+
+	for index in sorted(range(len(result['names'])),
+		key=lambda index: -result['titles'][index]):
+		average = (result['points'][index] * points).sum() / result['seasons']
+
+		print("%s|%8.2f |%7.2f" % (result['names'][index].ljust(longest_name),
+			100 * result['titles'][index], average))
 
 # Prints the current standings- need a header, second row, and then all of
 # the teams
 def print_table():
-	top_row = get_header()
+	print(format_table())
 
-	print(top_row)
+def format_table():
+	# The standings index keeps teams in table order and knows the widest
+	# name, so rendering is a single pass over the teams
+	standings = ss.standings()
+	longest_name = standings.name_width
 
-	print(get_second_row())
+	rows = [get_header(longest_name), get_second_row(longest_name)]
 
-	# Loop through teams twice to sort by the points, desc, and then again to 
-	# actually display them. We could redo this to sort in a better order but
-	# right now it's fine
-	for team in sorted(ss.state['teams'], key=lambda team: -ss.calc_team_points(team)):
-		print(get_team_table_row(team))
-	
+	for team_id in standings.iter_ranked():
+		rows.append(get_team_table_row(standings.teams[team_id], longest_name))
 
-def get_header():
-	longest_name = length_of_longest_name()
+	return '\n'.join(rows)
 
-	list_to_stringify = []
+def get_header(longest_name=None):
+	if longest_name is None:
+		longest_name = length_of_longest_name()
 
-	list_to_stringify.append("Name")
+	list_to_stringify = []
 
-	for i in range(longest_name - 4):
-		list_to_stringify.append(" ")
+	list_to_stringify.append("Name".ljust(longest_name))
 
 	list_to_stringify.append("|")
 
@@ -117,13 +171,13 @@ def get_header():
 
 	return ''.join(list_to_stringify)
 
-def get_second_row():
-	longest_name = length_of_longest_name()
+def get_second_row(longest_name=None):
+	if longest_name is None:
+		longest_name = length_of_longest_name()
 
 	list_to_stringify = []
 
-	for i in range(longest_name):
-		list_to_stringify.append("-")
+	list_to_stringify.append("-" * longest_name)
 
 	list_to_stringify.append("+")
 
@@ -131,25 +185,25 @@ def get_second_row():
 
 	return ''.join(list_to_stringify)
 
-def get_team_table_row(team):
-	list_to_stringify = []
+def get_team_table_row(team, longest_name=None):
+	if longest_name is None:
+		longest_name = length_of_longest_name()
 
-	list_to_stringify.append(team.name)
+	list_to_stringify = []
 
-	for i in range(length_of_longest_name() - len(team.name)):
-		list_to_stringify.append(" ")
+	list_to_stringify.append(team.name.ljust(longest_name))
 
 	list_to_stringify.append("|")
 
-	list_to_stringify.append(str(team.results['win']).rjust(3))
+	list_to_stringify.append(str(team.wins).rjust(3))
 
 	list_to_stringify.append("|")
 
-	list_to_stringify.append(str(team.results['loss']).rjust(3))
+	list_to_stringify.append(str(team.losses).rjust(3))
 
 	list_to_stringify.append("|")
 
-	list_to_stringify.append(str(team.results['tie']).rjust(3))
+	list_to_stringify.append(str(team.ties).rjust(3))
 
 	list_to_stringify.append("|")
 
@@ -170,6 +224,15 @@ def length_of_longest_name():
 def is_active_league():
 	return ss.state['active']
 
+# League types the "new" commands accept- round robin, double round robin,
+# single elimination and Swiss
+LEAGUE_TYPES = {
+	'RR': ss.ScheduleType.ROUND_ROBIN,
+	'DRR': ss.ScheduleType.DOUBLE_ROUND_ROBIN,
+	'SE': ss.ScheduleType.SINGLE_ELIMINATION,
+	'SWISS': ss.ScheduleType.SWISS,
+}
+
 # This corresponds to the "new" command. It will guide the user through setting
 # up a new league, by selecting team insertion and competition type
 def new_league():
@@ -184,10 +247,15 @@ def new_league():
 		status = get_new_team()
 
 	# Now, make the schedule
-	league_type = input("What type of league would you like? RR, DRR, or SE -> ")
-	league_type_enum = ss.ScheduleType.ROUND_ROBIN
+	league_type_enum = None
 
-	# Insert logic for switching league type
+	while league_type_enum is None:
+		league_type = input("What type of league would you like? RR, DRR, SE, " +
+			"or SWISS -> ")
+		league_type_enum = LEAGUE_TYPES.get(league_type.strip().upper())
+
+		if league_type_enum is None:
+			print("Unknown league type %s" % league_type)
 
 	# Schedule the season
 	sched = ss.schedule(type=league_type_enum)
@@ -208,20 +276,21 @@ def get_new_team():
 	if (team_info == "DONE"):
 		return False
 
-	team_info = team_info.split()
+	try:
+		ss.add_team_to_state(*parse_team_info(team_info))
+	except ss_err.ValidationError as e:
+		print(e)
 
-	# Validate that we get 3 inputs, and then ensure the second and third are
-	# really numbers
-	if (len(team_info) != 3 or type(team_info) is not list):
-		print ("Must input 3 attributes to insert a new team")
-		return True
+	return True
 
-	if (not is_number(team_info[1])) or (not is_number(team_info[2])):
-		print ("Attributes 2 and 3 (offense and defense) must be numeric")
-		return True
+# Turns a "[name] [off] [def]" line into (name, offense, defense), raising a
+# ValidationError if it is malformed or the name is taken
+def parse_team_info(team_info):
+	teams = ss.state['teams']
+	names, offense, defense = ss_import.validate_rows([team_info.split()],
+		existing_names=[team.name for team in teams])
 
-	ss.add_team_to_state(team_info[0], team_info[1], team_info[2])
-	return True
+	return (names[0], int(offense[0]), int(defense[0]))
 
 def check_status():
 	# This just outputs a quick look at the current league teams and schedule
@@ -243,36 +312,263 @@ def check_status():
 			 	ss.state['teams'][matchup[1]].name))
 
 def save_league():
+	# Ending the name in .ssb saves in the binary format
 	save_name = input("What would you like to name your league save -> ")
 	ss.save(save_name)
 
 	print("League saved!")
 
+# Turns journaling on or off. While it is on, every simulated week is appended
+# to the save instead of the whole save being rewritten
+def journal_league():
+	if ss.state['journal'] is not None:
+		ss.stop_journal()
+		print("Journal compacted and turned off")
+		return
+
+	save_name = input("What save should be journaled to -> ")
+	ss.start_journal(save_name)
+
+	print("Journaling every week to %s" % ss.state['journal']['path'])
+
+# Turns profiling on, or prints what was recorded since it was turned on and
+# turns it off again
+def profile():
+	if not ss_prof.enabled:
+		ss_prof.enable()
+		print("Profiling on- use (p) or (profile) again to see the results")
+		return
+
+	ss_prof.disable()
+	print(ss_prof.format_report())
+
+# Lists the registered simulators and lets the user pick the one the league
+# plays with. It is kept in the league's config, so it is saved with it
+def choose_simulator():
+	current = ss_sim.for_config(ss.state['config']).name
+
+	for name in ss_sim.names():
+		print("%s %s- %s" % ('*' if name == current else ' ', name,
+			ss_sim.registry[name].description))
+
+	name = input("Which simulator should the league use -> ").strip()
+
+	if not name:
+		return
+
+	try:
+		ss.set_simulator(name)
+	except ss_err.ValidationError as e:
+		print(e)
+		return
+
+	print("League now uses %s" % name)
+
 def load_league():
 	# TODO: print a list for the user to choose from
 	ssf_file_name = input("What league would you like to load? ")
 
-	if os.path.isfile("%s.ssf" % ssf_file_name):
+	if ss.find_save(ssf_file_name):
 		ss.load(ssf_file_name)
 		print("League loaded!")
 	else:
-		print("No file with name %s.ssf exists" % ssf_file_name)
+		print("No save with name %s exists (.ssf or .ssb)" % ssf_file_name)
+
+
+
+###############################################################################
+# Batch mode                                                                  #
+###############################################################################
+
+# Commands can also be given on the command line or in a command file, and are
+# then run without any prompts:
+#
+#     new [team file] [type]
+#                        start a new league from a csv, json or txt team file.
+#                        type is RR (the default), DRR, SE or SWISS
+#     week [N]           simulate N weeks (default 1)
+#     rest               simulate the rest of the season
+#     table              print the standings
+#     check              print the teams and this week's schedule
+#     seed [N]           seed the league's random stream
+#     simulator [name]   pick the simulator games are played with
+#     save [name]        save the league
+#     load [name]        load a league
+#
+# A command file has one command per line, # starts a comment. Output is
+# collected and written in bulk rather than line by line
+
+# Output is written out once this many characters have been collected
+BATCH_BUFFER_SIZE = 1 << 20
+
+# Command -> (min, max) number of arguments
+BATCH_COMMANDS = {
+	'new': (1, 2),
+	'week': (0, 1),
+	'rest': (0, 0),
+	'table': (0, 0),
+	'check': (0, 0),
+	'seed': (1, 1),
+	'simulator': (1, 1),
+	'save': (1, 1),
+	'load': (1, 1),
+}
+
+def parse_commands(tokens):
+	# Splits command line tokens, e.g. "new teams.txt week 3 table", into
+	# [command, args...] lists
+	commands = []
+
+	for token in tokens:
+		if token in BATCH_COMMANDS:
+			commands.append([token])
+		elif commands and len(commands[-1]) <= BATCH_COMMANDS[commands[-1][0]][1]:
+			commands[-1].append(token)
+		else:
+			raise ss_err.ValidationError("Unexpected argument %s" % token, tokens)
+
+	return commands
+
+def read_command_file(path):
+	commands = []
+
+	with open(path) as command_file:
+		for line in command_file:
+			line = line.split('#', 1)[0].split()
+
+			if line:
+				commands.append(line)
+
+	return commands
+
+def run_batch(commands, output=None):
+	'''
+	Runs [command, args...] lists in order, writing their output to output
+	(default: stdout). Stops at the first command that fails.
+
+	Returns the exit status- 0 if every command ran, 1 otherwise
+	'''
+	if output is None:
+		output = sys.stdout
+
+	buffer = io.StringIO()
+
+	try:
+		for command in commands:
+			with contextlib.redirect_stdout(buffer):
+				run_batch_command(command)
+
+			if buffer.tell() >= BATCH_BUFFER_SIZE:
+				output.write(buffer.getvalue())
+				buffer = io.StringIO()
+	except (ss_err.ValidationError, ss_err.EndOfSeasonError, OSError,
+		ValueError) as e:
+		# ValueError covers corrupt saves (json.JSONDecodeError and friends)
+		output.write(buffer.getvalue())
+		output.flush()
+		sys.stderr.write("Error in '%s': %s\n" % (' '.join(command), e))
+		return 1
+
+	output.write(buffer.getvalue())
+	output.flush()
+	return 0
+
+def run_batch_command(command):
+	name, args = command[0], command[1:]
+
+	if name not in BATCH_COMMANDS:
+		raise ss_err.ValidationError("Unknown command %s" % name, command)
+
+	low, high = BATCH_COMMANDS[name]
+
+	if not low <= len(args) <= high:
+		raise ss_err.ValidationError("%s takes %d to %d arguments" % (name, low,
+			high), command)
+
+	if name not in ('new', 'load') and not is_active_league():
+		raise ss_err.ValidationError("No active league", command)
+
+	if name == 'new':
+		league_type = args[1].upper() if len(args) > 1 else 'RR'
 
+		if league_type not in LEAGUE_TYPES:
+			raise ss_err.ValidationError("League type must be one of %s" %
+				', '.join(LEAGUE_TYPES), command)
 
+		batch_new_league(args[0], LEAGUE_TYPES[league_type])
+
+	if name == 'week':
+		weeks = args[0] if args else '1'
+
+		if not weeks.isdigit():
+			raise ss_err.ValidationError("Number of weeks must be a whole number",
+				command)
+
+		for week in range(int(weeks)):
+			print(format_games(ss.simulate_week()))
+
+	if name == 'rest':
+		sim_rest_of_season()
+
+	if name == 'table':
+		print_table()
+
+	if name == 'check':
+		check_status()
+
+	if name == 'seed':
+		if not args[0].isdigit():
+			raise ss_err.ValidationError("Seed must be a whole number", command)
+
+		ss.seed(int(args[0]))
+
+	if name == 'simulator':
+		ss.set_simulator(args[0])
+
+	if name == 'save':
+		ss.save(args[0])
+
+	if name == 'load':
+		if not ss.find_save(args[0]):
+			raise ss_err.ValidationError("No save with name %s exists (.ssf or .ssb)"
+				% args[0], command)
+
+		ss.load(args[0])
+
+# Starts a new league (round robin unless told otherwise) from a team file
+# (csv, json, or one "[name] [off] [def]" per line). Starting a new league
+# replaces the current one, so one command file can run many leagues
+def batch_new_league(team_file_name, league_type=ss.ScheduleType.ROUND_ROBIN):
+	ss.startup()
+	ss.import_teams(team_file_name)
+
+	ss.schedule(type=league_type)
+	ss.init_league()
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='Season sim. Without any '
+		'commands it starts the interactive interpreter')
+	parser.add_argument('commands', nargs='*', help='commands to run, e.g. '
+		'new teams.txt week 3 table save league')
+	parser.add_argument('-f', '--file', help='file of commands to run, one per '
+		'line')
+	args = parser.parse_args(argv)
+
+	if not args.commands and args.file is None:
+		startup()
+		return 0
+
+	try:
+		commands = parse_commands(args.commands)
 
-# Number validation tool stolen from 
-# https://stackoverflow.com/questions/354038/how-do-i-check-if-a-string-is-a-number-float
-def is_number(s):
-    try:
-        float(s)
-        return True
-    except ValueError:
-        return False
+		if args.file is not None:
+			commands = read_command_file(args.file) + commands
+	except (ss_err.ValidationError, OSError) as e:
+		parser.error(str(e))
 
-def main():
-	startup()
+	return run_batch(commands)
 
 if __name__ == "__main__":
     # execute only if run as a script
-    main()
+    sys.exit(main())
 
@@ -0,0 +1,434 @@
+###############################################################################
+#  Clinch and elimination detection for season_sim. Whether a team can      #
+#  still finish first is a flow problem- the points left to play for have   #
+#  to be shared out among its rivals without any of them passing it- so     #
+#  it is answered with a max-flow rather than by trying every result        #
+###############################################################################
+
+from enum import Enum
+import math
+
+import numpy as np
+
+import season_sim_batch as ss_batch
+import season_sim_errors as ss_err
+
+# Passes of shares_fit() before falling back on a max-flow
+SHARE_ROUNDS = 50
+
+class ClinchStatus(Enum):
+	ALIVE = 0
+	# Finishes first (possibly level on points) whatever happens
+	CLINCHED = 1
+	# Finishes below someone on points whatever happens
+	ELIMINATED = 2
+
+def points_config(config):
+	# (win, tie, loss) points. Both checks assume loss <= tie <= win and
+	# the flow needs whole numbers
+	points = (config['POINTS_ON_WIN'], config['POINTS_ON_TIE'],
+		config['POINTS_ON_LOSS'])
+
+	if any(int(value) != value for value in points):
+		raise ValueError('Clinch detection needs whole number points, got %s' %
+			(points,))
+
+	win, tie, loss = (int(value) for value in points)
+
+	if not loss <= tie <= win:
+		raise ValueError('Clinch detection needs loss <= tie <= win, got %s' %
+			(points,))
+
+	return (win, tie, loss)
+
+def game_units(points):
+	'''
+	How the flow counts points, as (unit, units per game, exact).
+
+	Beyond the loss points both teams are sure of, a game hands out
+	win - loss (a win) or 2 * (tie - loss) (a tie). The flow lets every game
+	split the smaller of those, in units of unit points, any way it likes.
+	Every real result gives each team at least as much as one of those
+	splits, so a team the flow finds eliminated really is.
+
+	When a tie is worth exactly half a win (e.g. 2-1-0), or when ties and
+	wins give nothing more than losses, the splits are exactly the real
+	results and the check is exact. Otherwise (e.g. 3-1-0, where deciding
+	elimination is NP-complete) a few eliminated teams can be missed and
+	reported as ALIVE
+	'''
+	win, tie, loss = points
+	decisive = win - loss
+	drawn = tie - loss
+	total = min(decisive, 2 * drawn)
+	unit = math.gcd(decisive, drawn) or 1
+
+	return (unit, total // unit, total == 0 or decisive == 2 * drawn)
+
+def schedule_known(schedule, from_week):
+	# Whether every game from from_week on is known. Swiss schedules only pair
+	# a week when it comes to be played, and until then nobody can say who
+	# plays whom
+	if not hasattr(schedule, 'pair'):
+		return True
+
+	return all(week in schedule.weeks
+		for week in range(max(from_week, 1), len(schedule) + 1))
+
+def remaining_games(schedule, from_week):
+	# (home_ids, away_ids) of every game from from_week to the end of the
+	# schedule. Weeks that aren't paired yet would look like weeks without
+	# games, and teams would clinch on them, so they are refused
+	if not schedule_known(schedule, from_week):
+		raise ss_err.ValidationError('Clinch detection needs the rest of the '
+			'schedule, and week %d on is not paired yet' % from_week, schedule)
+
+	_, home_ids, away_ids = ss_batch.schedule_to_arrays(schedule,
+		range(max(from_week, 1), len(schedule) + 1))
+
+	return (home_ids, away_ids)
+
+class ClinchIndex:
+	'''
+	Clinch status of every team in a league, for its current results and the
+	games still to play. Built with the current week, and after that update()
+	only has to look at teams that are still ALIVE- results that have been
+	played can't undo a clinch or an elimination.
+
+	statuses is a list of ClinchStatus, indexed by team id. exact says
+	whether the elimination check is exact for the points config, see
+	game_units()
+	'''
+	def __init__(self, teams, schedule, week, config):
+		self.teams = teams
+		self.size = len(teams)
+		self.points_config = points_config(config)
+		self.unit, self.units, self.exact = game_units(self.points_config)
+		self.statuses = [ClinchStatus.ALIVE] * self.size
+		self.week = None
+
+		self.update(schedule, week)
+
+	def is_current(self, teams, config):
+		# True if update() can carry on from this index for teams under config
+		return teams is self.teams and len(teams) == self.size \
+			and self.points_config == points_config(config)
+
+	def update(self, schedule, week):
+		# Rechecks the ALIVE teams against the results so far and the games
+		# from week on
+		if week == self.week:
+			return
+
+		win, tie, loss = self.points_config
+		home_ids, away_ids = remaining_games(schedule, week)
+
+		current = np.asarray(current_points(self.teams, self.points_config),
+			dtype=np.int64)
+		left = np.bincount(home_ids, minlength=self.size) \
+			+ np.bincount(away_ids, minlength=self.size)
+
+		low = current + left * loss
+		high = current + left * win
+
+		candidates = []
+
+		for team_id in range(self.size):
+			if self.statuses[team_id] is not ClinchStatus.ALIVE:
+				continue
+
+			if clinched(team_id, low, high):
+				self.statuses[team_id] = ClinchStatus.CLINCHED
+			else:
+				candidates.append(team_id)
+
+		# A team that can still finish first takes any team with a best case
+		# at least as high with it: let that team win out too, which only
+		# costs everyone else points. So the eliminated teams are exactly those
+		# with the lowest best cases, and a binary search over the candidates
+		# finds the cut-off with a handful of checks
+		candidates.sort(key=lambda team_id: high[team_id])
+		first, last = 0, len(candidates)
+
+		while first < last:
+			middle = (first + last) // 2
+
+			if eliminated(candidates[middle], low, high, home_ids, away_ids,
+				self.unit, self.units):
+				first = middle + 1
+			else:
+				last = middle
+
+		for team_id in candidates[:first]:
+			self.statuses[team_id] = ClinchStatus.ELIMINATED
+
+		self.week = week
+
+def current_points(teams, points):
+	# Points every team has banked so far
+	win, tie, loss = points
+
+	if hasattr(teams, 'points'):
+		return teams.points(win, tie, loss)
+
+	return [t.wins * win + t.ties * tie + t.losses * loss for t in teams]
+
+def clinched(team_id, low, high):
+	# Losing every game a team has left and its rivals winning all theirs
+	# can all happen at once, so that is the worst case
+	rivals = np.delete(high, team_id)
+
+	return len(rivals) == 0 or rivals.max() <= low[team_id]
+
+def eliminated(team_id, low, high, home_ids, away_ids, unit, units):
+	'''
+	True if team_id can't finish level with or above every other team. It
+	is given its best case (a win in every game left, which also gives its
+	opponents their fewest points) and then the other games' points have to
+	fit under that total for every rival.
+
+	Rivals that can't pass it even winning out are ignored, along with their
+	games- all of those games' points can go to them. The same goes for any
+	rival with room for all of its games' points, and a rival with no room
+	left hands all of its games' points to its opponents. What is left is
+	checked with cheap cuts first and a max-flow only if those don't settle it
+	'''
+	best = high[team_id]
+
+	if np.delete(low, team_id).max(initial=best) > best:
+		return True
+
+	active = high > best
+	active[team_id] = False
+
+	if units == 0 or not active.any():
+		return False
+
+	# Games among the rivals, and how many units each rival can take
+	among = active[home_ids] & active[away_ids]
+	home = home_ids[among]
+	away = away_ids[among]
+	room = (best - low) // unit
+
+	while len(home):
+		demand = np.bincount(home, minlength=len(low)) \
+			+ np.bincount(away, minlength=len(low))
+		absorbs = active & (room >= demand * units)
+		full = active & (room == 0) & ~absorbs
+
+		if not absorbs.any() and not full.any():
+			break
+
+		if np.any(full[home] & full[away]):
+			return True
+
+		np.subtract.at(room, away[full[home]], units)
+		np.subtract.at(room, home[full[away]], units)
+
+		active &= ~(absorbs | full)
+
+		if np.any(room[active] < 0):
+			return True
+
+		keep = active[home] & active[away]
+		home = home[keep]
+		away = away[keep]
+
+	if len(home) == 0:
+		return False
+
+	if prefix_cut(low, home, away, room, units, active):
+		return True
+
+	if shares_fit(home, away, room, units):
+		return False
+
+	return not flow_fits(home, away, room, units)
+
+def prefix_cut(low, home, away, room, units, rivals):
+	# Tries the cuts made up of the k rivals with the fewest units of room,
+	# for every k- if the games among them hand out more units than they have
+	# room for, someone goes past. Finds most eliminations without a flow
+	order = np.flatnonzero(rivals)[np.argsort(room[rivals], kind='stable')]
+	rank = np.full(len(low), len(order))
+	rank[order] = np.arange(len(order))
+
+	# A game is inside the first k rivals once both its teams are
+	inside = np.bincount(np.maximum(rank[home], rank[away]),
+		minlength=len(order) + 1)[:len(order)]
+
+	return bool(np.any(np.cumsum(inside) * units > np.cumsum(room[order])))
+
+def shares_fit(home, away, room, units, rounds=SHARE_ROUNDS):
+	'''
+	Looks for a way to split every game's units between its two teams,
+	fractions allowed, that keeps every team within its room. If one exists
+	so does a whole number one (max-flows can always be taken integral), so
+	finding one proves the team isn't eliminated.
+
+	Games are split in proportion to per-team weights, and teams that come
+	out over their room have their weight cut- all in a few whole-array
+	passes. Returns False if that hasn't worked after rounds passes, which
+	proves nothing
+	'''
+	size = len(room)
+	capacity = room.astype(np.float64)
+	# Leaves room for rounding in the sums
+	limit = capacity - 1e-9 * (capacity + 1)
+	weight = capacity + 1
+
+	for _ in range(rounds):
+		share = weight[home] / (weight[home] + weight[away])
+		load = np.bincount(home, share * units, minlength=size) \
+			+ np.bincount(away, (1 - share) * units, minlength=size)
+
+		if np.all(load <= limit):
+			return True
+
+		weight *= np.minimum(capacity / np.maximum(load, 1e-12), 2.0)
+
+	return False
+
+def flow_fits(home, away, room, units):
+	'''
+	True if every game's units can be shared out between its two teams
+	without any team going over its room. Games are grouped by pairing,
+	then source -> pairing -> both teams -> sink.
+
+	The units are first shared out greedily, keeping each pair's room
+	level. That usually fits everything, and then no flow is needed; if not,
+	the max-flow starts from the greedy flow rather than from nothing
+	'''
+	pairs = np.stack((np.minimum(home, away), np.maximum(home, away)), axis=1)
+	pairs, counts = np.unique(pairs, axis=0, return_counts=True)
+	teams = np.unique(pairs)
+	team_node = {int(team_id): 2 + node for node, team_id in enumerate(teams)}
+	left = room.tolist()
+
+	edges = []
+	flows = []
+	need = 0
+	placed = 0
+
+	for (first, second), count in zip(pairs.tolist(), counts.tolist()):
+		node = 2 + len(teams) + len(edges) // 3
+		amount = count * units
+		need += amount
+
+		# Even out the room the two teams have left, as far as it goes
+		to_first = min(max((amount + left[first] - left[second]) // 2, 0),
+			amount, left[first])
+		to_second = min(amount - to_first, left[second])
+		to_first += min(amount - to_first - to_second, left[first] - to_first)
+
+		left[first] -= to_first
+		left[second] -= to_second
+		placed += to_first + to_second
+
+		edges.append((0, node, amount))
+		edges.append((node, team_node[first], amount))
+		edges.append((node, team_node[second], amount))
+		flows.extend((to_first + to_second, to_first, to_second))
+
+	if placed == need:
+		return True
+
+	for team_id in teams.tolist():
+		edges.append((team_node[team_id], 1, int(room[team_id])))
+		flows.append(int(room[team_id]) - left[team_id])
+
+	return max_flow(2 + len(teams) + len(pairs), edges, 0, 1, flows) == need
+
+def max_flow(num_nodes, edges, source, sink, flows=None):
+	'''
+	Dinic's algorithm on a graph given as a list of (tail, head, capacity)
+	edges. flows, if given, is a valid flow to start from (one value per
+	edge). Returns the value of a maximum flow from source to sink
+	'''
+	heads = []
+	capacity = []
+	adjacent = [[] for node in range(num_nodes)]
+
+	if flows is None:
+		flows = [0] * len(edges)
+
+	flow = 0
+
+	# Edge 2i is the ith edge and 2i + 1 its residual reverse edge
+	for (tail, head, cap), used in zip(edges, flows):
+		adjacent[tail].append(len(heads))
+		heads.append(head)
+		capacity.append(cap - used)
+
+		adjacent[head].append(len(heads))
+		heads.append(tail)
+		capacity.append(used)
+
+		if tail == source:
+			flow += used
+
+	while True:
+		# Level graph by breadth first search on the residual graph
+		level = [-1] * num_nodes
+		level[source] = 0
+		queue = [source]
+
+		for node in queue:
+			for edge in adjacent[node]:
+				if capacity[edge] > 0 and level[heads[edge]] < 0:
+					level[heads[edge]] = level[node] + 1
+					queue.append(heads[edge])
+
+		if level[sink] < 0:
+			return flow
+
+		# Blocking flow by depth first search, remembering where each node's
+		# edge list got to
+		position = [0] * num_nodes
+
+		while True:
+			pushed = augment(source, sink, adjacent, heads, capacity, level,
+				position)
+
+			if pushed == 0:
+				break
+
+			flow += pushed
+
+def augment(source, sink, adjacent, heads, capacity, level, position):
+	# Finds one source -> sink path in the level graph and pushes as much as
+	# it can along it. Returns the amount pushed (0 once there are no paths)
+	path = []
+	node = source
+
+	while node != sink:
+		edges = adjacent[node]
+
+		while position[node] < len(edges):
+			edge = edges[position[node]]
+
+			if capacity[edge] > 0 and level[heads[edge]] == level[node] + 1:
+				break
+
+			position[node] += 1
+		else:
+			# Dead end- retreat and don't try this node again this phase
+			if not path:
+				return 0
+
+			level[node] = -1
+			edge = path.pop()
+			node = heads[edge ^ 1]
+			position[node] += 1
+			continue
+
+		path.append(edge)
+		node = heads[edge]
+
+	pushed = min(capacity[edge] for edge in path)
+
+	for edge in path:
+		capacity[edge] -= pushed
+		capacity[edge ^ 1] += pushed
+
+	return pushed
@@ -9,4 +9,13 @@ class EndOfSeasonError(Exception):
         super().__init__(message)
 
         # Now for your custom code...
-        self.errors = errors
\ No newline at end of file
+        self.errors = errors
+
+class ValidationError(Exception):
+    def __init__(self, message, errors):
+
+        # Call the base class constructor with the parameters it needs
+        super().__init__(message)
+
+        # Now for your custom code...
+        self.errors = errors
@@ -0,0 +1,145 @@
+###############################################################################
+#  Exact standings odds for season_sim. Rather than simulating seasons, it   #
+#  works out each team's exact distribution of final points over the rest    #
+#  of the schedule by convolving the win/tie/loss odds of its remaining     #
+#  games, which biased_proportional's score distributions give directly     #
+###############################################################################
+
+import numpy as np
+
+import season_sim as ss
+import season_sim_batch as ss_batch
+import season_sim_mc as ss_mc
+import season_sim_odds as ss_odds
+
+# (home win, tie, away win) probabilities for arrays of home and away
+# scoring probabilities
+outcome_probabilities = ss_odds.outcome_probabilities
+
+def expected_standings(teams=None, schedule=None, from_week=None, config=None,
+	bias=10):
+	'''
+	Exact distribution of every team's final points, from its current record
+	plus the games from from_week (default: the league's current week) to
+	the end of schedule. Defaults come from the current league.
+
+	Returns a dictionary with
+		'names'         - team names, in team order
+		'points_offset' - the points total that column 0 of 'points' stands for
+		'points'        - array[team, points - points_offset] of probabilities
+		'expected'      - array[team] of expected final points
+
+	These are each team's own (marginal) distributions. Teams' totals are
+	not independent- they play each other- so finishing positions need the
+	Monte Carlo engine
+	'''
+	if teams is None:
+		teams = ss.state['teams']
+
+	if schedule is None:
+		schedule = ss.state['schedule']
+
+	if from_week is None:
+		from_week = ss.state['current_week']
+
+	if config is None:
+		config = ss.state['config']
+
+	num_teams = len(teams)
+	win, tie, loss = ss_mc.points_table(config)
+	low = min(win, tie, loss)
+
+	offense, defense = ss_batch.team_ratings(teams)
+	week_ids, home_ids, away_ids = ss_batch.schedule_to_arrays(schedule,
+		range(max(from_week, 1), len(schedule) + 1))
+
+	home_p = ss_batch.scoring_probability(offense[home_ids], defense[away_ids],
+		bias)
+	away_p = ss_batch.scoring_probability(offense[away_ids], defense[home_ids],
+		bias)
+	home_win, draw, away_win = outcome_probabilities(home_p, away_p)
+
+	current = current_points(teams, (win, tie, loss))
+	games = np.bincount(home_ids, minlength=num_teams) \
+		+ np.bincount(away_ids, minlength=num_teams)
+
+	# Row t holds the distribution of team t's points above base[t], the
+	# fewest points it can still finish on
+	base = current + games * low
+	width = int((games * (max(win, tie, loss) - low)).max()) + 1 \
+		if num_teams else 1
+
+	dist = np.zeros((num_teams, width))
+	dist[:, 0] = 1.0
+
+	shifts = (win - low, tie - low, loss - low)
+
+	for games_slice in rounds(week_ids, home_ids, away_ids):
+		home = home_ids[games_slice]
+		away = away_ids[games_slice]
+
+		dist[home] = play(dist[home], shifts, home_win[games_slice],
+			draw[games_slice], away_win[games_slice])
+		dist[away] = play(dist[away], shifts, away_win[games_slice],
+			draw[games_slice], home_win[games_slice])
+
+	offset = int(base.min()) if num_teams else 0
+	points = np.zeros((num_teams, int(base.max()) - offset + width
+		if num_teams else 1))
+
+	for team_id in range(num_teams):
+		start = int(base[team_id]) - offset
+		points[team_id, start:start + width] = dist[team_id]
+
+	values = np.arange(points.shape[1]) + offset
+
+	return {
+		'names': [t.name for t in teams],
+		'points_offset': offset,
+		'points': points,
+		'expected': points @ values,
+	}
+
+def play(dist, shifts, win, tie, loss):
+	# Adds one game to rows of points distributions- each row moves up by the
+	# shift for a win, tie or loss with that row's probabilities
+	played = np.zeros_like(dist)
+	width = dist.shape[1]
+
+	for shift, probability in zip(shifts, (win, tie, loss)):
+		played[:, shift:] += probability[:, None] * dist[:, :width - shift]
+
+	return played
+
+def rounds(week_ids, home_ids, away_ids):
+	# Slices of the game arrays in which no team plays twice, so each can be
+	# applied to the distributions at once. Normally that is one per week;
+	# weeks where a team plays more than once are split up game by game
+	bounds = np.flatnonzero(np.diff(week_ids)) + 1
+	starts = [0] + bounds.tolist()
+	ends = bounds.tolist() + [len(week_ids)]
+
+	for start, end in zip(starts, ends):
+		playing = np.concatenate((home_ids[start:end], away_ids[start:end]))
+
+		if len(np.unique(playing)) == len(playing):
+			yield slice(start, end)
+		else:
+			for game in range(start, end):
+				yield slice(game, game + 1)
+
+def current_points(teams, points):
+	# Points every team has already banked, as an int64 array
+	win, tie, loss = points
+
+	if hasattr(teams, 'points'):
+		return np.asarray(teams.points(win, tie, loss), dtype=np.int64)
+
+	return np.array([t.wins * win + t.ties * tie + t.losses * loss
+		for t in teams], dtype=np.int64)
+
+def probability_at_least(result, points):
+	# array[team] of the probability of finishing on at least points
+	column = max(0, points - result['points_offset'])
+
+	return result['points'][:, column:].sum(axis=1)
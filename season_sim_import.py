@@ -0,0 +1,182 @@
+###############################################################################
+#  Bulk team import for season_sim. Reads a whole team file (csv, json or    #
+#  the CLI's "[name] [off] [def]" lines), validates every row at once and    #
+#  reports all problems together in one ValidationError                       #
+###############################################################################
+
+import csv
+import json
+import os
+import re
+
+import numpy as np
+
+import season_sim_errors as ss_err
+
+FORMATS = ('csv', 'json', 'txt')
+
+# Names are printable and have no leading, trailing or repeated whitespace
+NAME_PATTERN = re.compile(r'[^\s\x00-\x1f]+( [^\s\x00-\x1f]+)*\Z')
+
+# Ratings are whole numbers that fit the store's int32 columns
+MAX_RATING = 2 ** 31 - 1
+
+# Column order of headerless csv files and txt lines
+DEFAULT_COLUMNS = ('name', 'offense', 'defense')
+
+def read_teams(path, format=None, existing_names=()):
+	'''
+	Reads and validates a team file. format is 'csv', 'json' or 'txt'
+	(default: from the file extension, txt if it is not csv or json).
+	Names must also not clash with existing_names.
+
+	Returns (names, offense, defense) with the ratings as int32 arrays, or
+	raises a ValidationError whose errors lists every bad row
+	'''
+	if format is None:
+		format = os.path.splitext(path)[1][1:].lower()
+
+		if format not in FORMATS:
+			format = 'txt'
+
+	if format not in FORMATS:
+		raise ValueError('Unknown team file format %s' % format)
+
+	with open(path, newline='') as team_file:
+		if format == 'json':
+			rows, first_row = json_rows(json.load(team_file)), 1
+		elif format == 'csv':
+			rows, first_row = csv_rows(team_file)
+		else:
+			rows, first_row = txt_rows(team_file), 1
+
+	return validate_rows(rows, path, first_row, existing_names)
+
+def csv_rows(team_file):
+	# Returns (rows, number of the first row). A header row, if there is one,
+	# says which columns hold the name and ratings; other columns are ignored
+	rows = list(csv.reader(team_file))
+
+	if not rows:
+		return ([], 1)
+
+	header = [field.strip().lower() for field in rows[0]]
+
+	if 'name' not in header:
+		return (rows, 1)
+
+	missing = [column for column in DEFAULT_COLUMNS if column not in header]
+
+	if missing:
+		raise ss_err.ValidationError('Team file header is missing %s' %
+			', '.join(missing), missing)
+
+	indices = [header.index(column) for column in DEFAULT_COLUMNS]
+	width = max(indices) + 1
+
+	return ([[row[i] for i in indices] if len(row) >= width else row
+		for row in rows[1:]], 2)
+
+def json_rows(data):
+	# A list of {"name", "offense", "defense"} objects, or one object of
+	# columns {"name": [...], "offense": [...], "defense": [...]}
+	if isinstance(data, dict):
+		missing = [column for column in DEFAULT_COLUMNS if column not in data]
+
+		if missing:
+			raise ss_err.ValidationError('Team file is missing %s' %
+				', '.join(missing), missing)
+
+		if len(set(len(data[column]) for column in DEFAULT_COLUMNS)) != 1:
+			raise ss_err.ValidationError('Team file columns differ in length',
+				None)
+
+		return list(zip(*(data[column] for column in DEFAULT_COLUMNS)))
+
+	if not isinstance(data, list):
+		raise ss_err.ValidationError('Team file must hold a list of teams',
+			None)
+
+	return [[entry.get(column) for column in DEFAULT_COLUMNS]
+		if isinstance(entry, dict) else entry for entry in data]
+
+def txt_rows(team_file):
+	return [line.split() for line in team_file if line.strip()]
+
+def validate_rows(rows, source='', first_row=1, existing_names=()):
+	'''
+	Validates rows of (name, offense, defense) and returns them as (names,
+	offense, defense) columns. Every row is checked before anything is
+	raised, so the ValidationError lists all the problems at once
+	'''
+	# (row number, message) pairs, sorted by row before they are reported
+	errors = []
+	good = [len(row) == 3 if isinstance(row, (list, tuple)) else False
+		for row in rows]
+
+	for number, ok in enumerate(good):
+		if not ok:
+			errors.append((number + first_row,
+				'expected 3 fields (name, offense, defense)'))
+
+	columns = list(zip(*[row if ok else (None, 0, 0)
+		for row, ok in zip(rows, good)])) or [(), (), ()]
+
+	names = list(columns[0])
+	offense = ratings(columns[1], 'offense', good, first_row, errors)
+	defense = ratings(columns[2], 'defense', good, first_row, errors)
+
+	seen = set(existing_names)
+
+	for number, name in enumerate(names):
+		if not good[number]:
+			continue
+
+		if not isinstance(name, str) or not NAME_PATTERN.match(name):
+			errors.append((number + first_row, 'invalid team name %r' % (name,)))
+		elif name in seen:
+			errors.append((number + first_row, 'duplicate team name %r' % name))
+		else:
+			seen.add(name)
+
+	if errors:
+		errors = ['row %d: %s' % error for error in sorted(errors)]
+
+		raise ss_err.ValidationError('%d invalid team rows in %s, first: %s' %
+			(len(errors), source or 'teams', errors[0]), errors)
+
+	return (names, offense.astype(np.int32), defense.astype(np.int32))
+
+def ratings(values, column, good, first_row, errors):
+	# Converts a column of ratings to numbers in one go, adding an error for
+	# every row that isn't a whole number in range. Only when the column
+	# can't be converted wholesale are values looked at one by one
+	try:
+		numbers = np.array(values, dtype=np.float64)
+	except (TypeError, ValueError):
+		numbers = np.array([number_or_nan(value) for value in values],
+			dtype=np.float64)
+
+	# bools would otherwise pass as 0 and 1
+	invalid = np.array([isinstance(value, bool) for value in values],
+		dtype=bool) if values else np.zeros(0, dtype=bool)
+
+	with np.errstate(invalid='ignore'):
+		invalid |= ~np.isfinite(numbers) | (numbers != np.floor(numbers)) \
+			| (numbers < 0) | (numbers > MAX_RATING)
+
+	invalid &= np.array(good, dtype=bool)
+
+	for number in np.flatnonzero(invalid).tolist():
+		errors.append((number + first_row, '%s %r is not a whole number from 0 '
+			'to %d' % (column, values[number], MAX_RATING)))
+
+	numbers[invalid] = 0
+
+	return numbers
+
+def number_or_nan(value):
+	try:
+		return float(value)
+	except (TypeError, ValueError):
+		return np.nan
@@ -1,33 +1,70 @@
 ###############################################################################
 #  This is the I/O module for season_sim. It's purpose is to convert to and   #
-#  from the raw python into a human readable file. It should be called with   #
+#  from the raw python into a file- either human readable json (.ssf) or a   #
+#  memory-mappable binary format (.ssb). It should be called with            #
 #  save_state() and load_state() - the rest is private implementation         #     
 ###############################################################################
 
 
 import json
+import os
+import struct
+
+import numpy as np
+
 import team
+import schedules
+import game_log
+import season_sim_profile as ss_prof
 
 def convert_to_serializable(state):
 	# Teams is not serializable because they are objects. This will convert
 	# them into dictionaries so that you can pass the state in to json
+	# current_week goes first so that the streaming loader knows it before
+	# reaching the schedule
 	serializable_state = {}
-	serializable_state['schedule'] = state['schedule']
 	serializable_state['current_week'] = state['current_week']
+	serializable_state['schedule'] = schedules.serialize(state['schedule'])
+
+	if 'config' in state:
+		serializable_state['config'] = state['config']
+
+	if 'game_log' in state:
+		# The log is written column by column, as it is stored
+		serializable_state['game_log'] = {column: state['game_log'].column(
+			column).tolist() for column in game_log.COLUMNS}
 
 	serializable_state['teams'] = []
 
 	for team in state['teams']:
-		serializable_state['teams'].append(vars(team))
+		serializable_state['teams'].append({
+			'name': team.name,
+			'offense': team.offense,
+			'defense': team.defense,
+			'results': dict(team.results),
+		})
 
 	return serializable_state
 
+@ss_prof.timed('save')
 def save_state(state, save_name):
-	# Saves the current state of the program
-	serializable_state = convert_to_serializable(state)
+	# Saves the current state of the program. Files ending in .ssb are written
+	# in the binary format, anything else as json
+	# The save is written to a temporary file and then moved into place. That
+	# way a crash never leaves half a save, and a binary save that is still
+	# memory-mapped from an earlier load is never overwritten underneath it
+	temp_name = save_name + ".tmp"
+
+	if is_binary(save_name):
+		save_binary(state, temp_name)
+	else:
+		serializable_state = convert_to_serializable(state)
 
-	with open(save_name, "w") as save_file:
-		json.dump(serializable_state, save_file)
+		with open(temp_name, "w") as save_file:
+			json.dump(serializable_state, save_file)
+
+	os.replace(temp_name, save_name)
+	discard_journal(save_name)
 
 
 def convert_from_serialized(serialized_state):
@@ -35,48 +72,605 @@ def convert_from_serialized(serialized_state):
 
 	state = {}
 
-	# This is pretty gross - json decodes back in as lists and not the tuples
-	# that we were expecting so we have to convert schedule back to the 
-	# dictionary mapping a number to puples of tuples
-	state['schedule'] = {}
-
-	for week, matchups in serialized_state['schedule'].items():
-		list_of_matchups = []
-
-		for matchup in matchups:
-			list_of_matchups.append(tuple(matchup))
+	# json decodes back in as lists and not the tuples that we were expecting,
+	# and lazy schedules are stored by their parameters, so schedules does the
+	# conversion back
+	state['schedule'] = schedules.deserialize(serialized_state['schedule'])
 
-		tuple_of_matchups = tuple(list_of_matchups)
+	state['current_week'] = serialized_state['current_week']
 
-		state['schedule'][int(week)] = tuple_of_matchups
+	if 'config' in serialized_state:
+		state['config'] = serialized_state['config']
 
-	state['current_week'] = serialized_state['current_week']
+	if 'game_log' in serialized_state:
+		state['game_log'] = game_log.GameLog.from_columns({column:
+			np.array(values, dtype=np.int32) for column, values
+			in serialized_state['game_log'].items()})
 
-	# We also have to transform teams from a dictionary back into a Python
-	# class
-	state['teams'] = []
+	# We also have to transform teams from a dictionary back into rows of a
+	# team store
+	state['teams'] = team.TeamStore(len(serialized_state['teams']))
 
 	for team_map in serialized_state['teams']:
-		state['teams'].append(team.Team(team_map['name'],
+		state['teams'].add(team_map['name'],
 			offense=team_map['offense'], 
 			defense=team_map['defense'],
 			wins=team_map['results']['win'],
 			losses=team_map['results']['loss'], 
-			tie=team_map['results']['tie']))
+			tie=team_map['results']['tie'])
+
+	return state
+
+
+@ss_prof.timed('load')
+def load_state(save_name, lazy=False):
+	# Loads the current state, in whichever format the file name says, and
+	# replays any journal kept alongside it. json saves are streamed; with
+	# lazy set, schedule weeks before the current week are only read if they
+	# are asked for
+	if is_binary(save_name):
+		state = load_binary(save_name)
+	else:
+		state = load_streaming(save_name, lazy)
+
+	replay_journal(state, journal_path(save_name))
+
+	return state
+
+def convert(source_name, destination_name):
+	# Converts a save between formats, e.g. league.ssf -> league.ssb
+	save_state(load_state(source_name), destination_name)
+
+def is_binary(save_name):
+	return os.path.splitext(save_name)[1] == BINARY_EXTENSION
+
+###############################################################################
+# Streaming json loader                                                       #
+###############################################################################
+
+# json.load on a big save builds the whole document as Python objects, and
+# convert_from_serialized then builds a second copy. The streaming loader
+# walks the top level of the document itself and only hands the json module
+# one small value at a time (a team, a week), which goes straight into the
+# final team store / schedule
+
+class JsonStream:
+	'''
+	Incremental reader over a json text file. Containers are walked with
+	members() and elements(); everything else is read whole with value()
+	'''
+	WHITESPACE = ' \t\n\r'
+
+	def __init__(self, json_file, chunk_size=1 << 16):
+		self.file = json_file
+		self.chunk_size = chunk_size
+		self.buffer = ''
+		self.pos = 0
+		self.eof = False
+		self.decoder = json.JSONDecoder()
+
+	def fill(self):
+		# Drops what has been consumed and reads more. Reads at least as much
+		# as is already buffered, so a large value takes O(log n) refills
+		chunk = self.file.read(max(self.chunk_size, len(self.buffer) - self.pos))
+
+		if not chunk:
+			self.eof = True
+			return False
+
+		self.buffer = self.buffer[self.pos:] + chunk
+		self.pos = 0
+
+		return True
+
+	def peek(self):
+		# The next non-whitespace character, without consuming it ('' at EOF)
+		while True:
+			while self.pos < len(self.buffer) \
+				and self.buffer[self.pos] in self.WHITESPACE:
+				self.pos += 1
+
+			if self.pos < len(self.buffer):
+				return self.buffer[self.pos]
+
+			if not self.fill():
+				return ''
+
+	def expect(self, char):
+		if self.peek() != char:
+			raise ValueError('Expected %r in json save, got %r' % (char,
+				self.peek()))
+
+		self.pos += 1
+
+	def value(self):
+		# Reads one complete json value
+		self.peek()
+
+		while True:
+			try:
+				value, end = self.decoder.raw_decode(self.buffer, self.pos)
+
+				# A number running up to the end of the buffer may continue
+				# in the next chunk
+				if end < len(self.buffer) or self.eof:
+					self.pos = end
+					return value
+			except json.JSONDecodeError:
+				if self.eof:
+					raise
+
+			self.fill()
+
+	def separator(self, closing):
+		# Consumes a ',' and returns True, or the closing bracket and False
+		char = self.peek()
+		self.pos += 1
+
+		if char == closing:
+			return False
+
+		if char != ',':
+			raise ValueError('Expected , or %s in json save, got %r' % (closing,
+				char))
+
+		return True
+
+	def members(self):
+		# Walks an object, yielding each key. The caller must read the value
+		# before asking for the next key
+		self.expect('{')
+
+		if self.peek() == '}':
+			self.pos += 1
+			return
+
+		while True:
+			key = self.value()
+			self.expect(':')
+
+			yield key
+
+			if not self.separator('}'):
+				return
+
+	def elements(self):
+		# Walks an array, yielding once per element. The caller must read the
+		# element before asking for the next one
+		self.expect('[')
+
+		if self.peek() == ']':
+			self.pos += 1
+			return
+
+		while True:
+			yield
+
+			if not self.separator(']'):
+				return
+
+	def int_array(self):
+		# Reads a flat array of integers straight into a NumPy array
+		self.expect('[')
+
+		end = self.buffer.find(']', self.pos)
+
+		while end == -1:
+			if not self.fill():
+				raise ValueError('Unterminated array in json save')
+
+			end = self.buffer.find(']', self.pos)
+
+		text = self.buffer[self.pos:end]
+		self.pos = end + 1
+
+		if not text.strip():
+			return np.zeros(0, dtype=np.int64)
+
+		return np.fromstring(text, dtype=np.int64, sep=',')
+
+# Top level keys every json save has
+REQUIRED_KEYS = ('current_week', 'schedule', 'teams')
+
+def load_streaming(save_name, lazy=False):
+	state = {}
+
+	with open(save_name, "r") as save_file:
+		stream = JsonStream(save_file)
+
+		for key in stream.members():
+			if key == 'teams':
+				state['teams'] = stream_teams(stream)
+			elif key == 'schedule':
+				first_week = state.get('current_week', 1) if lazy else 1
+				state['schedule'] = stream_schedule(stream, save_name,
+					first_week)
+			elif key == 'game_log':
+				columns = {}
+
+				for column in stream.members():
+					columns[column] = stream.int_array().astype(np.int32)
+
+				state['game_log'] = game_log.GameLog.from_columns(columns)
+			else:
+				state[key] = stream.value()
+
+	# Every save has these, so a file without them isn't a save- better to
+	# fail here than to load it and fail on the next command
+	missing = [key for key in REQUIRED_KEYS if key not in state]
+
+	if missing:
+		raise ValueError('%s is not a season_sim save, it has no %s' %
+			(save_name, ', '.join(missing)))
 
 	return state
 
+def stream_teams(stream):
+	teams = team.TeamStore()
+
+	for _ in stream.elements():
+		team_map = stream.value()
+
+		teams.add(team_map['name'],
+			offense=team_map['offense'],
+			defense=team_map['defense'],
+			wins=team_map['results']['win'],
+			losses=team_map['results']['loss'],
+			tie=team_map['results']['tie'])
+
+	return teams
+
+def stream_schedule(stream, save_name, first_week=1):
+	# Reads the schedule a week at a time, keeping weeks from first_week on.
+	# If any were dropped the result is a PartialSchedule that goes back to
+	# the file for them if they are ever needed
+	weeks = {}
+	parameters = {}
+	last_week = 0
+
+	for key in stream.members():
+		matchups = stream.value()
+
+		if not key.isdigit():
+			# Lazy schedules are stored by their parameters
+			parameters[key] = matchups
+			continue
 
-def load_state(save_name):
-	# Loads the current state
+		week = int(key)
+		last_week = max(last_week, week)
 
-	serialized_state = {}
+		if week >= first_week:
+			weeks[week] = tuple(tuple(matchup) for matchup in matchups)
 
+	if parameters:
+		return schedules.deserialize(parameters)
+
+	if len(weeks) < last_week:
+		return schedules.PartialSchedule(weeks, last_week,
+			lambda: load_schedule_weeks(save_name, first_week))
+
+	return schedules.IndexedSchedule(weeks)
+
+def load_schedule_weeks(save_name, before):
+	# Streams just the schedule weeks before a given week out of a save
 	with open(save_name, "r") as save_file:
-		serialized_state = json.load(save_file)
+		stream = JsonStream(save_file)
+
+		for key in stream.members():
+			if key == 'schedule':
+				weeks = stream_schedule(stream, save_name)
+
+				return {week: weeks[week] for week in weeks if week < before}
+
+			stream.value()
+
+	return {}
+
+###############################################################################
+# Journal                                                                     #
+###############################################################################
+
+# A save can have a journal next to it (league.ssf -> league.ssj). Rather than
+# rewriting the save, each record appends the games played since the last
+# one as a json line. Loading a save replays its journal on top, and writing
+# the save in full (compacting) folds the journal in and deletes it
+
+JOURNAL_EXTENSION = '.ssj'
+
+def journal_path(save_name):
+	return os.path.splitext(save_name)[0] + JOURNAL_EXTENSION
+
+@ss_prof.timed('save')
+def append_journal(state, save_name, first_game=0):
+	# Appends one record with every logged game from first_game on, plus the
+	# current week. The line is written in one go and flushed to disk
+	log = state['game_log']
+	games = slice(first_game, len(log))
+
+	record = {
+		'current_week': state['current_week'],
+		'games': {column: log.column(column)[games].tolist()
+			for column in game_log.COLUMNS},
+	}
+
+	with open(journal_path(save_name), "a") as journal_file:
+		journal_file.write(json.dumps(record) + "\n")
+		journal_file.flush()
+		os.fsync(journal_file.fileno())
+
+def replay_journal(state, path):
+	# Applies a journal's records to a freshly loaded state- games go in the
+	# log and count towards team records. A torn last line (a crash part way
+	# through a write) is ignored
+	if not os.path.isfile(path):
+		return
+
+	with open(path, "r") as journal_file:
+		lines = journal_file.read().split("\n")
+
+	if 'game_log' not in state:
+		state['game_log'] = game_log.GameLog()
+
+	for number, line in enumerate(lines):
+		if not line:
+			continue
+
+		try:
+			record = json.loads(line)
+		except json.JSONDecodeError:
+			if number == len(lines) - 1:
+				break
+
+			raise
+
+		games = {column: np.array(record['games'][column], dtype=np.int64)
+			for column in game_log.COLUMNS}
+
+		state['game_log'].extend(games['week'], games['home'], games['away'],
+			games['home_score'], games['away_score'])
+		apply_results(state['teams'], games)
+		record_weeks(state.get('schedule'), games)
+
+		state['current_week'] = record['current_week']
+
+def record_weeks(schedule, games):
+	# Schedules that depend on results (knockout brackets, Swiss pairings)
+	# are told about the replayed games week by week, as simulate_week()
+	# would have
+	if not hasattr(schedule, 'record'):
+		return
+
+	for week in np.unique(games['week']).tolist():
+		played = games['week'] == week
+		schedule.record(week, {column: values[played]
+			for column, values in games.items()})
+
+def apply_results(teams, games):
+	# Adds a batch of games to the teams' W/L/T records
+	home = games['home']
+	away = games['away']
+	home_won = games['home_score'] > games['away_score']
+	away_won = games['home_score'] < games['away_score']
+	tied = ~home_won & ~away_won
+
+	if not isinstance(teams, team.TeamStore):
+		for game in range(len(home)):
+			for side, won, lost in ((home[game], home_won, away_won),
+				(away[game], away_won, home_won)):
+				teams[side].record('wins' if won[game] else
+					'losses' if lost[game] else 'ties')
+		return
+
+	num_teams = len(teams)
+
+	for column, first, second in (('wins', home_won, away_won),
+		('losses', away_won, home_won), ('ties', tied, tied)):
+		teams.writable(column)[:num_teams] += np.bincount(home[first],
+			minlength=num_teams) + np.bincount(away[second], minlength=num_teams)
+
+def discard_journal(save_name):
+	# Called after the save itself is written in full, which already holds
+	# everything the journal did
+	path = journal_path(save_name)
+
+	if os.path.isfile(path):
+		os.remove(path)
+
+###############################################################################
+# Binary format                                                               #
+###############################################################################
+
+# A binary save is a fixed header followed by sections of little-endian
+# arrays, each starting on an 8 byte boundary so they can be memory-mapped in
+# place. In order, the sections are
+#	name offsets - int64[num_teams + 1], team i's name is names[off[i]:off[i+1]]
+#	names        - utf-8 bytes of every name, back to back
+#	team columns - int32[num_teams] for each of team.COLUMNS
+#	schedule     - int32[weeks, slots, 2] of (home, away), see ArraySchedule.
+#	               Only present for explicit schedules
+#	game log     - int32[games] for each of game_log.COLUMNS
+#	config       - json, as it is tiny
+
+BINARY_EXTENSION = '.ssb'
 
-	return convert_from_serialized(serialized_state)
+MAGIC = b'SSB1'
 
+# magic, version, num_teams, current_week, schedule kind, round robin teams
+# (or Swiss rounds), schedule weeks, schedule slots, games, names bytes,
+# config bytes
+HEADER = struct.Struct('<4sI9q')
 
+VERSION = 1
 
+# Schedule kinds in the header
+EXPLICIT_SCHEDULE = 0
+ROUND_ROBIN_SCHEDULE = 1
+DOUBLE_ROUND_ROBIN_SCHEDULE = 2
+# The schedule section holds the bracket's slots, see KnockoutSchedule.to_array
+KNOCKOUT_SCHEDULE = 3
+# The schedule section holds the weeks paired so far, the rest are empty
+SWISS_SCHEDULE = 4
 
+def align(offset):
+	return (offset + 7) & ~7
+
+def binary_layout(num_teams, weeks, slots, games, names_bytes):
+	# Works out where every section starts. Shared by the reader and writer so
+	# the two can't disagree
+	layout = {}
+	offset = HEADER.size
+
+	def section(name, size):
+		nonlocal offset
+		offset = align(offset)
+		layout[name] = offset
+		offset += size
+
+	section('name_offsets', 8 * (num_teams + 1))
+	section('names', names_bytes)
+
+	for column in team.COLUMNS:
+		section('team_' + column, 4 * num_teams)
+
+	section('schedule', 4 * weeks * slots * 2)
+
+	for column in game_log.COLUMNS:
+		section('log_' + column, 4 * games)
+
+	section('config', 0)
+
+	return layout
+
+def save_binary(state, save_name):
+	teams = state['teams']
+	schedule = state['schedule']
+	log = state.get('game_log', game_log.GameLog())
+	config = json.dumps(state.get('config', {})).encode('utf-8')
+
+	encoded = [t.name.encode('utf-8') for t in teams]
+	name_offsets = np.zeros(len(encoded) + 1, dtype='<i8')
+	np.cumsum([len(name) for name in encoded], out=name_offsets[1:])
+
+	if isinstance(schedule, schedules.RoundRobinSchedule):
+		kind = ROUND_ROBIN_SCHEDULE
+		rr_teams = schedule.num_teams
+		matchups = np.zeros((0, 0, 2), dtype='<i4')
+	elif isinstance(schedule, schedules.DoubleRoundRobinSchedule):
+		kind = DOUBLE_ROUND_ROBIN_SCHEDULE
+		rr_teams = schedule.num_teams
+		matchups = np.zeros((0, 0, 2), dtype='<i4')
+	elif isinstance(schedule, schedules.KnockoutSchedule):
+		kind = KNOCKOUT_SCHEDULE
+		rr_teams = 0
+		matchups = schedule.to_array().astype('<i4')
+	elif isinstance(schedule, schedules.SwissSchedule):
+		kind = SWISS_SCHEDULE
+		rr_teams = schedule.rounds
+		matchups = schedules.to_array(schedule).astype('<i4')
+	else:
+		kind = EXPLICIT_SCHEDULE
+		rr_teams = 0
+		matchups = schedules.to_array(schedule).astype('<i4')
+
+	if isinstance(teams, team.TeamStore):
+		columns = {column: teams.column(column) for column in team.COLUMNS}
+	else:
+		columns = {
+			'offense': [t.offense for t in teams],
+			'defense': [t.defense for t in teams],
+			'wins': [t.wins for t in teams],
+			'losses': [t.losses for t in teams],
+			'ties': [t.ties for t in teams],
+		}
+
+	layout = binary_layout(len(teams), matchups.shape[0], matchups.shape[1],
+		len(log), int(name_offsets[-1]))
+
+	sections = [('name_offsets', name_offsets), ('names', b''.join(encoded))]
+
+	for column in team.COLUMNS:
+		sections.append(('team_' + column, np.asarray(columns[column], dtype='<i4')))
+
+	sections.append(('schedule', matchups))
+
+	for column in game_log.COLUMNS:
+		sections.append(('log_' + column, log.column(column).astype('<i4')))
+
+	sections.append(('config', config))
+
+	with open(save_name, "wb") as save_file:
+		save_file.write(HEADER.pack(MAGIC, VERSION, len(teams),
+			state['current_week'], kind, rr_teams, matchups.shape[0],
+			matchups.shape[1], len(log), int(name_offsets[-1]), len(config)))
+
+		for name, data in sections:
+			save_file.write(b'\0' * (layout[name] - save_file.tell()))
+			save_file.write(data if isinstance(data, bytes) else data.tobytes())
+
+def load_binary(save_name):
+	# Memory-maps a binary save. The team columns, schedule and game log are
+	# views straight into the file- copy-on-write, so simulating afterwards
+	# never touches the file on disk
+	with open(save_name, "rb") as save_file:
+		header = save_file.read(HEADER.size)
+
+	if len(header) < HEADER.size:
+		raise ValueError('%s is too short to be a season_sim binary save' %
+			save_name)
+
+	header = HEADER.unpack(header)
+
+	(magic, version, num_teams, current_week, kind, rr_teams, weeks, slots,
+		games, names_bytes, config_bytes) = header
+
+	if magic != MAGIC or version != VERSION:
+		raise ValueError('%s is not a version %d season_sim binary save' %
+			(save_name, VERSION))
+
+	layout = binary_layout(num_teams, weeks, slots, games, names_bytes)
+	data = np.memmap(save_name, dtype=np.uint8, mode='c')
+
+	if len(data) < layout['config'] + config_bytes:
+		raise ValueError('%s is cut short- %d bytes, not %d' % (save_name,
+			len(data), layout['config'] + config_bytes))
+
+	def section(name, dtype, count):
+		dtype = np.dtype(dtype)
+		return np.frombuffer(data, dtype=dtype, count=count,
+			offset=layout[name])
+
+	state = {}
+	state['current_week'] = current_week
+
+	name_offsets = section('name_offsets', '<i8', num_teams + 1).tolist()
+	names = bytes(data[layout['names']:layout['names'] + names_bytes])
+	names = [names[name_offsets[i]:name_offsets[i + 1]].decode('utf-8')
+		for i in range(num_teams)]
+
+	state['teams'] = team.TeamStore.from_columns(names, {column:
+		section('team_' + column, '<i4', num_teams) for column in team.COLUMNS})
+
+	if kind == ROUND_ROBIN_SCHEDULE:
+		state['schedule'] = schedules.RoundRobinSchedule(rr_teams)
+	elif kind == DOUBLE_ROUND_ROBIN_SCHEDULE:
+		state['schedule'] = schedules.DoubleRoundRobinSchedule(rr_teams)
+	elif kind == KNOCKOUT_SCHEDULE:
+		state['schedule'] = schedules.KnockoutSchedule.from_array(section(
+			'schedule', '<i4', weeks * slots * 2).reshape(weeks, slots, 2))
+	elif kind == SWISS_SCHEDULE:
+		state['schedule'] = schedules.SwissSchedule.from_array(num_teams,
+			rr_teams, section('schedule', '<i4', weeks * slots * 2).reshape(
+			weeks, slots, 2))
+	else:
+		state['schedule'] = schedules.ArraySchedule(section('schedule', '<i4',
+			weeks * slots * 2).reshape(weeks, slots, 2))
+
+	state['game_log'] = game_log.GameLog.from_columns({column:
+		section('log_' + column, '<i4', games) for column in game_log.COLUMNS})
+
+	config = bytes(data[layout['config']:layout['config'] + config_bytes])
+
+	if config_bytes:
+		state['config'] = json.loads(config.decode('utf-8'))
+
+	return state
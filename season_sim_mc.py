@@ -0,0 +1,255 @@
+###############################################################################
+#  Monte Carlo engine for season_sim. It replays a round robin season many    #
+#  times over a process pool and returns, for every team, the distribution   #
+#  of final points, the distribution of finishing positions and title odds   #
+###############################################################################
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import season_sim as ss
+import season_sim_batch as ss_batch
+import season_sim_rng as ss_rng
+import season_sim_odds as ss_odds
+import season_sim_simulators as ss_sim
+import team
+
+# Upper bound on the number of games drawn at once in a worker. Seasons are
+# simulated in blocks of roughly this many games to keep memory flat no matter
+# how many seasons each worker has to run
+BLOCK_GAMES = 1 << 20
+
+# Seasons are split into chunks that each get their own random stream. Chunk
+# sizes only depend on n- never on the number of workers- so a run gives
+# identical results however many processes share it. Up to TARGET_CHUNKS
+# chunks are used, of at most MAX_CHUNK_SEASONS seasons each
+TARGET_CHUNKS = 64
+MAX_CHUNK_SEASONS = 4096
+
+def simulate_many_seasons(n, teams=None, bias=10, workers=None, seed=None,
+	config=None, rng=None, tables=False, simulator=None):
+	'''
+	Replays the round robin season for teams (default: the current league's
+	teams) n times. Team results in the league are never touched.
+
+	Randomness comes from rng (a season_sim_rng.RNG), or a new RNG(seed).
+	The same seed gives exactly the same result for any number of workers.
+
+	With tables set, every game's final score distribution is worked out
+	once (see season_sim_odds) and each score is a single draw instead of
+	two binomial draws. The odds are the same, the random numbers are not
+
+	simulator names a registered simulator (default: the one config asks
+	for). biased_proportional and biased_proportional_table run on the
+	fast paths above; any other simulator scores each block of seasons with
+	its batched entry point, or game by game if it has none. It has to be
+	registered on import so that the worker processes know it too
+
+	Returns a dictionary with
+		'seasons'       - n
+		'names'         - team names, in team order
+		'points_offset' - the points total that column 0 of 'points' stands for
+		'points'        - array[team, points - points_offset] of season counts
+		'positions'     - array[team, position - 1] of season counts. Teams
+		                  level on points share the higher position
+		'titles'        - array[team] of title odds. A title shared between k
+		                  teams counts 1/k to each
+	'''
+	if teams is None:
+		teams = ss.state['teams']
+
+	if config is None:
+		config = ss.state['config']
+
+	if workers is None:
+		workers = os.cpu_count() or 1
+
+	simulator = ss_sim.for_config(config) if simulator is None \
+		else ss_sim.get(simulator)
+
+	if simulator.name == 'biased_proportional_table':
+		tables = True
+
+	offense, defense = ss_batch.team_ratings(teams)
+	_, home_ids, away_ids = ss_batch.schedule_to_arrays(
+		ss.build_round_robin(len(teams)))
+
+	points = points_table(config)
+	offset, width = points_range(len(teams), home_ids, away_ids, points)
+
+	if rng is None:
+		rng = ss_rng.RNG(seed)
+
+	# Each chunk gets its own child stream, so the streams are independent
+	# no matter which process ends up running them
+	chunk_seasons = min(MAX_CHUNK_SEASONS, max(1, -(-n // TARGET_CHUNKS)))
+	jobs = []
+
+	for chunk, start in enumerate(range(0, n, chunk_seasons)):
+		jobs.append((min(chunk_seasons, n - start), offense, defense, home_ids,
+			away_ids, points, offset, width, bias,
+			rng.chunk(chunk).seed_sequence, tables, simulator.name))
+
+	if workers == 1:
+		partials = map(simulate_chunk, jobs)
+	else:
+		with ProcessPoolExecutor(max_workers=workers) as pool:
+			partials = list(pool.map(simulate_chunk, jobs))
+
+	result = {
+		'seasons': n,
+		'names': [team.name for team in teams],
+		'points_offset': offset,
+		'points': np.zeros((len(teams), width), dtype=np.int64),
+		'positions': np.zeros((len(teams), len(teams)), dtype=np.int64),
+		'titles': np.zeros(len(teams), dtype=np.float64),
+	}
+
+	# Workers only ship back histograms, so merging is just adding them up
+	for points_hist, position_hist, titles in partials:
+		result['points'] += points_hist
+		result['positions'] += position_hist
+		result['titles'] += titles
+
+	if n > 0:
+		result['titles'] /= n
+
+	return result
+
+def simulate_chunk(job):
+	# Worker entry point- simulates a number of seasons and returns the
+	# (points, positions, titles) histograms for them
+	(seasons, offense, defense, home_ids, away_ids, points, offset, width,
+		bias, seed, tables, simulator) = job
+
+	rng = np.random.default_rng(seed)
+	num_teams = len(offense)
+	num_games = len(home_ids)
+
+	points_hist = np.zeros(num_teams * width, dtype=np.int64)
+	position_hist = np.zeros(num_teams * num_teams, dtype=np.int64)
+	titles = np.zeros(num_teams, dtype=np.float64)
+
+	if num_games == 0:
+		return (points_hist.reshape(num_teams, width),
+			position_hist.reshape(num_teams, num_teams), titles)
+
+	home_p = ss_batch.scoring_probability(offense[home_ids], defense[away_ids],
+		bias)
+	away_p = ss_batch.scoring_probability(offense[away_ids], defense[home_ids],
+		bias)
+
+	if tables:
+		table = ss_odds.cdf_table(home_p, away_p)
+
+	# Simulators other than biased_proportional get a TeamStore to score
+	# against and the game arrays repeated for every season in a block
+	plugin = None
+
+	if simulator not in ('biased_proportional', 'biased_proportional_table'):
+		plugin = ss_sim.get(simulator)
+		store = team.TeamStore(num_teams)
+		store.extend([str(team_id) for team_id in range(num_teams)], offense,
+			defense)
+
+	block = max(1, BLOCK_GAMES // num_games)
+
+	for start in range(0, seasons, block):
+		size = min(block, seasons - start)
+
+		if plugin is not None:
+			home_scores, away_scores = plugin.simulate_games(store,
+				np.tile(home_ids, size), np.tile(away_ids, size), rng)
+			home_scores = np.asarray(home_scores).reshape(size, num_games)
+			away_scores = np.asarray(away_scores).reshape(size, num_games)
+		elif tables:
+			home_scores, away_scores = ss_odds.split_outcomes(
+				ss_odds.sample_outcomes(table, rng, size))
+		else:
+			home_scores = rng.binomial(ss_batch.INNINGS, home_p,
+				size=(size, num_games))
+			away_scores = rng.binomial(ss_batch.INNINGS, away_p,
+				size=(size, num_games))
+
+		totals = season_points(home_scores, away_scores, home_ids, away_ids,
+			num_teams, points)
+		ranks = competition_ranks(totals)
+
+		team_ids = np.arange(num_teams)
+
+		points_hist += np.bincount((team_ids * width + totals - offset).ravel(),
+			minlength=num_teams * width)
+		position_hist += np.bincount((team_ids * num_teams + ranks).ravel(),
+			minlength=num_teams * num_teams)
+
+		leaders = ranks == 0
+		titles += (leaders / leaders.sum(axis=1, keepdims=True)).sum(axis=0)
+
+	return (points_hist.reshape(num_teams, width),
+		position_hist.reshape(num_teams, num_teams), titles)
+
+def season_points(home_scores, away_scores, home_ids, away_ids, num_teams,
+	points):
+	# Turns a block of (season, game) scores into a (season, team) array of
+	# points totals
+	win, tie, loss = points
+	seasons = home_scores.shape[0]
+
+	home_points = np.where(home_scores > away_scores, win,
+		np.where(home_scores == away_scores, tie, loss))
+	away_points = np.where(away_scores > home_scores, win,
+		np.where(home_scores == away_scores, tie, loss))
+
+	rows = np.arange(seasons)[:, None] * num_teams
+
+	totals = np.bincount((rows + home_ids).ravel(), home_points.ravel(),
+		minlength=seasons * num_teams)
+	totals += np.bincount((rows + away_ids).ravel(), away_points.ravel(),
+		minlength=seasons * num_teams)
+
+	return totals.reshape(seasons, num_teams).astype(np.int64)
+
+def competition_ranks(totals):
+	# 0-based "1224" style ranks for every row of a (season, team) points
+	# array- teams level on points share the best position
+	seasons, num_teams = totals.shape
+
+	order = np.argsort(-totals, axis=1, kind='stable')
+	ordered = np.take_along_axis(totals, order, axis=1)
+
+	# The rank of a sorted slot is the index of the first slot with the same
+	# points total
+	first = np.zeros(ordered.shape, dtype=np.int64)
+	first[:, 1:] = np.where(ordered[:, 1:] != ordered[:, :-1],
+		np.arange(1, num_teams), 0)
+	first = np.maximum.accumulate(first, axis=1)
+
+	ranks = np.empty_like(first)
+	np.put_along_axis(ranks, order, first, axis=1)
+
+	return ranks
+
+def points_table(config):
+	# Points for a (win, tie, loss). Histograms are indexed by points so these
+	# have to be whole numbers
+	points = (config['POINTS_ON_WIN'], config['POINTS_ON_TIE'],
+		config['POINTS_ON_LOSS'])
+
+	if any(int(value) != value for value in points):
+		raise ValueError('Monte Carlo needs whole number points, got %s' %
+			(points,))
+
+	return tuple(int(value) for value in points)
+
+def points_range(num_teams, home_ids, away_ids, points):
+	# Returns (offset, width) for a histogram able to hold any final points
+	# total that any team can reach
+	games = np.bincount(home_ids, minlength=num_teams) \
+		+ np.bincount(away_ids, minlength=num_teams)
+
+	low = int((games * min(points)).min()) if num_teams else 0
+	high = int((games * max(points)).max()) if num_teams else 0
+
+	return (low, high - low + 1)
@@ -0,0 +1,143 @@
+###############################################################################
+#  Exact score distributions for season_sim. Under biased_proportional each  #
+#  team's score is Binomial(5, p), so the joint distribution of a game's     #
+#  final score only depends on the two teams' ratings and the bias. It is    #
+#  worked out once per pairing and then a whole score is one random draw     #
+###############################################################################
+
+import functools
+import math
+
+import numpy as np
+
+import season_sim_batch as ss_batch
+import season_sim_rng as ss_rng
+
+# Scores run from 0 to INNINGS, so a game has OUTCOMES possible final scores.
+# Outcome i is the score divmod(i, SCORES)
+SCORES = ss_batch.INNINGS + 1
+OUTCOMES = SCORES * SCORES
+
+# Distributions are kept as integer thresholds out of 2 ** CDF_BITS and
+# sampled with a random integer below that. Being integers, the rows of many
+# games can be searched as one sorted array without rounding trouble
+CDF_BITS = 32
+
+# Number of pairings whose distributions are kept by score_cdf()
+CACHE_SIZE = 1 << 16
+
+def binomial_pmf(p):
+	# Array[..., k] of the probability of scoring k out of INNINGS, for an
+	# array of scoring probabilities p
+	p = np.asarray(p, dtype=np.float64)[..., None]
+	k = np.arange(SCORES)
+	choose = np.array([math.comb(ss_batch.INNINGS, i) for i in range(SCORES)],
+		dtype=np.float64)
+
+	return choose * p ** k * (1 - p) ** (ss_batch.INNINGS - k)
+
+def score_pmf(home_p, away_p):
+	# Array[..., outcome] of the joint final score distribution of games
+	# with the given home and away scoring probabilities
+	joint = binomial_pmf(home_p)[..., :, None] \
+		* binomial_pmf(away_p)[..., None, :]
+
+	return joint.reshape(joint.shape[:-2] + (OUTCOMES,))
+
+def score_rows(p):
+	# binomial_pmf(p) as a list of arrays, one per score. Powers are built up
+	# by multiplying, which is much quicker than raising to each power
+	p = np.asarray(p, dtype=np.float64)
+	powers = [np.ones_like(p)]
+	complements = [np.ones_like(p)]
+
+	for _ in range(ss_batch.INNINGS):
+		powers.append(powers[-1] * p)
+		complements.append(complements[-1] * (1 - p))
+
+	return [math.comb(ss_batch.INNINGS, k) * powers[k]
+		* complements[ss_batch.INNINGS - k] for k in range(SCORES)]
+
+def outcome_probabilities(home_p, away_p):
+	# (home win, tie, away win) probabilities for arrays of home and away
+	# scoring probabilities. Goes through the scores one at a time, each side
+	# against the other's chance of scoring less, so only a handful of arrays
+	# the size of home_p are ever needed
+	home = score_rows(home_p)
+	away = score_rows(away_p)
+	shape = np.broadcast(home[0], away[0]).shape
+
+	home_win, tie, away_win = np.zeros(shape), np.zeros(shape), np.zeros(shape)
+	home_below, away_below = np.zeros(shape), np.zeros(shape)
+
+	for score in range(SCORES):
+		home_win += home[score] * away_below
+		away_win += away[score] * home_below
+		tie += home[score] * away[score]
+
+		home_below += home[score]
+		away_below += away[score]
+
+	return (home_win, tie, away_win)
+
+def game_outcomes(teams, home_ids, away_ids, bias=10):
+	# Exact biased_proportional odds in the simulator registry's outcomes form
+	offense, defense = ss_batch.team_ratings(teams)
+
+	return outcome_probabilities(
+		ss_batch.scoring_probability(offense[home_ids], defense[away_ids], bias),
+		ss_batch.scoring_probability(offense[away_ids], defense[home_ids], bias))
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def score_cdf(home_off, home_def, away_off, away_def, bias=10):
+	'''
+	Cumulative distribution over the OUTCOMES final scores of one game, as a
+	tuple of integer thresholds out of 2 ** CDF_BITS (the last is exactly
+	that), so that a uniform random integer below 2 ** CDF_BITS can be
+	bisected into an outcome
+	'''
+	home_p = ss_batch.scoring_probability(home_off, away_def, bias)
+	away_p = ss_batch.scoring_probability(away_off, home_def, bias)
+
+	return tuple(cdf_table(home_p, away_p).tolist())
+
+def cdf_table(home_p, away_p):
+	# Integer cdf thresholds, array[..., outcome], for arrays of home and away
+	# scoring probabilities. The last column is exactly 2 ** CDF_BITS
+	cdf = np.cumsum(score_pmf(home_p, away_p), axis=-1)
+	table = np.rint(cdf * (1 << CDF_BITS)).astype(np.uint64)
+	table[..., -1] = 1 << CDF_BITS
+
+	return table
+
+def sample_outcomes(table, rng, size):
+	'''
+	Draws size seasons of every game in table (a 2D cdf_table()) with a
+	single random integer per game. Returns array[season, game] of outcomes.
+
+	Row g of the table is shifted up by g * 2 ** CDF_BITS, so the whole table
+	is one sorted array and one searchsorted call finds every outcome
+	'''
+	num_games = table.shape[0]
+	offsets = np.arange(num_games, dtype=np.uint64) << np.uint64(CDF_BITS)
+	flat = (table + offsets[:, None]).ravel()
+
+	draws = rng.integers(0, 1 << CDF_BITS, size=(size, num_games),
+		dtype=np.uint64) + offsets
+
+	outcomes = np.searchsorted(flat, draws, side='right')
+
+	return outcomes - np.arange(num_games) * OUTCOMES
+
+def split_outcomes(outcomes):
+	# (home_scores, away_scores) for an array of outcomes
+	return np.divmod(outcomes, SCORES)
+
+def table_games(teams, home_ids, away_ids, rng=None, bias=10):
+	# biased_proportional_table in the simulator registry's batch form
+	offense, defense = ss_batch.team_ratings(teams)
+	table = cdf_table(
+		ss_batch.scoring_probability(offense[home_ids], defense[away_ids], bias),
+		ss_batch.scoring_probability(offense[away_ids], defense[home_ids], bias))
+
+	return split_outcomes(sample_outcomes(table, ss_rng.generator(rng), 1)[0])
@@ -0,0 +1,109 @@
+###############################################################################
+#  Opt-in instrumentation for season_sim. Hot-path functions are tagged with  #
+#  a phase (scheduling, matchups, bookkeeping, standings, save, load) and,    #
+#  while profiling is enabled, every call records its count and time. While  #
+#  it is disabled a tagged function costs one flag check                      #
+###############################################################################
+
+import functools
+import time
+
+# Report order of the phases. Unknown phases are reported after these
+PHASES = ('schedule', 'matchup', 'batch', 'bookkeeping', 'standings', 'save',
+	'load')
+
+enabled = False
+
+# phase -> [calls, total seconds, seconds spent in nested tagged calls]
+stats = {}
+
+# Start times and nested time of the tagged calls currently running, so that
+# nested phases (e.g. bookkeeping inside matchup) are not counted twice in the
+# self times
+stack = []
+
+clock = time.perf_counter
+
+def enable(clear=True):
+	global enabled
+
+	if clear:
+		reset()
+
+	enabled = True
+
+def disable():
+	global enabled
+
+	enabled = False
+	del stack[:]
+
+def reset():
+	stats.clear()
+	del stack[:]
+
+def timed(phase):
+	'''
+	Decorator that records calls to the function under phase while profiling
+	is enabled
+	'''
+	def decorate(function):
+		@functools.wraps(function)
+		def wrapper(*args, **kwargs):
+			if not enabled:
+				return function(*args, **kwargs)
+
+			frame = [clock(), 0.0]
+			stack.append(frame)
+
+			try:
+				return function(*args, **kwargs)
+			finally:
+				elapsed = clock() - frame[0]
+				stack.pop()
+
+				if stack:
+					stack[-1][1] += elapsed
+
+				record = stats.get(phase)
+
+				if record is None:
+					record = stats[phase] = [0, 0.0, 0.0]
+
+				record[0] += 1
+				record[1] += elapsed
+				record[2] += frame[1]
+
+		return wrapper
+
+	return decorate
+
+def report():
+	'''
+	Returns {phase: {'calls', 'total', 'self'}} with times in seconds. 'total'
+	includes time spent in other tagged phases called from this one, 'self'
+	does not
+	'''
+	phases = [phase for phase in PHASES if phase in stats] \
+		+ sorted(phase for phase in stats if phase not in PHASES)
+
+	return {phase: {
+		'calls': stats[phase][0],
+		'total': stats[phase][1],
+		'self': stats[phase][1] - stats[phase][2],
+	} for phase in phases}
+
+def format_report():
+	# The report as a printable table
+	rows = ["Phase       |    Calls |  Total (s) |   Self (s) |  Per call (us)",
+		"------------+----------+------------+------------+---------------"]
+
+	for phase, record in report().items():
+		rows.append("%s|%9d |%11.4f |%11.4f |%14.2f" % (phase.ljust(12),
+			record['calls'], record['total'], record['self'],
+			1e6 * record['total'] / record['calls']))
+
+	if len(rows) == 2:
+		rows.append("Nothing recorded")
+
+	return '\n'.join(rows)
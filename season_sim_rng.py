@@ -0,0 +1,87 @@
+###############################################################################
+#  Random number streams for season_sim. An RNG can be seeded, and can be     #
+#  split into child streams (one per week, one per chunk of Monte Carlo       #
+#  seasons) that are independent of each other and of how work is shared    #
+#  out, so parallel runs give exactly the same results as serial ones         #
+###############################################################################
+
+import random
+
+import numpy as np
+
+# First element of a child stream's key, so that e.g. week 3 and chunk 3 are
+# never the same stream
+WEEK_STREAM = 1
+CHUNK_STREAM = 2
+SWEEP_STREAM = 3
+BRANCH_STREAM = 4
+
+class RNG:
+	'''
+	A seedable random stream. It offers randint() like the random module, so
+	scalar simulators can take either, and a NumPy Generator for the batch
+	engines. Both are derived from the same SeedSequence.
+
+	A stream is identified by its seed and a key- child(*key) gives the
+	stream for seed + key, which is the same whichever process asks for it
+	'''
+	def __init__(self, seed=None, key=()):
+		# Without a seed, draw fresh entropy but remember it so children are
+		# still consistent with each other
+		if seed is None:
+			seed = np.random.SeedSequence().entropy
+
+		self.seed = seed
+		self.key = tuple(key)
+		self.seed_sequence = np.random.SeedSequence(seed, spawn_key=self.key)
+
+		# The Generator's PCG64 takes the first 8 words of the sequence's
+		# state, so random.Random is seeded from the 4 words after them
+		state = self.seed_sequence.generate_state(12, dtype=np.uint32)[8:]
+		self.random = random.Random(int.from_bytes(state.tobytes(), 'little'))
+
+		self._generator = None
+
+	def __repr__(self):
+		return 'RNG(%r, key=%r)' % (self.seed, self.key)
+
+	@property
+	def generator(self):
+		if self._generator is None:
+			self._generator = np.random.Generator(np.random.PCG64(
+				self.seed_sequence))
+
+		return self._generator
+
+	def randint(self, a, b):
+		return self.random.randint(a, b)
+
+	def child(self, *key):
+		return RNG(self.seed, self.key + key)
+
+	def week(self, week):
+		# The stream for one week of a season
+		return self.child(WEEK_STREAM, week)
+
+	def chunk(self, chunk):
+		# The stream for one chunk of Monte Carlo seasons
+		return self.child(CHUNK_STREAM, chunk)
+
+	def sweep(self, point):
+		# The stream for one point of a parameter sweep
+		return self.child(SWEEP_STREAM, point)
+
+	def branch(self, branch):
+		# The stream for one branch forked from a league snapshot
+		return self.child(BRANCH_STREAM, branch)
+
+def generator(rng):
+	# A NumPy Generator for rng, which may be an RNG, a Generator, a seed or
+	# None (fresh entropy)
+	if isinstance(rng, RNG):
+		return rng.generator
+
+	if isinstance(rng, np.random.Generator):
+		return rng
+
+	return np.random.default_rng(rng)
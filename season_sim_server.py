@@ -0,0 +1,330 @@
+###############################################################################
+#  Local league server for season_sim. It hosts any number of leagues in     #
+#  memory and answers json requests, one per line, over a TCP or unix       #
+#  socket. Simulation runs in an executor so other requests stay responsive #
+#                                                                             #
+#      python season_sim_server.py --port 8765                                #
+#      {"id": 1, "command": "create", "league": "a", "teams": [["A", 10, 5],  #
+#          ["B", 8, 8]], "seed": 1}                                           #
+#      {"id": 2, "command": "week", "league": "a"}                            #
+#      {"id": 3, "command": "standings", "league": "a"}                       #
+###############################################################################
+
+import argparse
+import asyncio
+import functools
+import json
+
+import season_sim as ss
+import season_sim_errors as ss_err
+import season_sim_import as ss_import
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# Longest request line accepted, so big team lists fit in one create
+MAX_REQUEST = 1 << 24
+
+class LeagueService:
+	'''
+	Leagues by name, plus a lock per league. Requests for different leagues
+	run concurrently; requests for the same league run one at a time, in the
+	order they arrive.
+
+	Simulation is run in executor (default: the event loop's thread pool),
+	everything else is quick and runs on the event loop
+	'''
+	def __init__(self, executor=None):
+		self.leagues = {}
+		self.locks = {}
+		self.executor = executor
+
+		# Loads waiting on or holding each name's lock. A load into a new name
+		# that fails only takes the lock away with it if it was the last
+		self.loading = {}
+
+		self.commands = {
+			'create': self.create,
+			'drop': self.drop,
+			'list': self.list_leagues,
+			'load': self.load,
+			'save': self.save,
+			'week': self.week,
+			'season': self.season,
+			'standings': self.standings,
+			'clinch': self.clinch,
+			'schedule': self.schedule,
+		}
+
+	async def handle(self, request):
+		# Runs one request and returns its response. Errors come back as
+		# responses rather than being raised
+		response = {'id': request.get('id') if isinstance(request, dict)
+			else None}
+
+		try:
+			if not isinstance(request, dict) \
+				or request.get('command') not in self.commands:
+				raise ss_err.ValidationError('Unknown command', None)
+
+			response['result'] = await self.commands[request['command']](request)
+			response['ok'] = True
+		except (ss_err.ValidationError, ss_err.EndOfSeasonError, OSError,
+			KeyError, TypeError, ValueError) as e:
+			response['ok'] = False
+			response['error'] = str(e) if not isinstance(e, KeyError) \
+				else 'Missing %s' % e
+
+			if getattr(e, 'errors', None):
+				response['errors'] = e.errors
+		except Exception as e:
+			# Anything else is a bug in a command, but it still gets an answer
+			# rather than taking the connection down
+			response['ok'] = False
+			response['error'] = '%s: %s' % (type(e).__name__, e)
+
+		return response
+
+	async def serve_client(self, reader, writer):
+		# Reads requests a line at a time. Each one is answered as soon as it
+		# finishes, so responses can come back out of order- match them up by
+		# id
+		pending = set()
+		write_lock = asyncio.Lock()
+
+		async def answer(line):
+			try:
+				request = json.loads(line)
+			except json.JSONDecodeError as e:
+				response = {'id': None, 'ok': False, 'error': str(e)}
+			else:
+				response = await self.handle(request)
+
+			async with write_lock:
+				writer.write(json.dumps(response).encode() + b'\n')
+				await writer.drain()
+
+		try:
+			while True:
+				line = await reader.readline()
+
+				if not line:
+					break
+
+				if line.strip():
+					task = asyncio.ensure_future(answer(line))
+					pending.add(task)
+					task.add_done_callback(pending.discard)
+
+			if pending:
+				await asyncio.gather(*pending)
+		except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+			pass
+		finally:
+			writer.close()
+
+	def league(self, request):
+		name = request['league']
+
+		if name not in self.leagues:
+			raise ss_err.ValidationError('No league named %s' % name, None)
+
+		return (self.leagues[name], self.locks[name])
+
+	async def run(self, function, *args, **kwargs):
+		# Runs a blocking call in the executor
+		loop = asyncio.get_running_loop()
+
+		return await loop.run_in_executor(self.executor,
+			functools.partial(function, *args, **kwargs))
+
+	###########################################################################
+	# Commands                                                                #
+	###########################################################################
+
+	async def create(self, request):
+		# A new league from "teams": [[name, offense, defense], ...], with an
+		# optional "seed" and points "config"
+		name = request['league']
+
+		if name in self.leagues:
+			raise ss_err.ValidationError('League %s already exists' % name, None)
+
+		names, offense, defense = ss_import.validate_rows(request['teams'])
+
+		league = ss.League(request.get('config'))
+		league.add_teams_to_state(names, offense, defense)
+		league.schedule()
+		league.init_league()
+
+		if 'seed' in request:
+			league.seed(request['seed'])
+
+		self.leagues[name] = league
+		self.locks.setdefault(name, asyncio.Lock())
+
+		return {'teams': len(names), 'weeks': len(league.state['schedule'])}
+
+	async def drop(self, request):
+		league, lock = self.league(request)
+
+		async with lock:
+			del self.leagues[request['league']]
+			del self.locks[request['league']]
+
+		return None
+
+	async def list_leagues(self, request):
+		return {name: {'week': league.current_week, 'teams': len(league.teams)}
+			for name, league in self.leagues.items()}
+
+	async def load(self, request):
+		# Loads a save into a league, creating it if needed
+		name = request['league']
+
+		if not ss.find_save(request['save']):
+			raise ss_err.ValidationError('No save with name %s' % request['save'],
+				None)
+
+		# The save goes into a fresh league, which only replaces (or becomes)
+		# the named one once it has loaded- a failed load leaves things as
+		# they were
+		league = ss.League()
+		lock = self.locks.setdefault(name, asyncio.Lock())
+		self.loading[name] = self.loading.get(name, 0) + 1
+
+		try:
+			async with lock:
+				await self.run(league.load, request['save'])
+
+				self.leagues[name] = league
+				self.locks.setdefault(name, lock)
+		finally:
+			self.loading[name] -= 1
+
+			if not self.loading[name]:
+				del self.loading[name]
+
+				if name not in self.leagues and self.locks.get(name) is lock:
+					del self.locks[name]
+
+		return {'week': league.current_week, 'teams': len(league.teams)}
+
+	async def save(self, request):
+		league, lock = self.league(request)
+
+		async with lock:
+			await self.run(league.save, request['save'])
+
+		return None
+
+	async def week(self, request):
+		# Simulates "count" weeks (default 1) and returns their games
+		league, lock = self.league(request)
+		count = int(request.get('count', 1))
+		batch = bool(request.get('batch', False))
+
+		def simulate():
+			return [league.simulate_week(batch=batch) for week in range(count)]
+
+		async with lock:
+			weeks = await self.run(simulate)
+
+		return {'week': league.current_week, 'games': weeks}
+
+	async def season(self, request):
+		# Simulates the rest of the season. The games played are only sent
+		# back if "games" is set
+		league, lock = self.league(request)
+		batch = bool(request.get('batch', False))
+
+		async with lock:
+			weeks = await self.run(league.simulate_season, batch=batch)
+
+		return {'week': league.current_week,
+			'games': weeks if request.get('games') else None}
+
+	async def standings(self, request):
+		# The table from first place down, or just the top "top" teams
+		league, lock = self.league(request)
+
+		async with lock:
+			index = league.standings()
+			teams = index.teams
+			team_ids = index.top(int(request['top'])) if 'top' in request \
+				else index.table()
+
+			return [{
+				'name': teams.names[team_id],
+				'wins': int(teams.wins[team_id]),
+				'losses': int(teams.losses[team_id]),
+				'ties': int(teams.ties[team_id]),
+				'points': index.points[team_id],
+			} for team_id in team_ids]
+
+	async def clinch(self, request):
+		# Every team that has clinched first place or been eliminated from it.
+		# The flow checks can take a while in a big league, so they run in the
+		# executor
+		league, lock = self.league(request)
+
+		async with lock:
+			statuses = await self.run(league.clinch_status)
+			names = league.teams.names
+
+			return {
+				'week': league.current_week,
+				'clinched': [names[team_id] for team_id, status
+					in enumerate(statuses) if status is ss.ClinchStatus.CLINCHED],
+				'eliminated': [names[team_id] for team_id, status
+					in enumerate(statuses) if status is ss.ClinchStatus.ELIMINATED],
+			}
+
+	async def schedule(self, request):
+		# The games of "week" (default: the current week) by team name
+		league, lock = self.league(request)
+
+		async with lock:
+			week = int(request.get('week', league.current_week))
+			names = league.teams.names
+
+			if not 1 <= week <= len(league.state['schedule']):
+				raise ss_err.ValidationError('No week %d in the schedule' % week,
+					None)
+
+			return {'week': week, 'games': [[names[home], names[away]]
+				for home, away in league.get_weekly_schedule(week)
+				if 'BYE' not in (home, away)]}
+
+async def serve(service=None, host=DEFAULT_HOST, port=DEFAULT_PORT, path=None):
+	# Starts the server (on a unix socket if path is given) and returns it
+	if service is None:
+		service = LeagueService()
+
+	if path is not None:
+		return await asyncio.start_unix_server(service.serve_client, path,
+			limit=MAX_REQUEST)
+
+	return await asyncio.start_server(service.serve_client, host, port,
+		limit=MAX_REQUEST)
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='season_sim league server')
+	parser.add_argument('--host', default=DEFAULT_HOST)
+	parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+	parser.add_argument('--unix', help='serve on this unix socket instead')
+	args = parser.parse_args(argv)
+
+	async def run():
+		server = await serve(host=args.host, port=args.port, path=args.unix)
+
+		async with server:
+			await server.serve_forever()
+
+	try:
+		asyncio.run(run())
+	except KeyboardInterrupt:
+		pass
+
+if __name__ == '__main__':
+	main()
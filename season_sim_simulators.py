@@ -0,0 +1,98 @@
+###############################################################################
+#  Simulator registry for season_sim. A simulator is registered by name with  #
+#  a scalar entry point (one game at a time) and optionally a batched one    #
+#  (arrays of games). Engines ask the registry to score games and get the    #
+#  batched version when there is one, per-game calls when there isn't        #
+###############################################################################
+
+import random
+
+import numpy as np
+
+import season_sim_errors as ss_err
+import season_sim_rng as ss_rng
+
+# Used when a league's config doesn't name a simulator
+DEFAULT_SIMULATOR = 'biased_proportional'
+
+# Config key naming the league's simulator. It is saved with the config
+CONFIG_KEY = 'SIMULATOR'
+
+class Simulator:
+	'''
+	A registered simulator.
+
+	scalar(home, away, rng=...) takes two teams and returns (home_score,
+	away_score); rng is anything with a randint().
+
+	batch(teams, home_ids, away_ids, rng=...), if given, takes the teams and
+	arrays of home/away team ids and returns (home_scores, away_scores)
+	arrays; rng is a NumPy Generator.
+
+	outcomes(teams, home_ids, away_ids), if given, returns the exact (home
+	win, tie, away win) probabilities of those games as arrays, for engines
+	that work out odds rather than sampling them (see season_sim_bracket).
+
+	Any entry point may take extra keyword options (e.g. bias)
+	'''
+	def __init__(self, name, scalar, batch=None, description='', outcomes=None):
+		self.name = name
+		self.scalar = scalar
+		self.batch = batch
+		self.description = description
+		self.outcomes = outcomes
+
+	def __repr__(self):
+		return 'Simulator(%r, batch=%s)' % (self.name, self.batch is not None)
+
+	def simulate_games(self, teams, home_ids, away_ids, rng=None, **options):
+		# Scores every game in one batched call, or one scalar call per game
+		# for simulators that only have a scalar entry point
+		if self.batch is not None:
+			return self.batch(teams, home_ids, away_ids,
+				rng=ss_rng.generator(rng), **options)
+
+		if rng is None:
+			rng = random
+		elif isinstance(rng, np.random.Generator):
+			rng = random.Random(int(rng.integers(1 << 63)))
+
+		home_scores = np.zeros(len(home_ids), dtype=np.int64)
+		away_scores = np.zeros(len(home_ids), dtype=np.int64)
+
+		for game, (home, away) in enumerate(zip(np.asarray(home_ids).tolist(),
+			np.asarray(away_ids).tolist())):
+			home_scores[game], away_scores[game] = self.scalar(teams[home],
+				teams[away], rng=rng, **options)
+
+		return (home_scores, away_scores)
+
+# Simulators by name
+registry = {}
+
+def register(name, scalar, batch=None, description='', outcomes=None):
+	# Adds (or replaces) a simulator and returns it. Simulators used by
+	# Monte Carlo workers should be registered when their module is imported,
+	# so that the workers have them too
+	simulator = Simulator(name, scalar, batch, description, outcomes)
+	registry[name] = simulator
+
+	return simulator
+
+def get(name=None):
+	# The simulator called name (default: DEFAULT_SIMULATOR)
+	if name is None:
+		name = DEFAULT_SIMULATOR
+
+	if name not in registry:
+		raise ss_err.ValidationError('Unknown simulator %s, choose from %s' % (
+			name, ', '.join(sorted(registry))), sorted(registry))
+
+	return registry[name]
+
+def for_config(config):
+	# The simulator a league's config asks for
+	return get(config.get(CONFIG_KEY))
+
+def names():
+	return sorted(registry)
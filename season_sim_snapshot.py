@@ -0,0 +1,79 @@
+###############################################################################
+#  Season snapshots for season_sim. A snapshot freezes a league at its       #
+#  current week, and any number of leagues can be forked from it. Forks    #
+#  share the snapshot's schedule, teams and game log copy-on-write, so      #
+#  each one only holds the results it goes on to play itself               #
+###############################################################################
+
+import season_sim_rng as ss_rng
+import team
+
+class Snapshot:
+	'''
+	A read-only copy of a league's state. state(branch) builds a new state
+	dictionary from it for League.restore()/League.from_snapshot().
+
+	Forks share the schedule, the team names and ratings and the games
+	played so far. A fork's W/L/T columns are copied the first time it
+	records a result, and its game log only stores its own games. Knockout
+	brackets and Swiss schedules move on with results, so each fork gets its
+	own copy
+	'''
+	def __init__(self, state):
+		teams = state['teams']
+
+		if not isinstance(teams, team.TeamStore):
+			store = team.TeamStore(len(teams))
+
+			for t in teams:
+				store.append(t)
+
+			teams = store
+
+		self.names = list(teams.names)
+		self.columns = teams.frozen()
+		self.game_log = state['game_log'].frozen()
+		self.schedule = branch_schedule(state['schedule'])
+		self.current_week = state['current_week']
+		self.active = state['active']
+		self.config = dict(state['config'])
+
+		# Only the seed and key are used- see state()
+		self.rng = state['rng']
+
+	def __repr__(self):
+		return 'Snapshot(%d teams, week %d, %d games)' % (len(self.names),
+			self.current_week, len(self.game_log))
+
+	def state(self, branch=None):
+		'''
+		A new state dictionary starting from the snapshot. With branch=None
+		it carries on with the league's own random stream, so it replays
+		what the league itself would; each branch number gets a stream of
+		its own (RNG.branch()) so forks play out independently
+		'''
+		rng = None
+
+		if self.rng is not None:
+			rng = ss_rng.RNG(self.rng.seed, self.rng.key) if branch is None \
+				else self.rng.branch(branch)
+
+		return {
+			'active': self.active,
+			'teams': team.TeamStore.from_columns(self.names, self.columns,
+				shared=True),
+			'schedule': branch_schedule(self.schedule),
+			'current_week': self.current_week,
+			'game_log': self.game_log.branch(),
+			'standings': None,
+			'journal': None,
+			'rng': rng,
+			'clinch': None,
+			'config': dict(self.config),
+		}
+
+def branch_schedule(schedule):
+	# Schedules that move on with results (knockout brackets, Swiss pairings)
+	# are copied so forks don't change each other's. The rest never change
+	# and are shared
+	return schedule.branch() if hasattr(schedule, 'branch') else schedule
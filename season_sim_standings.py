@@ -0,0 +1,115 @@
+###############################################################################
+#  Ranked standings index for season_sim. Teams are kept in buckets keyed by  #
+#  points, so after every result only the two teams involved have to move    #
+#  and the table never has to be re-sorted from scratch                       #
+###############################################################################
+
+import bisect
+
+class StandingsIndex:
+	'''
+	Incrementally maintained standings for a TeamStore. Call update() with a
+	team id whenever that team's record changes.
+
+	Teams level on points are ordered by team id, matching a stable sort of
+	the team list by points
+	'''
+	def __init__(self, teams, config):
+		self.teams = teams
+		self.rebuild(config)
+
+	def rebuild(self, config=None):
+		# Recomputes everything from the store, e.g. after teams were added or
+		# the points config changed
+		if config is not None:
+			self.points_config = (config['POINTS_ON_WIN'],
+				config['POINTS_ON_TIE'], config['POINTS_ON_LOSS'])
+
+		win, tie, loss = self.points_config
+
+		self.size = len(self.teams)
+		self.points = self.teams.points(win, tie, loss).tolist()
+
+		# points -> {team id: None}, used as an ordered set
+		self.buckets = {}
+
+		for team_id, points in enumerate(self.points):
+			self.buckets.setdefault(points, {})[team_id] = None
+
+		# Distinct points totals, ascending
+		self.levels = sorted(self.buckets)
+
+		self.names_version = None
+
+	@property
+	def name_width(self):
+		# Widest team name, so the table renderer doesn't have to look at
+		# every team for every row. Worked out again only after a rename
+		if self.names_version != self.teams.names_version:
+			self._name_width = max((len(name) for name in self.teams.names),
+				default=0)
+			self.names_version = self.teams.names_version
+
+		return self._name_width
+
+	def is_current(self, teams, config):
+		# True if this index still describes teams under config
+		return teams is self.teams and len(teams) == self.size \
+			and self.points_config == (config['POINTS_ON_WIN'],
+				config['POINTS_ON_TIE'], config['POINTS_ON_LOSS'])
+
+	def update(self, team_id):
+		# Moves a team to the bucket matching its current record
+		win, tie, loss = self.points_config
+		teams = self.teams
+
+		old = self.points[team_id]
+		new = teams.wins[team_id] * win + teams.ties[team_id] * tie \
+			+ teams.losses[team_id] * loss
+		new = new.item()
+
+		if new == old:
+			return
+
+		bucket = self.buckets[old]
+		del bucket[team_id]
+
+		if not bucket:
+			del self.buckets[old]
+			del self.levels[bisect.bisect_left(self.levels, old)]
+
+		if new not in self.buckets:
+			self.buckets[new] = {}
+			bisect.insort(self.levels, new)
+
+		self.buckets[new][team_id] = None
+		self.points[team_id] = new
+
+	def iter_ranked(self):
+		# Yields team ids from first place down
+		for points in reversed(self.levels):
+			yield from sorted(self.buckets[points])
+
+	def top(self, k):
+		# The team ids of the top k teams
+		leaders = []
+
+		for points in reversed(self.levels):
+			if len(leaders) >= k:
+				break
+
+			leaders.extend(sorted(self.buckets[points]))
+
+		return leaders[:k]
+
+	def rank(self, team_id):
+		# 1-based position of a team. Teams level on points share the higher
+		# position
+		points = self.points[team_id]
+		above = self.levels[bisect.bisect_right(self.levels, points):]
+
+		return 1 + sum(len(self.buckets[level]) for level in above)
+
+	def table(self):
+		# Every team id, in table order
+		return list(self.iter_ranked())
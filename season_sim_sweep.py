@@ -0,0 +1,202 @@
+###############################################################################
+#  Rule sweeps for season_sim. A team's points only depend on its win, tie   #
+#  and loss counts, so results are simulated (or read from the game log)    #
+#  once and then scored under any number of points systems with a single    #
+#  matrix product. Sweeps over the bias simulate each value in parallel      #
+###############################################################################
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import season_sim as ss
+import season_sim_batch as ss_batch
+import season_sim_mc as ss_mc
+import season_sim_rng as ss_rng
+
+# Columns of a counts array
+WIN = 0
+TIE = 1
+LOSS = 2
+
+def points_matrix(configs):
+	'''
+	Array[outcome, config] of the points each config gives for a win, tie
+	and loss (rows WIN, TIE, LOSS). A config is either a league config
+	dictionary with the POINTS_ON_* keys or a (win, tie, loss) tuple
+	'''
+	columns = []
+
+	for config in configs:
+		if isinstance(config, dict):
+			config = (config['POINTS_ON_WIN'], config['POINTS_ON_TIE'],
+				config['POINTS_ON_LOSS'])
+
+		columns.append(config)
+
+	return np.array(columns, dtype=np.float64).reshape(-1, 3).T
+
+def result_counts(home_scores, away_scores, home_ids, away_ids, num_teams):
+	'''
+	Array[..., team, outcome] of win/tie/loss counts for arrays of scores
+	whose last axis is the game (any leading axes, e.g. seasons, are kept)
+	'''
+	home_scores = np.asarray(home_scores)
+	away_scores = np.asarray(away_scores)
+	rows = home_scores.shape[:-1]
+	num_rows = int(np.prod(rows))
+
+	# Outcome of every game from the home team's side. The away team's is the
+	# mirror image- LOSS - outcome
+	outcome = np.where(home_scores > away_scores, WIN,
+		np.where(home_scores == away_scores, TIE, LOSS)).reshape(num_rows, -1)
+	base = (np.arange(num_rows)[:, None] * num_teams) * 3
+
+	counts = np.bincount((base + np.asarray(home_ids) * 3 + outcome).ravel(),
+		minlength=num_rows * num_teams * 3)
+	counts += np.bincount((base + np.asarray(away_ids) * 3 + LOSS
+		- outcome).ravel(), minlength=num_rows * num_teams * 3)
+
+	return counts.reshape(rows + (num_teams, 3))
+
+def log_counts(games, num_teams, weeks=None):
+	# Array[team, outcome] of the counts in a game log, optionally only for
+	# the given weeks
+	week = games.column('week')
+	selected = np.ones(len(week), dtype=bool) if weeks is None \
+		else np.isin(week, list(weeks))
+	columns = games.select(np.flatnonzero(selected))
+
+	return result_counts(columns['home_score'], columns['away_score'],
+		columns['home'], columns['away'], num_teams)
+
+def rescore(configs, teams=None, games=None, weeks=None):
+	'''
+	Standings of the games already played (default: the current league's
+	game log, or only the given weeks of it) under every points config in
+	configs, without simulating anything again.
+
+	Returns a dictionary with
+		'names'     - team names, in team order
+		'configs'   - array[config, outcome] of (win, tie, loss) points
+		'counts'    - array[team, outcome] of win/tie/loss counts
+		'points'    - array[config, team] of points totals
+		'positions' - array[config, team] of 1-based positions. Teams level
+		              on points share the higher position
+	'''
+	if teams is None:
+		teams = ss.state['teams']
+
+	if games is None:
+		games = ss.state['game_log']
+
+	matrix = points_matrix(configs)
+	counts = log_counts(games, len(teams), weeks)
+	points = (counts @ matrix).T
+
+	return {
+		'names': [team.name for team in teams],
+		'configs': matrix.T,
+		'counts': counts,
+		'points': points,
+		'positions': ss_mc.competition_ranks(points) + 1,
+	}
+
+def bias_sweep(biases, seasons=1, configs=None, teams=None, workers=None,
+	seed=None, rng=None):
+	'''
+	Plays seasons round robin seasons for teams (default: the current
+	league's teams) at every bias in biases, one process per bias, and
+	scores all of them under every points config in configs (default: the
+	league's own). Team results in the league are never touched.
+
+	Every bias gets its own random stream from rng (or a new RNG(seed)), so
+	results don't depend on the number of workers.
+
+	Returns a dictionary with
+		'names'   - team names, in team order
+		'biases'  - the biases, in order
+		'configs' - array[config, outcome] of (win, tie, loss) points
+		'counts'  - array[bias, season, team, outcome] of win/tie/loss counts
+		'points'  - array[bias, config, team] of mean points totals
+		'titles'  - array[bias, config, team] of title odds. A title shared
+		            between k teams counts 1/k to each
+	'''
+	if seasons < 1:
+		raise ValueError('A sweep needs at least one season, got %s' % seasons)
+
+	if teams is None:
+		teams = ss.state['teams']
+
+	if configs is None:
+		configs = [ss.state['config']]
+
+	if workers is None:
+		workers = os.cpu_count() or 1
+
+	if rng is None:
+		rng = ss_rng.RNG(seed)
+
+	offense, defense = ss_batch.team_ratings(teams)
+	_, home_ids, away_ids = ss_batch.schedule_to_arrays(
+		ss.build_round_robin(len(teams)))
+
+	jobs = [(seasons, offense, defense, home_ids, away_ids, bias,
+		rng.sweep(index).seed_sequence) for index, bias in enumerate(biases)]
+
+	if workers == 1 or len(jobs) <= 1:
+		counts = list(map(sweep_chunk, jobs))
+	else:
+		with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+			counts = list(pool.map(sweep_chunk, jobs))
+
+	num_teams = len(teams)
+	counts = np.array(counts, dtype=np.int64).reshape(len(jobs), seasons,
+		num_teams, 3)
+	matrix = points_matrix(configs)
+
+	# array[bias, season, team, config] -> array[bias, config, season, team]
+	points = np.moveaxis(counts @ matrix, -1, 1)
+	leaders = ss_mc.competition_ranks(points.reshape(-1, num_teams)) == 0
+	shares = leaders / leaders.sum(axis=1, keepdims=True)
+
+	return {
+		'names': [team.name for team in teams],
+		'biases': list(biases),
+		'configs': matrix.T,
+		'counts': counts,
+		'points': points.mean(axis=2),
+		'titles': shares.reshape(points.shape).mean(axis=2),
+	}
+
+def sweep_chunk(job):
+	# Worker entry point- simulates the seasons for one bias and returns
+	# array[season, team, outcome] of their win/tie/loss counts
+	seasons, offense, defense, home_ids, away_ids, bias, seed = job
+
+	rng = np.random.default_rng(seed)
+	num_teams = len(offense)
+	num_games = len(home_ids)
+	counts = np.zeros((seasons, num_teams, 3), dtype=np.int64)
+
+	if num_games == 0:
+		return counts
+
+	home_p = ss_batch.scoring_probability(offense[home_ids], defense[away_ids],
+		bias)
+	away_p = ss_batch.scoring_probability(offense[away_ids], defense[home_ids],
+		bias)
+	block = max(1, ss_mc.BLOCK_GAMES // num_games)
+
+	for start in range(0, seasons, block):
+		size = min(block, seasons - start)
+		home_scores = rng.binomial(ss_batch.INNINGS, home_p,
+			size=(size, num_games))
+		away_scores = rng.binomial(ss_batch.INNINGS, away_p,
+			size=(size, num_games))
+
+		counts[start:start + size] = result_counts(home_scores, away_scores,
+			home_ids, away_ids, num_teams)
+
+	return counts
@@ -5,9 +5,34 @@
 
 import unittest
 import os
+import io
+import contextlib
+import json
+import asyncio
+import random
+import itertools
+
+import numpy as np
 
 import season_sim as ss
+import season_sim_errors as ss_err
 import season_sim_io as ss_io
+import season_sim_batch as ss_batch
+import season_sim_mc as ss_mc
+import season_sim_rng as ss_rng
+import season_sim_bench as ss_bench
+import season_sim_profile as ss_prof
+import season_sim_cli as ss_cli
+import season_sim_import as ss_import
+import season_sim_server as ss_server
+import season_sim_odds as ss_odds
+import season_sim_exact as ss_exact
+import season_sim_simulators as ss_sim
+import season_sim_sweep as ss_sweep
+import season_sim_clinch as ss_clinch
+import season_sim_bracket as ss_bracket
+import schedules
+import game_log
 import team
 
 class TestRRScheduling(unittest.TestCase):
@@ -42,8 +67,92 @@ class TestRRScheduling(unittest.TestCase):
                 self.assertEqual(set(opponents), set(correct_opponents))
 
 
+class TestScheduleValidation(unittest.TestCase):
+    def test_round_robins_valid(self):
+        # The validator generalizes the 5 team check above to any size
+        for num_teams in (0, 1, 2, 3, 4, 5, 16, 33, 1001):
+            with self.subTest(num_teams=num_teams):
+                schedules.validate_round_robin(
+                    schedules.RoundRobinSchedule(num_teams), num_teams)
+
+    def test_rejects_repeated_week(self):
+        broken = dict(schedules.RoundRobinSchedule(6))
+        broken[2] = broken[1]
+
+        with self.assertRaises(ss_err.ValidationError) as context:
+            schedules.validate_round_robin(broken)
+
+        self.assertTrue(any('already played' in error
+            for error in context.exception.errors))
+
+    def test_rejects_double_booking(self):
+        broken = dict(schedules.RoundRobinSchedule(4))
+        broken[1] = ((0, 1), (1, 2))
+
+        with self.assertRaises(ss_err.ValidationError):
+            schedules.validate_round_robin(broken, 4)
+
+    def test_opponent_index(self):
+        lazy = schedules.RoundRobinSchedule(7)
+        indexed = schedules.IndexedSchedule(dict(lazy))
+
+        self.assertEqual(indexed.opponents.shape, (7, 7))
+
+        for week in lazy:
+            for team in range(7):
+                self.assertEqual(indexed.opponent(team, week),
+                    lazy.opponent(team, week))
+
+    def test_indexed_schedule_changes(self):
+        # The opponent index follows changes to the weeks
+        sched = schedules.IndexedSchedule({1: ((0, 1), (2, 3))})
+        self.assertEqual(sched.opponent(0, 1), 1)
+
+        sched[1] = ((0, 2), (1, 3))
+        self.assertEqual(sched.opponent(0, 1), 2)
+
+        sched[2] = ((0, 3), (1, 2))
+        self.assertEqual(sched.opponent(0, 2), 3)
+
+        del sched[2]
+        self.assertEqual(sched.opponents.shape, (4, 1))
+
+class TestLazyRoundRobin(unittest.TestCase):
+    def test_opponent_matches_weeks(self):
+        # opponent() is worked out independently of the week pairings, so
+        # the two must agree for every team and week
+        for num_teams in (2, 3, 8, 11):
+            sched = schedules.RoundRobinSchedule(num_teams)
+
+            for week in sched:
+                for home, away in sched[week]:
+                    with self.subTest(num_teams=num_teams, week=week):
+                        self.assertEqual(sched.opponent(home, week), away)
+                        self.assertEqual(sched.opponent(away, week), home)
+
+    def test_arrays_match_weeks(self):
+        sched = schedules.RoundRobinSchedule(9)
+
+        for week in sched:
+            home, away = sched.arrays(week)
+            expected = [m for m in sched[week] if 'BYE' not in m]
+
+            self.assertEqual(list(zip(home.tolist(), away.tolist())), expected)
+
+    def test_large_league(self):
+        # Nothing is built up front, so any week of a huge league is cheap
+        sched = schedules.RoundRobinSchedule(50000)
+
+        self.assertEqual(len(sched), 49999)
+        self.assertEqual(len(sched[31337]), 25000)
+        self.assertEqual(sched.opponent(sched.opponent(123, 777), 777), 123)
+
+
 class TestMatchups(unittest.TestCase):
     def setUp(self):
+        # Other tests simulate weeks on the global state, so start fresh
+        ss.startup()
+
         self.teams = []
 
         self.teams.append(team.Team("Team A"))
@@ -86,6 +195,1734 @@ class TestMatchups(unittest.TestCase):
         # Make sure we have the same number of wins and losses
         self.assertEqual(wins, losses)
 
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        ss.startup()
+
+        for name, off, dfn in [("A", 30, 5), ("B", 10, 10), ("C", 0, 20),
+            ("D", 5, 5), ("E", 50, 0)]:
+            ss.add_team_to_state(name, off, dfn)
+
+        self.schedule = ss.round_robin_schedule(5)
+
+    def test_schedule_to_arrays(self):
+        weeks, home, away = ss_batch.schedule_to_arrays(self.schedule)
+
+        # 5 teams play 10 games, and no byes should make it into the arrays
+        self.assertEqual(len(weeks), 10)
+        self.assertEqual(len(home), len(away))
+        self.assertTrue(np.all(home != away))
+
+    def test_same_distribution_as_scalar(self):
+        # Both engines should give every score from 0-5 with (statistically)
+        # the same frequency
+        home, away = ss.state['teams'][0], ss.state['teams'][2]
+        trials = 20000
+
+        random.seed(1)
+        scalar = np.array([ss.biased_proportional(home, away)
+            for i in range(trials)])
+
+        batch = np.column_stack(ss_batch.biased_proportional_batch(
+            np.full(trials, 30), np.full(trials, 5), np.full(trials, 0),
+            np.full(trials, 20), rng=np.random.default_rng(1)))
+
+        for side in range(2):
+            scalar_freq = np.bincount(scalar[:, side], minlength=6) / trials
+            batch_freq = np.bincount(batch[:, side], minlength=6) / trials
+
+            with self.subTest(side=side):
+                self.assertTrue(np.allclose(scalar_freq, batch_freq, atol=0.02))
+
+    def test_batch_season(self):
+        ss.simulate_season(self.schedule, batch=True)
+
+        for team in ss.state['teams']:
+            self.assertEqual(sum(team.results.values()), 4)
+
+class TestMonteCarlo(unittest.TestCase):
+    def setUp(self):
+        self.teams = [team.Team("Team %d" % i, offense=10 * i, defense=5)
+            for i in range(6)]
+
+    def test_distributions(self):
+        result = ss_mc.simulate_many_seasons(500, self.teams, workers=1, seed=3)
+
+        # Every team gets exactly one points total and one position per season
+        self.assertTrue(np.all(result['points'].sum(axis=1) == 500))
+        self.assertTrue(np.all(result['positions'].sum(axis=1) == 500))
+        self.assertAlmostEqual(result['titles'].sum(), 1.0)
+
+        # The strongest offense should be the title favourite
+        self.assertEqual(int(np.argmax(result['titles'])), 5)
+
+        # The league itself must be untouched
+        for t in self.teams:
+            self.assertEqual(sum(t.results.values()), 0)
+
+    def test_process_pool(self):
+        result = ss_mc.simulate_many_seasons(40, self.teams, workers=2, seed=3)
+
+        self.assertTrue(np.all(result['positions'].sum(axis=1) == 40))
+
+    def test_reproducible_across_workers(self):
+        serial = ss_mc.simulate_many_seasons(300, self.teams, workers=1, seed=9)
+        parallel = ss_mc.simulate_many_seasons(300, self.teams, workers=3,
+            seed=9)
+
+        for key in ('points', 'positions', 'titles'):
+            self.assertTrue(np.array_equal(serial[key], parallel[key]))
+
+    def test_competition_ranks(self):
+        ranks = ss_mc.competition_ranks(np.array([[3, 7, 3, 1]]))
+
+        self.assertEqual(ranks.tolist(), [[1, 0, 1, 3]])
+
+class TestTeamStore(unittest.TestCase):
+    def setUp(self):
+        # Start small so that adding teams has to grow the columns
+        self.store = team.TeamStore(capacity=2)
+
+        for i in range(5):
+            self.store.add("Team %d" % i, offense=i, defense=2 * i, wins=i,
+                losses=1, tie=2)
+
+    def test_views(self):
+        view = self.store[3]
+
+        self.assertEqual(len(self.store), 5)
+        self.assertEqual(view.name, "Team 3")
+        self.assertEqual(view.defense, 6)
+        self.assertEqual(dict(view.results), {'win': 3, 'loss': 1, 'tie': 2})
+
+        # Writes through a view land in the store
+        view.results['win'] += 1
+        self.assertEqual(self.store.wins[3], 4)
+
+    def test_points(self):
+        points = self.store.points(3, 1, 0)
+
+        self.assertEqual(points.tolist(), [2, 5, 8, 11, 14])
+
+    def test_equality_with_list(self):
+        teams = [team.Team("Team %d" % i, offense=i, defense=2 * i, wins=i,
+            losses=1, tie=2) for i in range(5)]
+
+        self.assertTrue(self.store == teams)
+
+class TestStandings(unittest.TestCase):
+    def setUp(self):
+        ss.startup()
+
+        for i in range(7):
+            ss.add_team_to_state("Team %d" % i, 10 * i, 10)
+
+        ss.round_robin_schedule(7)
+        ss.init_league()
+
+    def test_matches_full_sort(self):
+        # After every week the incrementally kept table must match sorting
+        # the teams from scratch
+        for week in range(1, 8):
+            ss.simulate_week()
+
+            expected = sorted(range(7),
+                key=lambda i: -ss.calc_team_points(ss.state['teams'][i]))
+
+            with self.subTest(week=week):
+                self.assertEqual(ss.standings().table(), expected)
+
+    def test_top_and_rank(self):
+        ss.simulate_season()
+
+        index = ss.standings()
+        table = index.table()
+        points = ss.calc_all_points()
+
+        self.assertEqual(index.top(3), table[:3])
+        self.assertEqual(index.rank(table[0]), 1)
+
+        for team_id in range(7):
+            self.assertEqual(index.rank(team_id),
+                1 + int((points > points[team_id]).sum()))
+
+    def test_rebuilt_when_teams_added(self):
+        ss.add_team_to_state("A much longer team name", 0, 0)
+
+        self.assertEqual(ss.standings().size, 8)
+        self.assertEqual(ss.standings().name_width, 23)
+
+    def test_name_width_after_rename(self):
+        self.assertEqual(ss.standings().name_width, 6)
+
+        ss.state['teams'][2].name = "Renamed team"
+        self.assertEqual(ss.standings().name_width, 12)
+        rows = ss_cli.format_table().splitlines()
+        self.assertEqual({len(row.split("|")[0].split("+")[0]) for row in rows},
+            {12})
+
+    def test_teams_added_mid_season(self):
+        # Results for a team the index doesn't know about yet rebuild it
+        ss.standings()
+        ss.add_team_to_state("Late entry", 70, 10)
+        ss.round_robin_schedule(8)
+        ss.simulate_season()
+
+        points = ss.calc_all_points()
+
+        self.assertEqual(ss.standings().size, 8)
+        self.assertEqual([ss.standings().points[i] for i in range(8)],
+            points.tolist())
+
+class TestGameLog(unittest.TestCase):
+    def setUp(self):
+        ss.startup()
+
+        for i in range(6):
+            ss.add_team_to_state("Team %d" % i, 10, 10)
+
+        ss.round_robin_schedule(6)
+        ss.init_league()
+
+    def test_season_logged(self):
+        ss.simulate_season()
+        log = ss.state['game_log']
+
+        # 6 teams, 5 weeks of 3 games
+        self.assertEqual(len(log), 15)
+        self.assertEqual(log.week(3)['week'].tolist(), [3, 3, 3])
+
+        # Every game a team played is found, and the scores agree with the
+        # team's record
+        for team_id in range(6):
+            games = log.team(team_id)
+            home = games['home'] == team_id
+            scored = np.where(home, games['home_score'], games['away_score'])
+            allowed = np.where(home, games['away_score'], games['home_score'])
+            t = ss.state['teams'][team_id]
+
+            self.assertEqual(len(games['week']), 5)
+            self.assertEqual(int((scored > allowed).sum()), t.wins)
+            self.assertEqual(int((scored == allowed).sum()), t.ties)
+
+    def test_out_of_order_weeks(self):
+        log = game_log.GameLog(capacity=1)
+        log.append(2, 0, 1, 3, 1)
+        log.extend(1, [2, 3], [3, 0], [0, 1], [0, 4])
+
+        self.assertFalse(log.week_ordered)
+        self.assertEqual(log.week(1)['home'].tolist(), [2, 3])
+        self.assertEqual(log[0], (2, 0, 1, 3, 1))
+        self.assertEqual(log.team_games(0).tolist(), [0, 2])
+
+class TestBinaryIO(unittest.TestCase):
+    def setUp(self):
+        ss.startup()
+
+        for i in range(5):
+            ss.add_team_to_state("Team %d \u00e9" % i, 10 * i, 5)
+
+        ss.round_robin_schedule(5)
+        ss.init_league()
+
+        ss.simulate_week()
+        ss.simulate_week()
+
+        self.files = ["testing.ssb", "testing.ssf", "testing2.ssb"]
+
+    def tearDown(self):
+        for name in self.files:
+            if os.path.isfile(name):
+                os.remove(name)
+
+    def assert_same_league(self, new_state):
+        self.assertTrue(new_state['teams'] == ss.state['teams'])
+        self.assertEqual(dict(new_state['schedule'].items()),
+            dict(ss.state['schedule'].items()))
+        self.assertEqual(new_state['current_week'], ss.state['current_week'])
+        self.assertTrue(new_state['game_log'] == ss.state['game_log'])
+        self.assertEqual(new_state['config'], ss.state['config'])
+
+    def test_round_trip(self):
+        ss_io.save_state(ss.state, "testing.ssb")
+
+        self.assert_same_league(ss_io.load_state("testing.ssb"))
+
+    def test_explicit_schedule(self):
+        ss.confirm_schedule(dict(ss.state['schedule']))
+        ss_io.save_state(ss.state, "testing.ssb")
+
+        new_state = ss_io.load_state("testing.ssb")
+
+        self.assertIsInstance(new_state['schedule'], schedules.ArraySchedule)
+        self.assert_same_league(new_state)
+
+    def test_conversion_both_ways(self):
+        ss_io.save_state(ss.state, "testing.ssb")
+        ss_io.convert("testing.ssb", "testing.ssf")
+        ss_io.convert("testing.ssf", "testing2.ssb")
+
+        self.assert_same_league(ss_io.load_state("testing.ssf"))
+        self.assert_same_league(ss_io.load_state("testing2.ssb"))
+
+    def test_simulate_after_load(self):
+        # Loaded columns are copy-on-write maps, so playing on must work and
+        # must not change the file
+        ss.save("testing.ssb")
+        ss.load("testing.ssb")
+        ss.simulate_season()
+        ss.add_team_to_state("Late entry", 1, 1)
+
+        self.assertEqual(ss.state['teams'][0].wins
+            + ss.state['teams'][0].losses + ss.state['teams'][0].ties, 4)
+        self.assertEqual(len(ss_io.load_state("testing.ssb")['game_log']), 4)
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        ss.startup()
+
+        for i in range(6):
+            ss.add_team_to_state("Team %d" % i, 10 * i, 5)
+
+        ss.round_robin_schedule(6)
+        ss.init_league()
+
+        self.files = ["journaled.ssf", "journaled.ssj", "journaled.ssb"]
+
+    def tearDown(self):
+        ss.startup()
+
+        for name in self.files:
+            if os.path.isfile(name):
+                os.remove(name)
+
+    def test_weeks_appended(self):
+        ss.start_journal("journaled")
+        ss.simulate_week()
+        ss.simulate_week()
+
+        # The base save is untouched, two records went in the journal
+        with open("journaled.ssj") as journal:
+            self.assertEqual(len(journal.readlines()), 2)
+
+        new_state = ss_io.load_state("journaled.ssf")
+
+        self.assertTrue(new_state['teams'] == ss.state['teams'])
+        self.assertTrue(new_state['game_log'] == ss.state['game_log'])
+        self.assertEqual(new_state['current_week'], 3)
+
+    def test_config_and_names(self):
+        # Changes a record can't carry go in a full save instead. The config
+        # belongs to the default league, so it is put back afterwards
+        config = dict(ss.state['config'])
+        self.addCleanup(ss.state['config'].update, config)
+        self.addCleanup(ss.state['config'].clear)
+
+        ss.start_journal("journaled")
+        ss.set_simulator('flip_coin')
+        ss.state['config']['POINTS_ON_WIN'] = 2
+        ss.state['teams'][1].name = "Renamed"
+        ss.simulate_week()
+        ss.save("journaled")
+
+        new_state = ss_io.load_state("journaled.ssf")
+
+        self.assertEqual(new_state['config'], ss.state['config'])
+        self.assertEqual(new_state['teams'][1].name, "Renamed")
+        self.assertTrue(new_state['teams'] == ss.state['teams'])
+        self.assertTrue(new_state['game_log'] == ss.state['game_log'])
+
+    def test_compaction(self):
+        ss.start_journal("journaled.ssb", compact_every=2)
+        ss.simulate_season()
+
+        # 5 weeks with a compaction every 2 leaves one record
+        with open("journaled.ssj") as journal:
+            self.assertEqual(len(journal.readlines()), 1)
+
+        ss.stop_journal()
+        self.assertFalse(os.path.isfile("journaled.ssj"))
+
+        ss.load("journaled.ssb")
+        self.assertEqual(len(ss.state['game_log']), 15)
+
+    def test_standalone_matchup_not_logged(self):
+        # Teams outside the league have no place in its log, so a matchup
+        # between them can't end up replayed onto league teams
+        ss.start_journal("journaled")
+        ss.simulate_week()
+        ss.simulate_matchup(team.Team("X"), team.Team("Y"))
+        ss.simulate_week()
+
+        new_state = ss_io.load_state("journaled.ssf")
+
+        self.assertEqual(len(ss.state['game_log']), 6)
+        self.assertTrue(new_state['teams'] == ss.state['teams'])
+        self.assertTrue(new_state['game_log'] == ss.state['game_log'])
+
+    def test_torn_record_ignored(self):
+        ss.start_journal("journaled")
+        ss.simulate_week()
+
+        with open("journaled.ssj", "a") as journal:
+            journal.write('{"current_week": 9, "ga')
+
+        new_state = ss_io.load_state("journaled.ssf")
+
+        self.assertEqual(new_state['current_week'], 2)
+        self.assertEqual(len(new_state['game_log']), 3)
+
+class TestStreamingLoad(unittest.TestCase):
+    def setUp(self):
+        ss.startup()
+
+        for i in range(9):
+            ss.add_team_to_state("Team [%d], \"quoted\"" % i, 10 * i, 5)
+
+        # An explicit schedule, so that weeks are written out one by one
+        ss.confirm_schedule(dict(ss.round_robin_schedule(9)))
+        ss.init_league()
+
+        for week in range(4):
+            ss.simulate_week()
+
+        ss.save("streaming")
+
+    def tearDown(self):
+        if os.path.isfile("streaming.ssf"):
+            os.remove("streaming.ssf")
+
+    def test_matches_json_load(self):
+        with open("streaming.ssf") as save_file:
+            expected = ss_io.convert_from_serialized(json.load(save_file))
+
+        new_state = ss_io.load_state("streaming.ssf")
+
+        self.assertTrue(new_state['teams'] == expected['teams'])
+        self.assertEqual(new_state['schedule'], expected['schedule'])
+        self.assertEqual(new_state['current_week'], expected['current_week'])
+        self.assertTrue(new_state['game_log'] == expected['game_log'])
+
+    def test_tiny_chunks(self):
+        # Values split across many refills must still come out whole
+        with open("streaming.ssf") as save_file:
+            text = save_file.read()
+
+        stream = ss_io.JsonStream(io.StringIO(text), chunk_size=3)
+        members = {}
+
+        # Each key has to be followed by reading its value
+        for key in stream.members():
+            members[key] = stream.value()
+
+        expected = json.loads(text)
+        self.assertEqual(list(members), list(expected))
+        self.assertEqual(members, expected)
+
+    def test_lazy_schedule(self):
+        new_state = ss_io.load_state("streaming.ssf", lazy=True)
+        sched = new_state['schedule']
+
+        self.assertIsInstance(sched, schedules.PartialSchedule)
+        self.assertEqual(len(sched), 9)
+        self.assertEqual(sorted(sched.weeks), list(range(5, 10)))
+
+        # Played weeks are still there if asked for
+        self.assertEqual(sched[1], ss.state['schedule'][1])
+        self.assertTrue(sched.is_complete())
+
+    def test_missing_keys(self):
+        # A json file without teams or a schedule fails to load, and the
+        # league that was there stays
+        with open("streaming.ssf", "w") as save_file:
+            save_file.write('{"current_week": 1}')
+
+        with self.assertRaises(ValueError):
+            ss.load("streaming")
+
+        self.assertEqual(ss.state['current_week'], 5)
+        self.assertEqual(len(ss.state['teams']), 9)
+
+class TestRNG(unittest.TestCase):
+    def play_season(self, batch=False, week_order=None):
+        ss.startup()
+
+        for i in range(8):
+            ss.add_team_to_state("Team %d" % i, 5 * i, 10)
+
+        sched = ss.round_robin_schedule(8)
+        ss.init_league()
+        ss.seed(1234)
+
+        for week in week_order or sched:
+            ss.simulate_week(sched, week, batch=batch)
+
+        log = ss.state['game_log']
+        games = sorted(zip(*(log.column(c).tolist() for c in game_log.COLUMNS)))
+
+        return (games, [dict(t.results) for t in ss.state['teams']])
+
+    def test_same_seed_same_season(self):
+        self.assertEqual(self.play_season(), self.play_season())
+        self.assertEqual(self.play_season(True), self.play_season(True))
+
+    def test_weeks_independent_of_order(self):
+        # Weeks have their own streams, so playing them in any order (as
+        # parallel workers would) gives bit-identical results
+        self.assertEqual(self.play_season(),
+            self.play_season(week_order=[7, 3, 1, 6, 2, 5, 4]))
+
+    def test_children_differ(self):
+        rng = ss_rng.RNG(5)
+
+        self.assertNotEqual([rng.week(1).randint(0, 10**9) for i in range(3)],
+            [rng.week(2).randint(0, 10**9) for i in range(3)])
+        self.assertEqual(rng.week(1).randint(0, 10**9),
+            ss_rng.RNG(5).week(1).randint(0, 10**9))
+
+class TestBench(unittest.TestCase):
+    def test_compare(self):
+        baseline = {'a[10]': {'ops_per_sec': 100.0, 'peak_bytes': 10**6}}
+
+        self.assertEqual(ss_bench.compare(
+            {'a[10]': {'ops_per_sec': 90.0, 'peak_bytes': 10**6}},
+            baseline, 0.25), [])
+        self.assertEqual(len(ss_bench.compare(
+            {'a[10]': {'ops_per_sec': 50.0, 'peak_bytes': 2 * 10**6}},
+            baseline, 0.25)), 2)
+        self.assertEqual(ss_bench.compare(
+            {'b[10]': {'ops_per_sec': 1.0, 'peak_bytes': 10**9}},
+            baseline, 0.25), [])
+
+    def test_measure(self):
+        result = ss_bench.measure(ss_bench.bench_simulate_week, 4)
+
+        self.assertGreater(result['ops_per_sec'], 0)
+        self.assertGreater(result['peak_bytes'], 0)
+
+class TestProfile(unittest.TestCase):
+    def setUp(self):
+        ss.startup()
+
+        for i in range(4):
+            ss.add_team_to_state(str(i), 10, 10)
+
+        ss.round_robin_schedule(4)
+        ss.init_league()
+
+    def tearDown(self):
+        ss_prof.disable()
+        ss_prof.reset()
+
+    def test_disabled(self):
+        ss_prof.disable()
+        ss_prof.reset()
+        ss.simulate_week()
+
+        self.assertEqual(ss_prof.report(), {})
+
+    def test_phases(self):
+        ss_prof.enable()
+        ss.simulate_week()
+        ss.standings()
+        ss_prof.disable()
+        ss.simulate_week()
+
+        report = ss_prof.report()
+
+        self.assertEqual(report['matchup']['calls'], 2)
+        self.assertEqual(report['bookkeeping']['calls'], 2)
+        self.assertEqual(report['standings']['calls'], 1)
+
+        # Bookkeeping runs inside matchups, so it is not in their self time
+        self.assertLessEqual(report['matchup']['self'],
+            report['matchup']['total'] - report['bookkeeping']['total'] + 1e-9)
+        self.assertIn('bookkeeping', ss_prof.format_report())
+
+class TestBatchCLI(unittest.TestCase):
+    def setUp(self):
+        self.team_file = 'batch_test_teams.txt'
+
+        with open(self.team_file, 'w') as team_file:
+            team_file.write('A 10 5\nB 8 8\n\nC 12 3\nD 9 9\n')
+
+    def tearDown(self):
+        os.remove(self.team_file)
+
+    def test_parse_commands(self):
+        self.assertEqual(ss_cli.parse_commands(
+            ['new', 'teams.txt', 'week', 'week', '3', 'table', 'save', 'x']),
+            [['new', 'teams.txt'], ['week'], ['week', '3'], ['table'],
+            ['save', 'x']])
+
+        with self.assertRaises(ss_err.ValidationError):
+            ss_cli.parse_commands(['table', 'extra'])
+
+    def test_run(self):
+        output = io.StringIO()
+        status = ss_cli.run_batch([['new', self.team_file], ['seed', '1'],
+            ['week', '2'], ['rest'], ['table']], output)
+
+        self.assertEqual(status, 0)
+        self.assertEqual(ss.state['current_week'], 4)
+        self.assertEqual(len(ss.state['game_log']), 6)
+
+        # 6 results, then the table's 2 header rows and 4 teams
+        lines = output.getvalue().splitlines()
+        self.assertEqual(len(lines), 12)
+        self.assertEqual(lines[6], ss_cli.get_header(1))
+
+    def test_corrupt_save(self):
+        # A save that won't parse fails the run like any other error, and
+        # the output from before it is still written
+        with open('batch_corrupt.ssf', 'w') as save_file:
+            save_file.write('{"current_week": 1, "sched')
+
+        output = io.StringIO()
+        stderr = io.StringIO()
+
+        try:
+            with contextlib.redirect_stderr(stderr):
+                status = ss_cli.run_batch([['new', self.team_file], ['table'],
+                    ['load', 'batch_corrupt']], output)
+        finally:
+            os.remove('batch_corrupt.ssf')
+
+        self.assertEqual(status, 1)
+        self.assertIn("Error in 'load batch_corrupt'", stderr.getvalue())
+        self.assertEqual(output.getvalue().count('Pts'), 1)
+
+    def test_truncated_binary_save(self):
+        # Binary saves cut short in the header or the sections after it fail
+        # the load rather than the run
+        ss_cli.run_batch([['new', self.team_file], ['week'],
+            ['save', 'batch_cut.ssb']], io.StringIO())
+
+        with open('batch_cut.ssb', 'rb') as save_file:
+            data = save_file.read()
+
+        try:
+            for length in (10, len(data) // 2):
+                with self.subTest(length=length):
+                    with open('batch_cut.ssb', 'wb') as save_file:
+                        save_file.write(data[:length])
+
+                    stderr = io.StringIO()
+
+                    with contextlib.redirect_stderr(stderr):
+                        status = ss_cli.run_batch([['load', 'batch_cut.ssb'],
+                            ['table']], io.StringIO())
+
+                    self.assertEqual(status, 1)
+                    self.assertIn("Error in 'load batch_cut.ssb'",
+                        stderr.getvalue())
+        finally:
+            os.remove('batch_cut.ssb')
+
+    def test_bad_seed(self):
+        stderr = io.StringIO()
+
+        with contextlib.redirect_stderr(stderr):
+            status = ss_cli.run_batch([['new', self.team_file],
+                ['seed', 'abc'], ['week']], io.StringIO())
+
+        self.assertEqual(status, 1)
+        self.assertIn("Seed must be a whole number", stderr.getvalue())
+
+    def test_league_types(self):
+        output = io.StringIO()
+        status = ss_cli.run_batch([['new', self.team_file, 'drr'], ['rest'],
+            ['new', self.team_file, 'SE'], ['rest']], output)
+
+        self.assertEqual(status, 0)
+        self.assertIsInstance(ss.state['schedule'], schedules.KnockoutSchedule)
+        self.assertIsNotNone(ss.state['schedule'].champion)
+
+        with self.assertRaises(ss_err.ValidationError):
+            ss_cli.run_batch_command(['new', self.team_file, 'league'])
+
+    def test_failure(self):
+        output = io.StringIO()
+        stderr = io.StringIO()
+
+        with contextlib.redirect_stderr(stderr):
+            status = ss_cli.run_batch([['new', self.team_file], ['table'],
+                ['week', '9'], ['table']], output)
+
+        self.assertEqual(status, 1)
+        self.assertIn('end of season', stderr.getvalue())
+
+        # Output from before the failure is still written
+        self.assertEqual(output.getvalue().count('Pts'), 1)
+
+class TestImport(unittest.TestCase):
+    def setUp(self):
+        ss.startup()
+        self.files = []
+
+    def tearDown(self):
+        for name in self.files:
+            os.remove(name)
+
+    def write(self, name, text):
+        self.files.append(name)
+
+        with open(name, 'w') as team_file:
+            team_file.write(text)
+
+        return name
+
+    def test_csv(self):
+        path = self.write('import_test.csv',
+            'defense,name,offense\n5,A,10\n8,B,8\n7,C,12.0\n')
+
+        self.assertEqual(ss.import_teams(path), 3)
+        self.assertEqual(ss.state['teams'].names, ['A', 'B', 'C'])
+        self.assertEqual(ss.state['teams'].offense.tolist(), [10, 8, 12])
+        self.assertEqual(ss.state['teams'].defense.tolist(), [5, 8, 7])
+
+    def test_json(self):
+        path = self.write('import_test.json', json.dumps(
+            {'name': ['A', 'B'], 'offense': [1, 2], 'defense': [3, 4]}))
+        ss.import_teams(path)
+
+        path = self.write('import_test2.json', json.dumps(
+            [{'name': 'C', 'offense': 5, 'defense': 6}]))
+        ss.import_teams(path)
+
+        self.assertEqual(ss.state['teams'][2], team.Team('C', 5, 6))
+        self.assertEqual(len(ss.state['teams']), 3)
+
+    def test_errors(self):
+        path = self.write('import_test.txt',
+            'A 10 5\nB x 8\nA 1 1\nC 2\nD 1.5 -1\n Ok 1 1\n')
+
+        with self.assertRaises(ss_err.ValidationError) as raised:
+            ss.import_teams(path)
+
+        # Every bad row is reported, and nothing is added
+        self.assertEqual([error.split(':')[0] for error in
+            raised.exception.errors], ['row 2', 'row 3', 'row 4', 'row 5',
+            'row 5'])
+        self.assertEqual(len(ss.state['teams']), 0)
+
+    def test_existing_names(self):
+        ss.add_team_to_state('A', 1, 1)
+
+        with self.assertRaises(ss_err.ValidationError):
+            ss_import.validate_rows([['A', 1, 1]], existing_names=['A'])
+
+        self.assertEqual(ss_import.validate_rows([['My Team', '7', 1]])[1]
+            .tolist(), [7])
+
+class TestLeague(unittest.TestCase):
+    def make_league(self, seed):
+        league = ss.League()
+
+        for i in range(6):
+            league.add_team_to_state(str(i), 5 * i, 10)
+
+        league.round_robin_schedule(6)
+        league.init_league()
+        league.seed(seed)
+
+        return league
+
+    def test_independent(self):
+        first = self.make_league(1)
+        second = self.make_league(1)
+        first.simulate_season()
+
+        self.assertEqual(second.current_week, 1)
+        self.assertEqual(len(second.game_log), 0)
+        self.assertEqual(len(first.game_log), 15)
+
+        second.simulate_season()
+        self.assertEqual(first.game_log, second.game_log)
+        self.assertIsNot(first.teams, ss.state['teams'])
+
+    def test_threads(self):
+        import threading
+
+        leagues = [self.make_league(seed) for seed in range(4)]
+        threads = [threading.Thread(target=league.simulate_season)
+            for league in leagues]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        for seed, league in enumerate(leagues):
+            serial = self.make_league(seed)
+            serial.simulate_season()
+
+            self.assertEqual(league.game_log, serial.game_log)
+
+    def test_default_league_state(self):
+        ss.startup()
+        ss.add_team_to_state('A', 1, 1)
+        ss.add_team_to_state('B', 1, 1)
+        ss.round_robin_schedule(2)
+        ss.init_league()
+        ss.save('league_test')
+
+        state = ss.state
+        ss.load('league_test')
+        os.remove('league_test.ssf')
+
+        # Loading fills the same state dictionary rather than rebinding it
+        self.assertIs(ss.state, state)
+        self.assertIs(ss.default_league.state, state)
+        self.assertEqual(ss.default_league.teams.names, ['A', 'B'])
+
+class TestServer(unittest.TestCase):
+    TEAMS = [['A', 10, 5], ['B', 8, 8], ['C', 12, 3], ['D', 9, 9]]
+
+    def test_commands(self):
+        service = ss_server.LeagueService()
+
+        async def run():
+            create = await service.handle({'id': 1, 'command': 'create',
+                'league': 'x', 'teams': self.TEAMS, 'seed': 1})
+            weeks = await asyncio.gather(
+                service.handle({'command': 'week', 'league': 'x'}),
+                service.handle({'command': 'week', 'league': 'x'}))
+            standings = await service.handle({'command': 'standings',
+                'league': 'x', 'top': 2})
+            missing = await service.handle({'command': 'week',
+                'league': 'y'})
+
+            return create, weeks, standings, missing
+
+        create, weeks, standings, missing = asyncio.run(run())
+
+        self.assertEqual(create, {'id': 1, 'ok': True,
+            'result': {'teams': 4, 'weeks': 3}})
+
+        # The league lock runs the two requests one after the other
+        self.assertEqual(sorted(week['result']['week'] for week in weeks),
+            [2, 3])
+        self.assertEqual(service.leagues['x'].current_week, 3)
+        self.assertEqual(len(standings['result']), 2)
+        self.assertFalse(missing['ok'])
+
+        # Served leagues are separate from the default league
+        self.assertIsNot(service.leagues['x'].state, ss.state)
+
+    def test_failed_load(self):
+        # A save that won't load leaves no league behind, and an existing
+        # league of the same name is untouched
+        service = ss_server.LeagueService()
+
+        with open('server_corrupt.ssf', 'w') as save_file:
+            save_file.write('{"current_week": 1, "sched')
+
+        async def run():
+            await service.handle({'command': 'create', 'league': 'x',
+                'teams': self.TEAMS, 'seed': 1})
+            league = service.leagues['x']
+            responses = [await service.handle({'command': 'load',
+                'league': name, 'save': 'server_corrupt'})
+                for name in ('x', 'y')]
+            leagues = await service.handle({'command': 'list'})
+
+            return league, responses, leagues
+
+        try:
+            league, responses, leagues = asyncio.run(run())
+        finally:
+            os.remove('server_corrupt.ssf')
+
+        self.assertFalse(any(response['ok'] for response in responses))
+        self.assertEqual(list(leagues['result']), ['x'])
+        self.assertIs(service.leagues['x'], league)
+        self.assertNotIn('y', service.locks)
+
+    def test_queued_loads(self):
+        # A failed load doesn't take the lock away from one queued behind it
+        service = ss_server.LeagueService()
+
+        with open('server_corrupt.ssf', 'w') as save_file:
+            save_file.write('{"current_week": 1, "sched')
+
+        async def run():
+            await service.handle({'command': 'create', 'league': 'x',
+                'teams': self.TEAMS})
+            await service.handle({'command': 'save', 'league': 'x',
+                'save': 'server_queued'})
+
+            loads = await asyncio.gather(*(service.handle({'command': 'load',
+                'league': 'z', 'save': save})
+                for save in ('server_corrupt', 'server_queued')))
+            standings = await service.handle({'command': 'standings',
+                'league': 'z'})
+
+            return loads, standings
+
+        try:
+            loads, standings = asyncio.run(run())
+        finally:
+            os.remove('server_corrupt.ssf')
+            os.remove('server_queued.ssf')
+
+        self.assertEqual([load['ok'] for load in loads], [False, True])
+        self.assertTrue(standings['ok'])
+        self.assertIn('z', service.locks)
+        self.assertEqual(service.loading, {})
+
+    def test_unexpected_error(self):
+        # Errors a command doesn't expect still get an answer
+        service = ss_server.LeagueService()
+
+        async def broken(request):
+            return [][1]
+
+        service.commands['broken'] = broken
+        response = asyncio.run(service.handle({'id': 3, 'command': 'broken'}))
+
+        self.assertEqual(response['id'], 3)
+        self.assertFalse(response['ok'])
+        self.assertIn('IndexError', response['error'])
+
+    def test_clinch(self):
+        service = ss_server.LeagueService()
+
+        async def run():
+            await service.handle({'command': 'create', 'league': 'x',
+                'teams': self.TEAMS, 'seed': 1})
+            await service.handle({'command': 'season', 'league': 'x'})
+
+            return await service.handle({'command': 'clinch', 'league': 'x'})
+
+        result = asyncio.run(run())['result']
+
+        # Once the season is over every team has one or the other
+        self.assertEqual(len(result['clinched']) + len(result['eliminated']), 4)
+
+    def test_socket(self):
+        async def run():
+            server = await ss_server.serve(port=0)
+            port = server.sockets[0].getsockname()[1]
+
+            async with server:
+                reader, writer = await asyncio.open_connection('127.0.0.1',
+                    port)
+
+                for request in ({'id': 1, 'command': 'create', 'league': 'x',
+                    'teams': self.TEAMS}, {'id': 2, 'command': 'schedule',
+                    'league': 'x', 'week': 1}):
+                    writer.write(json.dumps(request).encode() + b'\n')
+                    await writer.drain()
+                    response = json.loads(await reader.readline())
+
+                writer.close()
+
+            return response
+
+        response = asyncio.run(run())
+
+        self.assertEqual(response['id'], 2)
+        self.assertEqual(len(response['result']['games']), 2)
+
+class TestOdds(unittest.TestCase):
+    def test_distribution(self):
+        # P(home scores 5) is p^5 with p = (off + bias) / (off + def + 2 bias)
+        pmf = ss_odds.score_pmf(20 / 40, 10 / 40)
+
+        self.assertAlmostEqual(pmf.sum(), 1.0)
+        self.assertAlmostEqual(pmf.reshape(6, 6)[5].sum(), 0.5 ** 5)
+        self.assertAlmostEqual(pmf.reshape(6, 6)[:, 0].sum(), 0.75 ** 5)
+
+        cdf = ss_odds.score_cdf(10, 0, 0, 10)
+        self.assertEqual(len(cdf), ss_odds.OUTCOMES)
+        self.assertEqual(cdf[-1], 1 << ss_odds.CDF_BITS)
+        self.assertEqual(list(cdf), sorted(cdf))
+
+    def test_scalar_sampling(self):
+        home = team.Team('A', 20, 0)
+        away = team.Team('B', 0, 10)
+        rng = ss_rng.RNG(1)
+
+        counts = np.zeros(ss_odds.OUTCOMES)
+
+        for i in range(20000):
+            home_score, away_score = ss.biased_proportional_table(home, away,
+                rng=rng)
+            counts[home_score * ss_odds.SCORES + away_score] += 1
+
+        expected = ss_odds.score_pmf(30 / 50, 10 / 20) * 20000
+        self.assertLess(np.abs(counts - expected).max(), 5 * np.sqrt(
+            expected.max()))
+
+    def test_batch_sampling(self):
+        home_p = np.array([0.5, 0.9, 0.0])
+        away_p = np.array([0.2, 1.0, 0.5])
+        outcomes = ss_odds.sample_outcomes(ss_odds.cdf_table(home_p, away_p),
+            np.random.default_rng(1), 20000)
+        home_scores, away_scores = ss_odds.split_outcomes(outcomes)
+
+        np.testing.assert_allclose(home_scores.mean(axis=0),
+            5 * home_p, atol=0.05)
+        np.testing.assert_allclose(away_scores.mean(axis=0),
+            5 * away_p, atol=0.05)
+
+    def test_monte_carlo_tables(self):
+        teams = [team.Team(str(i), 5 * i, 10) for i in range(4)]
+        result = ss_mc.simulate_many_seasons(400, teams, workers=1, seed=1,
+            tables=True)
+
+        self.assertEqual(result['points'].sum(), 400 * 4)
+        self.assertAlmostEqual(result['titles'].sum(), 1.0)
+
+class TestExactStandings(unittest.TestCase):
+    def setUp(self):
+        ss.startup()
+
+        for i in range(4):
+            ss.add_team_to_state(str(i), 10 * i, 10)
+
+        ss.round_robin_schedule(4)
+        ss.init_league()
+        ss.seed(1)
+
+    def test_single_game(self):
+        teams = [team.Team('A', 20, 0), team.Team('B', 0, 10)]
+        win, tie, loss = ss_exact.outcome_probabilities(30 / 50, 10 / 20)
+        result = ss_exact.expected_standings(teams,
+            ss.build_round_robin(2), 1)
+
+        # Each team finishes on 0, 1 or 3 points
+        self.assertEqual(result['points_offset'], 0)
+        np.testing.assert_allclose(result['points'][0], [loss, tie, 0, win])
+        np.testing.assert_allclose(result['points'][1], [win, tie, 0, loss])
+        self.assertAlmostEqual(win + tie + loss, 1.0)
+
+    def test_mid_season(self):
+        ss.simulate_week()
+        result = ss_exact.expected_standings()
+
+        np.testing.assert_allclose(result['points'].sum(axis=1), 1.0)
+
+        # Two games left, so every team is within 6 points of its current
+        # total
+        current = ss.calc_all_points()
+
+        for team_id in range(4):
+            support = np.flatnonzero(result['points'][team_id]) \
+                + result['points_offset']
+            self.assertGreaterEqual(support.min(), current[team_id])
+            self.assertLessEqual(support.max(), current[team_id] + 6)
+
+        self.assertTrue(np.all(ss_exact.probability_at_least(result,
+            result['points_offset']) > 1 - 1e-9))
+
+    def test_matches_monte_carlo(self):
+        result = ss_exact.expected_standings()
+        mc = ss_mc.simulate_many_seasons(4000, workers=1, seed=2)
+        points = np.arange(mc['points'].shape[1]) + mc['points_offset']
+
+        np.testing.assert_allclose(result['expected'],
+            mc['points'] @ points / 4000, atol=0.15)
+
+class TestSimulators(unittest.TestCase):
+    def make_league(self, simulator):
+        league = ss.League()
+
+        for i in range(4):
+            league.add_team_to_state(str(i), 10 * i, 10)
+
+        league.round_robin_schedule(4)
+        league.init_league()
+        league.set_simulator(simulator)
+        league.seed(3)
+
+        return league
+
+    def test_registry(self):
+        for name in ('biased_proportional', 'biased_proportional_table',
+            'flip_coin', 'home_win'):
+            self.assertIsNotNone(ss_sim.get(name).batch)
+
+        self.assertEqual(ss_sim.get().name, ss_sim.DEFAULT_SIMULATOR)
+        self.assertRaises(ss_err.ValidationError, ss_sim.get, 'nope')
+        self.assertRaises(ss_err.ValidationError, ss.League().set_simulator,
+            'nope')
+
+    def test_scalar_fallback(self):
+        simulator = ss_sim.Simulator('scalar_home_win', ss.home_win)
+        teams = [team.Team('A'), team.Team('B'), team.Team('C')]
+        home, away = simulator.simulate_games(teams, np.array([0, 2]),
+            np.array([1, 0]), ss_rng.RNG(1))
+
+        self.assertEqual(home.tolist(), [1, 1])
+        self.assertEqual(away.tolist(), [0, 0])
+
+    def test_batch_ports(self):
+        for name in ('home_win', 'flip_coin'):
+            league = self.make_league(name)
+            league.simulate_season(batch=True)
+
+            games = league.game_log
+            self.assertEqual(len(games), 6)
+            self.assertTrue(np.all(games.column('home_score')
+                + games.column('away_score') == 1))
+
+        league = self.make_league('home_win')
+        league.simulate_season(batch=True)
+        self.assertTrue(np.all(league.game_log.column('home_score') == 1))
+
+    def test_saved_with_config(self):
+        league = self.make_league('flip_coin')
+        league.save('simulator_test.ssb')
+
+        loaded = ss.League()
+        loaded.load('simulator_test.ssb')
+        os.remove('simulator_test.ssb')
+
+        self.assertEqual(loaded.config[ss_sim.CONFIG_KEY], 'flip_coin')
+        self.assertEqual(ss_sim.for_config(loaded.config).name, 'flip_coin')
+
+    def test_monte_carlo(self):
+        teams = [team.Team(str(i), 10 * i, 10) for i in range(4)]
+        result = ss_mc.simulate_many_seasons(50, teams, workers=1, seed=1,
+            simulator='home_win')
+
+        # Every team wins its home games and loses its away games
+        self.assertEqual(result['points'].sum(), 200)
+        np.testing.assert_array_equal(result['points'].sum(axis=1), 50)
+
+class TestSweep(unittest.TestCase):
+    def setUp(self):
+        ss.startup()
+
+        for i in range(5):
+            ss.add_team_to_state(str(i), 10 * i, 10)
+
+        ss.round_robin_schedule(5)
+        ss.init_league()
+        ss.seed(4)
+        ss.simulate_season()
+
+    def test_rescore_matches_standings(self):
+        result = ss_sweep.rescore([ss.state['config'], (2, 1, 0), (1, 0, -1)])
+        teams = ss.state['teams']
+
+        np.testing.assert_array_equal(result['counts'],
+            np.stack([teams.wins, teams.ties, teams.losses], axis=1))
+        np.testing.assert_array_equal(result['points'][0],
+            ss.calc_all_points())
+        np.testing.assert_array_equal(result['points'][1],
+            2 * teams.wins + teams.ties)
+        np.testing.assert_array_equal(result['points'][2],
+            teams.wins - teams.losses)
+        self.assertEqual(result['positions'].min(axis=1).tolist(), [1, 1, 1])
+
+    def test_rescore_weeks(self):
+        result = ss_sweep.rescore([(3, 1, 0)], weeks=[1])
+
+        # Five teams play two games a week around a bye
+        self.assertEqual(result['counts'].sum(), 4)
+
+    def test_bias_sweep(self):
+        configs = [(3, 1, 0), (2, 1, 0)]
+        serial = ss_sweep.bias_sweep([0, 10, 1000], 20, configs, workers=1,
+            seed=7)
+        parallel = ss_sweep.bias_sweep([0, 10, 1000], 20, configs, workers=2,
+            seed=7)
+
+        np.testing.assert_array_equal(serial['counts'], parallel['counts'])
+        self.assertEqual(serial['counts'].shape, (3, 20, 5, 3))
+        self.assertEqual(serial['points'].shape, (3, 2, 5))
+
+        # Every team plays 4 games a season, and titles add up to one
+        np.testing.assert_array_equal(serial['counts'].sum(axis=3), 4)
+        np.testing.assert_allclose(serial['titles'].sum(axis=2), 1.0)
+        np.testing.assert_allclose(serial['points'][:, 1],
+            (serial['counts'] @ [2, 1, 0]).mean(axis=1))
+
+        # A huge bias evens the teams out; without one the strongest team
+        # wins more
+        wins = serial['counts'][..., ss_sweep.WIN].mean(axis=1)
+        self.assertGreater(wins[0, 4] - wins[0, 0], wins[2, 4] - wins[2, 0])
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.league = ss.League()
+
+        for i in range(6):
+            self.league.add_team_to_state(str(i), 5 * i, 10)
+
+        self.league.round_robin_schedule(6)
+        self.league.init_league()
+        self.league.seed(5)
+        self.league.simulate_week()
+        self.league.simulate_week()
+
+    def test_restore_replays(self):
+        snapshot = self.league.snapshot()
+        self.league.simulate_season()
+
+        replay = ss.League.from_snapshot(snapshot)
+        self.assertEqual(replay.current_week, 3)
+        self.assertEqual(len(replay.game_log), 6)
+
+        replay.simulate_season()
+        self.assertEqual(replay.game_log, self.league.game_log)
+        self.assertEqual(replay.teams, self.league.teams)
+
+    def test_branches_share(self):
+        snapshot = self.league.snapshot()
+        before = list(self.league.teams)
+        branches = [ss.League.from_snapshot(snapshot, branch)
+            for branch in range(3)]
+
+        for branch in branches:
+            branch.simulate_season(batch=True)
+            self.assertEqual(len(branch.game_log), 15)
+
+        # Ratings and the games already played are shared; the results are
+        # each branch's own
+        for branch in branches:
+            self.assertIs(branch.teams._columns['offense'],
+                snapshot.columns['offense'])
+            self.assertIsNot(branch.teams._columns['wins'],
+                snapshot.columns['wins'])
+            self.assertIs(branch.game_log._base, snapshot.game_log)
+            self.assertEqual([branch.game_log[game] for game in range(6)],
+                list(self.league.game_log))
+
+        self.assertNotEqual(branches[0].game_log, branches[1].game_log)
+        self.assertEqual(list(self.league.teams), before)
+        self.assertEqual(len(self.league.game_log), 6)
+        self.assertEqual(snapshot.columns['wins'].tolist(),
+            [team.wins for team in before])
+
+        # Writing to a fork's ratings copies them first
+        branches[0].teams[0].offense = 99
+        self.assertEqual(branches[1].teams[0].offense, 0)
+        self.assertEqual(snapshot.columns['offense'][0], 0)
+
+    def test_what_if(self):
+        snapshot = self.league.snapshot()
+        home, away = next(game for game in self.league.state['schedule'][3]
+            if 'BYE' not in game)
+
+        for batch in (False, True):
+            branch = ss.League.from_snapshot(snapshot, 0)
+            wins = branch.teams[away].wins
+            branch.simulate_week(batch=batch, fixed={(home, away): (0, 4)})
+
+            self.assertEqual(branch.teams[away].wins, wins + 1)
+            self.assertIn((3, home, away, 0, 4), list(branch.game_log))
+
+    def test_save_branch(self):
+        branch = ss.League.from_snapshot(self.league.snapshot(), 1)
+        branch.simulate_week()
+
+        for name in ('snapshot_test.ssf', 'snapshot_test.ssb'):
+            branch.save(name)
+            loaded = ss.League()
+            loaded.load(name)
+            os.remove(name)
+
+            self.assertEqual(loaded.game_log, branch.game_log)
+            self.assertEqual(loaded.teams, branch.teams)
+
+class TestClinch(unittest.TestCase):
+    def brute_force(self, league):
+        # (can finish first, always finishes first) for every team, trying
+        # every result of every game left
+        points = ss_clinch.points_config(league.config)
+        home_ids, away_ids = ss_clinch.remaining_games(
+            league.state['schedule'], league.current_week)
+        current = league.teams.points(*points).tolist()
+        can = [False] * len(current)
+        always = [True] * len(current)
+
+        for results in itertools.product(range(3), repeat=len(home_ids)):
+            final = list(current)
+
+            for home, away, result in zip(home_ids, away_ids, results):
+                final[home] += points[result]
+                final[away] += points[2 - result]
+
+            for team_id, total in enumerate(final):
+                can[team_id] |= total == max(final)
+                always[team_id] &= total == max(final)
+
+        return can, always
+
+    def play(self, config):
+        league = ss.League(config)
+
+        for i, rating in enumerate((30, 25, 20, 5, 0)):
+            league.add_team_to_state(str(i), rating, 10)
+
+        league.round_robin_schedule(5)
+        league.init_league()
+        league.seed(2)
+
+        # Brute force is only quick enough for the last few weeks
+        league.simulate_week()
+        league.simulate_week()
+
+        while league.current_week <= len(league.state['schedule']) + 1:
+            yield league, league.clinch_status(), self.brute_force(league)
+
+            if league.current_week > len(league.state['schedule']):
+                break
+
+            league.simulate_week()
+
+    def test_exact(self):
+        # With a tie worth half a win the flow is exact
+        for league, statuses, (can, always) in self.play({'POINTS_ON_WIN': 2}):
+            self.assertTrue(league.state['clinch'].exact)
+
+            for team_id, status in enumerate(statuses):
+                self.assertEqual(status is ss.ClinchStatus.CLINCHED,
+                    always[team_id])
+                self.assertEqual(status is ss.ClinchStatus.ELIMINATED,
+                    not can[team_id])
+
+    def test_three_points(self):
+        # Under 3-1-0 an eliminated team may show as ALIVE, but never the
+        # other way round
+        for league, statuses, (can, always) in self.play(None):
+            self.assertFalse(league.state['clinch'].exact)
+
+            for team_id, status in enumerate(statuses):
+                self.assertEqual(status is ss.ClinchStatus.CLINCHED,
+                    always[team_id])
+
+                if status is ss.ClinchStatus.ELIMINATED:
+                    self.assertFalse(can[team_id])
+
+    def test_incremental(self):
+        league = ss.League()
+
+        for i in range(8):
+            league.add_team_to_state(str(i), 10 * i, 10)
+
+        league.round_robin_schedule(8)
+        league.init_league()
+        league.seed(3)
+
+        self.assertEqual(set(league.clinch_status()), {ss.ClinchStatus.ALIVE})
+        index = league.state['clinch']
+
+        league.simulate_season()
+
+        # The index was kept and brought up to date after every week
+        self.assertIs(league.state['clinch'], index)
+        self.assertEqual(index.week, 8)
+
+        points = league.calc_all_points()
+        self.assertEqual(league.clinch_status(), [ss.ClinchStatus.CLINCHED
+            if total == points.max() else ss.ClinchStatus.ELIMINATED
+            for total in points])
+
+    def test_swiss(self):
+        league = ss.League()
+
+        for i in range(9):
+            league.add_team_to_state(str(i), 10 * i, 10)
+
+        league.swiss_schedule(9)
+        league.init_league()
+        league.seed(5)
+
+        # Rounds that aren't paired yet have games in them- nobody has
+        # clinched just because they can't be listed
+        self.assertRaises(ss_err.ValidationError, league.clinch_status)
+        league.simulate_week()
+        self.assertRaises(ss_err.ValidationError, league.clinch_status)
+        self.assertIsNone(league.state['clinch'])
+
+        league.simulate_season()
+        points = league.calc_all_points()
+        self.assertEqual(league.clinch_status(), [ss.ClinchStatus.CLINCHED
+            if total == points.max() else ss.ClinchStatus.ELIMINATED
+            for total in points])
+
+        # An index built for a schedule that was known is dropped, not
+        # carried into one that isn't
+        league.init_league()
+        league.round_robin_schedule(9)
+        league.clinch_status()
+        league.swiss_schedule(9)
+        league.simulate_week()
+        self.assertIsNone(league.state['clinch'])
+
+    def test_max_flow(self):
+        edges = [(0, 2, 3), (0, 3, 2), (2, 3, 1), (2, 1, 2), (3, 1, 3)]
+
+        self.assertEqual(ss_clinch.max_flow(4, edges, 0, 1), 5)
+        self.assertEqual(ss_clinch.max_flow(4, edges, 0, 1,
+            [2, 0, 0, 2, 0]), 5)
+
+    def test_points_config(self):
+        self.assertRaises(ValueError, ss_clinch.points_config,
+            {'POINTS_ON_WIN': 1, 'POINTS_ON_TIE': 2, 'POINTS_ON_LOSS': 0})
+        self.assertRaises(ValueError, ss_clinch.points_config,
+            {'POINTS_ON_WIN': 1.5, 'POINTS_ON_TIE': 1, 'POINTS_ON_LOSS': 0})
+
+class TestDoubleRoundRobin(unittest.TestCase):
+    def test_legs(self):
+        sched = schedules.DoubleRoundRobinSchedule(7)
+        single = schedules.RoundRobinSchedule(7)
+
+        self.assertEqual(len(sched), 14)
+        schedules.validate_round_robin({week: sched[week] for week in
+            range(1, 8)}, 7)
+
+        # The second leg is the first with home and away swapped
+        for week in single:
+            self.assertEqual(sched[week], single[week])
+            self.assertEqual(sched[week + 7], tuple((away, home)
+                for home, away in single[week]))
+
+            home, away = sched.arrays(week + 7)
+            self.assertEqual(list(zip(home.tolist(), away.tolist())),
+                [m for m in sched[week + 7] if 'BYE' not in m])
+
+            for team in range(7):
+                self.assertEqual(sched.opponent(team, week + 7),
+                    single.opponent(team, week))
+
+    def test_season(self):
+        league = ss.League()
+
+        for i in range(4):
+            league.add_team_to_state(str(i), 10 * i, 10)
+
+        league.schedule(type=ss.ScheduleType.DOUBLE_ROUND_ROBIN)
+        league.init_league()
+        league.seed(1)
+        league.simulate_season()
+
+        games = league.game_log.column('home').tolist()
+        self.assertEqual(len(games), 12)
+        self.assertEqual(sorted(games), [0, 0, 0, 1, 1, 1, 2, 2, 2, 3, 3, 3])
+
+class TestKnockout(unittest.TestCase):
+    def make_league(self, num_teams=6):
+        league = ss.League()
+
+        for i in range(num_teams):
+            league.add_team_to_state(str(i), 30 - 5 * i, 10)
+
+        league.schedule(type=ss.ScheduleType.SINGLE_ELIMINATION)
+        league.init_league()
+        league.seed(4)
+
+        return league
+
+    def test_seeding(self):
+        # 1 plays 8, and 1 and 2 can only meet in the final
+        self.assertEqual(schedules.KnockoutSchedule(8)[1],
+            ((0, 7), (3, 4), (1, 6), (2, 5)))
+
+        # Byes go to the top seeds, and seeds can be any order of the teams
+        sched = schedules.KnockoutSchedule(6, seeds=[5, 4, 3, 2, 1, 0])
+        self.assertEqual(sched[1], ((2, 1), (3, 0), (5, 'BYE'), (4, 'BYE')))
+        self.assertEqual(sched.opponent(5, 1), 'BYE')
+        self.assertIsNone(sched.opponent(5, 2))
+        self.assertEqual(sched[2], ())
+
+        with self.assertRaises(ValueError):
+            schedules.KnockoutSchedule(3, seeds=[0, 0, 1])
+
+    def test_season(self):
+        league = self.make_league()
+        sched = league.state['schedule']
+        league.simulate_season(batch=True)
+
+        # Every team but the champion loses exactly once
+        self.assertEqual(len(league.game_log), 5)
+        self.assertEqual(sched.knocked_out().tolist().count(False), 1)
+        self.assertFalse(sched.knocked_out()[sched.champion])
+        self.assertEqual(sched.won()[sched.champion], 3)
+
+        # The better seed is always at home
+        log = league.game_log
+        self.assertTrue(np.all(sched.seed[log.column('home')]
+            < sched.seed[log.column('away')]))
+
+    def test_tie_goes_to_home(self):
+        league = self.make_league(4)
+        league.simulate_week(fixed={(0, 3): (2, 2), (1, 2): (0, 1)})
+
+        self.assertEqual(league.state['schedule'][2], ((0, 2),))
+
+    def test_saves(self):
+        league = self.make_league()
+        league.simulate_week()
+        sched = league.state['schedule']
+
+        for name in ('testing_ko.ssb', 'testing_ko.ssf'):
+            try:
+                ss_io.save_state(league.state, name)
+                loaded = ss_io.load_state(name)['schedule']
+            finally:
+                os.remove(name)
+
+            self.assertIsInstance(loaded, schedules.KnockoutSchedule)
+            self.assertEqual(loaded, sched)
+            self.assertEqual(loaded[2], sched[2])
+
+    def test_journal_replay(self):
+        league = self.make_league()
+        league.start_journal('testing_ko.ssf')
+
+        try:
+            league.simulate_week()
+            league.simulate_week()
+            loaded = ss_io.load_state('testing_ko.ssf')['schedule']
+        finally:
+            league.stop_journal()
+
+            for name in ('testing_ko.ssf', 'testing_ko.ssj'):
+                if os.path.isfile(name):
+                    os.remove(name)
+
+        self.assertEqual(loaded, league.state['schedule'])
+
+    def test_snapshot_forks(self):
+        league = self.make_league(4)
+        snapshot = league.snapshot()
+
+        first = ss.League.from_snapshot(snapshot)
+        second = ss.League.from_snapshot(snapshot)
+        first.simulate_week(fixed={(0, 3): (1, 0), (1, 2): (1, 0)})
+        second.simulate_week(fixed={(0, 3): (0, 1), (1, 2): (0, 1)})
+
+        self.assertEqual(first.state['schedule'][2], ((0, 1),))
+        self.assertEqual(second.state['schedule'][2], ((2, 3),))
+        self.assertEqual(league.state['schedule'][2], ())
+
+class TestBracketOdds(unittest.TestCase):
+    def setUp(self):
+        self.league = ss.League()
+
+        for i, (off, dfn) in enumerate(((30, 5), (25, 20), (20, 10), (15, 30),
+            (10, 0), (5, 15))):
+            self.league.add_team_to_state(str(i), off, dfn)
+
+        self.league.schedule(type=ss.ScheduleType.SINGLE_ELIMINATION)
+        self.league.init_league()
+        self.league.seed(6)
+
+    def brute_force(self, sched, week=None, probability=1.0, reach=None):
+        # Tries every result of every game left, weighting each outcome by
+        # its exact odds
+        if week is None:
+            week = sched.played() + 1
+            reach = np.zeros((sched.num_teams, sched.rounds + 1))
+
+        if week > sched.rounds:
+            won = sched.won()
+
+            for rounds in range(sched.rounds + 1):
+                reach[:, rounds] += probability * (won >= rounds)
+
+            return reach
+
+        home, away = sched.arrays(week)
+        home_win, tie, _ = ss_odds.game_outcomes(self.league.teams, home, away)
+
+        for results in itertools.product((True, False), repeat=len(home)):
+            results = np.array(results, dtype=bool)
+            branch = sched.branch()
+            branch.record(week, {'home': home, 'away': away,
+                'home_score': results.astype(int),
+                'away_score': (~results).astype(int)})
+
+            self.brute_force(branch, week + 1, probability * np.prod(
+                np.where(results, home_win + tie, 1 - home_win - tie)), reach)
+
+        return reach
+
+    def test_matches_brute_force(self):
+        sched = self.league.state['schedule']
+
+        while True:
+            result = ss_bracket.bracket_odds(self.league.teams, sched,
+                self.league.config)
+
+            self.assertTrue(result['exact'])
+            np.testing.assert_allclose(result['reach'], self.brute_force(sched),
+                atol=1e-12)
+
+            if sched.champion is not None:
+                break
+
+            self.league.simulate_week()
+
+        self.assertEqual(result['champion'][sched.champion], 1.0)
+
+    def test_monte_carlo_fallback(self):
+        # A simulator without exact odds gets the bracket played out
+        exact = ss_sim.get()
+        ss_sim.register('test_no_outcomes', exact.scalar, exact.batch)
+
+        try:
+            result = ss_bracket.bracket_odds(self.league.teams,
+                self.league.state['schedule'], {'SIMULATOR': 'test_no_outcomes'},
+                tournaments=20000, seed=1)
+        finally:
+            del ss_sim.registry['test_no_outcomes']
+
+        expected = ss_bracket.bracket_odds(self.league.teams,
+            self.league.state['schedule'], self.league.config)
+
+        self.assertFalse(result['exact'])
+        np.testing.assert_allclose(result['reach'], expected['reach'],
+            atol=0.02)
+
+    def test_large_bracket(self):
+        league = ss.League()
+        ratings = np.random.default_rng(2).integers(0, 100, size=(2, 1024))
+        league.add_teams_to_state([str(i) for i in range(1024)], *ratings)
+        sched = league.schedule(type=ss.ScheduleType.SINGLE_ELIMINATION)
+
+        result = ss_bracket.bracket_odds(league.teams, sched, league.config)
+
+        # 2 ** (10 - r) teams get through r rounds
+        np.testing.assert_allclose(result['reach'].sum(axis=0),
+            [2 ** (10 - r) for r in range(11)])
+
+        with self.assertRaises(TypeError):
+            ss_bracket.bracket_odds(league.teams, ss.build_round_robin(4),
+                league.config)
+
+class TestSwiss(unittest.TestCase):
+    def make_league(self, num_teams=7):
+        league = ss.League()
+
+        for i in range(num_teams):
+            league.add_team_to_state(str(i), 5 * i, 10)
+
+        league.schedule(type=ss.ScheduleType.SWISS)
+        league.init_league()
+        league.seed(8)
+
+        return league
+
+    def assert_valid(self, sched, num_teams):
+        # Everyone plays at most once a week, no pair meets twice and nobody
+        # gets two byes
+        met = set()
+        byes = []
+
+        for week in sched.weeks:
+            home, away = sched.arrays(week)
+            playing = np.concatenate((home, away)).tolist()
+            self.assertEqual(len(set(playing)), len(playing))
+            self.assertEqual(len(playing), num_teams - num_teams % 2)
+
+            pairs = set(map(frozenset, zip(home.tolist(), away.tolist())))
+            self.assertFalse(met & pairs)
+            met |= pairs
+            byes.extend(team for team, other in sched[week] if other == 'BYE')
+
+        self.assertEqual(len(set(byes)), len(byes))
+
+    def test_pairs_from_standings(self):
+        sched = schedules.SwissSchedule(8)
+        self.assertEqual(len(sched), 3)
+        self.assertEqual(sched[1], ())
+
+        sched.pair(1, range(8))
+        self.assertEqual(sched[1], ((0, 1), (2, 3), (4, 5), (6, 7)))
+
+        # Top plays second- level on home games, the higher placed hosts
+        sched.pair(2, [0, 2, 4, 6, 1, 3, 5, 7])
+        self.assertEqual(sched[2], ((0, 2), (4, 6), (1, 3), (5, 7)))
+        self.assertEqual(sched.opponent(5, 2), 7)
+
+        # Every adjacent pair here has met, so they all get split up
+        sched.pair(3, range(8))
+        self.assert_valid(sched, 8)
+
+        with self.assertRaises(ValueError):
+            schedules.SwissSchedule(8).pair(2, range(8))
+
+    def test_season(self):
+        league = self.make_league()
+        league.simulate_week()
+
+        # Week 2 isn't paired until it's played, and then from the standings
+        sched = league.state['schedule']
+        self.assertEqual(sched[2], ())
+        self.assertEqual(sched[1][-1], (6, 'BYE'))
+
+        league.simulate_season(batch=True)
+        self.assertEqual(len(league.game_log), 9)
+        self.assert_valid(sched, 7)
+
+    def test_large_field(self):
+        num_teams = 20001
+        sched = schedules.SwissSchedule(num_teams)
+        points = np.zeros(num_teams, dtype=np.int64)
+        rng = np.random.default_rng(3)
+
+        for week in sched:
+            sched.pair(week, np.lexsort((np.arange(num_teams), -points)))
+            home, away = sched.arrays(week)
+            home_won = rng.random(len(home)) < 0.5
+            points[np.where(home_won, home, away)] += 1
+
+        self.assertEqual(len(sched.weeks), 15)
+        self.assert_valid(sched, num_teams)
+
+    def test_saves(self):
+        league = self.make_league()
+        league.simulate_week()
+        league.simulate_week()
+
+        for name in ('testing_swiss.ssb', 'testing_swiss.ssf'):
+            try:
+                ss_io.save_state(league.state, name)
+                loaded = ss_io.load_state(name)['schedule']
+            finally:
+                os.remove(name)
+
+            self.assertIsInstance(loaded, schedules.SwissSchedule)
+            self.assertEqual(loaded, league.state['schedule'])
+            np.testing.assert_array_equal(loaded.had_bye,
+                league.state['schedule'].had_bye)
+
+    def test_journal_replay(self):
+        league = self.make_league()
+        league.start_journal('testing_swiss.ssf')
+
+        try:
+            league.simulate_week()
+            league.simulate_week()
+            loaded = ss_io.load_state('testing_swiss.ssf')['schedule']
+        finally:
+            league.stop_journal()
+
+            for name in ('testing_swiss.ssf', 'testing_swiss.ssj'):
+                if os.path.isfile(name):
+                    os.remove(name)
+
+        self.assertEqual(loaded, league.state['schedule'])
+
+    def test_snapshot_forks(self):
+        league = self.make_league(4)
+        league.simulate_week(fixed={(0, 1): (1, 0), (2, 3): (1, 0)})
+        snapshot = league.snapshot()
+
+        fork = ss.League.from_snapshot(snapshot, branch=1)
+        fork.simulate_week()
+
+        self.assertEqual(fork.state['schedule'][2], ((0, 2), (1, 3)))
+        self.assertEqual(league.state['schedule'][2], ())
+
 class TestUtilities(unittest.TestCase):
     def test_rotation(self):
         l = [1, 2, 3]
@@ -1,15 +1,289 @@
+from collections.abc import MutableMapping, Sequence
+
+import numpy as np
+
+# Every numeric column in a TeamStore- ratings and the W/L/T record
+COLUMNS = ('offense', 'defense', 'wins', 'losses', 'ties')
+
+# Maps the keys of Team.results onto the store columns holding them
+RESULT_COLUMNS = {
+	'win': 'wins',
+	'loss': 'losses',
+	'tie': 'ties',
+}
+
+class TeamStore(Sequence):
+	'''
+	Struct-of-arrays storage for a league's teams. Each column is an array
+	indexed by team id, and indexing the store gives a Team view of one row,
+	so the store can be used anywhere a list of teams is expected
+	'''
+	def __init__(self, capacity=16):
+		self.size = 0
+		self.names = []
+		self._columns = {}
+
+		# Bumped whenever the names may have changed (see writable()), so
+		# anything worked out from them knows when to look again
+		self.names_version = 0
+
+		# Columns (and 'names') shared with other stores, e.g. the branches of
+		# a snapshot. They are copied the first time this store writes to
+		# them, see writable()
+		self._shared = set()
+
+		for column in COLUMNS:
+			self._columns[column] = np.zeros(max(capacity, 1), dtype=np.int32)
+
+	@classmethod
+	def from_columns(cls, names, columns, shared=False):
+		# Builds a store around existing column arrays (e.g. memory-mapped from
+		# a save) without copying them. They are only copied if the store has
+		# to grow- or, if shared is set, the first time they are written to,
+		# in which case names is shared too rather than copied
+		store = cls.__new__(cls)
+		store.size = len(names)
+		store.names = names if shared else list(names)
+		store._columns = {column: columns[column] for column in COLUMNS}
+		store._shared = set(COLUMNS) | {'names'} if shared else set()
+		store.names_version = 0
+
+		return store
+
+	def __len__(self):
+		return self.size
+
+	def __getitem__(self, team_id):
+		if isinstance(team_id, slice):
+			return [self[i] for i in range(*team_id.indices(self.size))]
+
+		if team_id < 0:
+			team_id += self.size
+
+		if not 0 <= team_id < self.size:
+			raise IndexError('team id %d out of range' % team_id)
+
+		return Team.view(self, team_id)
+
+	def __eq__(self, other):
+		# Compares team by team, so a store equals a list of equal teams
+		if not isinstance(other, (TeamStore, list, tuple)):
+			return NotImplemented
+
+		return len(self) == len(other) \
+			and all(mine == theirs for mine, theirs in zip(self, other))
+
+	def column(self, name):
+		# The live rows of a column. This is a view, so writes go to the store-
+		# shared columns are read-only, use writable() to write to them
+		return self._columns[name][:self.size]
+
+	def writable(self, name):
+		# The whole array behind a column (or the names list), copied first if
+		# it is shared with another store
+		if name in self._shared:
+			self._shared.discard(name)
+
+			if name == 'names':
+				self.names = list(self.names)
+			else:
+				self._columns[name] = np.array(self._columns[name])
+
+		if name == 'names':
+			self.names_version += 1
+			return self.names
+
+		return self._columns[name]
+
+	def frozen(self):
+		# Read-only copies of the live rows of every column, for stores to
+		# share with from_columns(..., shared=True)
+		columns = {}
+
+		for column in COLUMNS:
+			columns[column] = np.array(self.column(column))
+			columns[column].setflags(write=False)
+
+		return columns
+
+	@property
+	def offense(self):
+		return self.column('offense')
+
+	@property
+	def defense(self):
+		return self.column('defense')
+
+	@property
+	def wins(self):
+		return self.column('wins')
+
+	@property
+	def losses(self):
+		return self.column('losses')
+
+	@property
+	def ties(self):
+		return self.column('ties')
+
+	def reserve(self, capacity):
+		# Makes sure there is room for capacity teams without reallocating
+		if capacity <= len(self._columns['wins']):
+			return
+
+		capacity = max(capacity, 1)
+
+		for column, values in self._columns.items():
+			grown = np.zeros(capacity, dtype=values.dtype)
+			grown[:self.size] = values[:self.size]
+			self._columns[column] = grown
+
+		self._shared &= {'names'}
+
+	def add(self, name, offense=0, defense=0, wins=0, losses=0, tie=0):
+		# Appends a team and returns a view of it
+		if self.size == len(self._columns['wins']):
+			self.reserve(max(2 * self.size, 1))
+
+		team_id = self.size
+		row = (offense, defense, wins, losses, tie)
+
+		for column, value in zip(COLUMNS, row):
+			self.writable(column)[team_id] = int(value)
+
+		self.writable('names').append(name)
+		self.size += 1
+
+		return Team.view(self, team_id)
+
+	def extend(self, names, offense, defense):
+		# Appends many new teams at once, ratings given as arrays (or lists)
+		# in the same order as names
+		count = len(names)
+
+		self.reserve(max(self.size + count, 2 * self.size))
+
+		start = self.size
+		end = start + count
+
+		self.writable('offense')[start:end] = offense
+		self.writable('defense')[start:end] = defense
+
+		for column in RESULT_COLUMNS.values():
+			self.writable(column)[start:end] = 0
+
+		self.writable('names').extend(names)
+		self.size = end
+
+	def append(self, team):
+		# Copies a team (possibly from another store) into this one
+		return self.add(team.name, team.offense, team.defense, team.wins,
+			team.losses, team.ties)
+
+	def points(self, win, tie, loss):
+		# Points for every team at once
+		return self.wins * win + self.ties * tie + self.losses * loss
+
+class Results(MutableMapping):
+	# Dictionary-like view of a team's W/L/T record, keyed 'win', 'loss' and
+	# 'tie' as the old per-team results dict was
+	__slots__ = ('team',)
+
+	def __init__(self, team):
+		self.team = team
+
+	def __getitem__(self, key):
+		return int(self.team.store._columns[RESULT_COLUMNS[key]][self.team.id])
+
+	def __setitem__(self, key, value):
+		self.team.store.writable(RESULT_COLUMNS[key])[self.team.id] = value
+
+	def __delitem__(self, key):
+		raise TypeError('team results cannot be deleted')
+
+	def __iter__(self):
+		return iter(RESULT_COLUMNS)
+
+	def __len__(self):
+		return len(RESULT_COLUMNS)
+
+	def __repr__(self):
+		return repr(dict(self))
+
 class Team:
+	# A team is just a (store, id) pair- everything else lives in the store.
+	# Creating a Team directly gives it a store of its own
+	__slots__ = ('store', 'id')
+
 	def __init__(self, name, offense=0, defense=0, wins=0, losses=0, tie=0):
-		self.name = name 
-		self.offense = offense
-		self.defense = defense
+		store = TeamStore(capacity=1)
+		store.add(name, offense, defense, wins, losses, tie)
+
+		self.store = store
+		self.id = 0
+
+	@classmethod
+	def view(cls, store, team_id):
+		team = cls.__new__(cls)
+		team.store = store
+		team.id = team_id
+
+		return team
+
+	@property
+	def name(self):
+		return self.store.names[self.id]
+
+	@name.setter
+	def name(self, name):
+		self.store.writable('names')[self.id] = name
+
+	@property
+	def offense(self):
+		return int(self.store._columns['offense'][self.id])
 
-		self.results = {
-			'win': wins,
-			'loss': losses,
-			'tie': tie,
-		}
+	@offense.setter
+	def offense(self, value):
+		self.store.writable('offense')[self.id] = int(value)
+
+	@property
+	def defense(self):
+		return int(self.store._columns['defense'][self.id])
+
+	@defense.setter
+	def defense(self, value):
+		self.store.writable('defense')[self.id] = int(value)
+
+	@property
+	def wins(self):
+		return int(self.store._columns['wins'][self.id])
+
+	@property
+	def losses(self):
+		return int(self.store._columns['losses'][self.id])
+
+	@property
+	def ties(self):
+		return int(self.store._columns['ties'][self.id])
+
+	def record(self, column, count=1):
+		# Adds count to one of the store's result columns for this team
+		self.store.writable(column)[self.id] += count
+
+	@property
+	def results(self):
+		return Results(self)
 
 	def __eq__(self, other):
 		# Implement deep equality check mainly for testing loading/storing
-		return vars(self) == vars(other)
+		if not isinstance(other, Team):
+			return NotImplemented
+
+		return (self.name, self.offense, self.defense, self.wins, self.losses,
+			self.ties) == (other.name, other.offense, other.defense, other.wins,
+			other.losses, other.ties)
+
+	def __repr__(self):
+		return 'Team(%r, offense=%d, defense=%d, wins=%d, losses=%d, tie=%d)' % (
+			self.name, self.offense, self.defense, self.wins, self.losses,
+			self.ties)